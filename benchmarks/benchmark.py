@@ -0,0 +1,375 @@
+"""Benchmarks for building, serializing, dumping, filtering, painting and editing.
+
+Synthetic documents of several shapes and sizes are put through each
+operation. The best time out of a number of repeats and the peak Python
+memory of one extra run are compared against a stored baseline. The run
+fails if an operation got slower or bigger than the threshold allows.
+
+Run it from the root of the repository:
+
+    python benchmarks/benchmark.py
+    python benchmarks/benchmark.py --sizes 1000 --operations build,paint
+    python benchmarks/benchmark.py --update
+
+Timings depend on the machine, record the baseline with --update on the
+machine the benchmarks are compared on.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import timeit
+from collections import OrderedDict
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from Qt import QtCore, QtGui, QtWidgets
+
+from qt_json_view import delegate, model, pathcache
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SIZES = (1000, 10000)
+THRESHOLD = 2.0
+MEMORY_THRESHOLD = 1.5
+#: Differences below these are noise and never count as a regression
+MIN_TIME = 0.02
+MIN_MEMORY = 256 * 1024
+#: Rows painted and edited per run, both cost the same for every row
+PAINT_ROWS = 1000
+EDIT_ROWS = 1000
+
+
+# Documents, the size is the rough number of values in the document
+
+
+def wide(size):
+    """A single dict with many keys."""
+    data = OrderedDict()
+    for i in range(size):
+        if i % 3 == 0:
+            data['key_%d' % i] = i
+        elif i % 3 == 1:
+            data['key_%d' % i] = i * 0.5
+        else:
+            data['key_%d' % i] = i % 2 == 0
+    return data
+
+
+def deep(size, depth=20):
+    """A list of nested dicts, each level holds a few values and a child."""
+    chains = []
+    for i in range(max(1, size // (depth * 3))):
+        chain = {'level': depth, 'name': 'leaf %d' % i}
+        for level in range(depth - 1, 0, -1):
+            chain = {'level': level, 'enabled': level % 2 == 0, 'child': chain}
+        chains.append(chain)
+    return chains
+
+
+def long_list(size):
+    """A flat list of numbers."""
+    return [i if i % 2 else i * 0.25 for i in range(size)]
+
+
+def strings(size):
+    """Records with long strings."""
+    text = 'The quick brown fox jumps over the lazy dog. ' * 4
+    return [
+        {'title': 'Record number %d' % i, 'text': '%d %s' % (i, text)}
+        for i in range(size // 2)]
+
+
+def custom(size):
+    """Records of the custom DataTypes."""
+    return [
+        {
+            'range': {'start': 0, 'end': i, 'step': 1},
+            'choice': {'value': 'A', 'choices': ['A', 'B', 'C']},
+            'url': 'https://example.com/%d' % i,
+            'path': '/some/file/path/%d.json' % i,
+        } for i in range(size // 4)]
+
+
+DOCUMENTS = OrderedDict([
+    ('wide', wide),
+    ('deep', deep),
+    ('long_list', long_list),
+    ('strings', strings),
+    ('custom', custom),
+])
+
+
+# Operations, each returns the function that is timed
+
+
+def _model(data, editable=False):
+    json_model = model.JsonModel(editable_keys=editable, editable_values=editable)
+    json_model.init(data, editable_keys=editable, editable_values=editable)
+    return json_model
+
+
+def _value_indexes(json_model, limit=None):
+    """The indexes of the leaf values in the order they are shown."""
+    indexes = []
+    parents = [QtCore.QModelIndex()]
+    while parents and (limit is None or len(indexes) < limit):
+        parent = parents.pop()
+        for row in range(json_model.rowCount(parent) - 1, -1, -1):
+            key_index = json_model.index(row, 0, parent)
+            if json_model.hasChildren(key_index):
+                parents.append(key_index)
+            elif key_index.flags() & QtCore.Qt.ItemIsEnabled:
+                indexes.append(json_model.index(row, 1, parent))
+    return indexes[:limit]
+
+
+def build(data):
+    json_model = model.JsonModel()
+    return lambda: json_model.init(data)
+
+
+def serialize(data):
+    return _model(data).serialize
+
+
+def dump(data):
+    json_model = _model(data)
+    return lambda: json_model.dump(io.StringIO())
+
+
+def filter_(data):
+    json_model = _model(data)
+    proxy = model.JsonSortFilterProxyModel()
+    proxy.setSourceModel(json_model)
+    proxy.setFilterKeyColumn(1)
+
+    # The source argument keeps the model alive, the proxy does not own it
+    def run(source=json_model):
+        proxy.setFilterFixedString('1')
+        parents = [QtCore.QModelIndex()]
+        while parents:
+            parent = parents.pop()
+            for row in range(proxy.rowCount(parent)):
+                parents.append(proxy.index(row, 0, parent))
+    return run
+
+
+def paint(data):
+    json_model = _model(data)
+    json_delegate = delegate.JsonDelegate()
+    indexes = _value_indexes(json_model, PAINT_ROWS)
+    image = QtGui.QImage(300, 20, QtGui.QImage.Format_ARGB32_Premultiplied)
+
+    # The source argument keeps the model alive, the indexes do not own it
+    def run(source=json_model):
+        painter = QtGui.QPainter(image)
+        try:
+            for index in indexes:
+                option = QtWidgets.QStyleOptionViewItem()
+                option.rect = QtCore.QRect(0, 0, 300, 20)
+                option.state = QtWidgets.QStyle.State_Enabled
+                json_delegate.paint(painter, option, index)
+        finally:
+            painter.end()
+    return run
+
+
+def edit(data):
+    json_model = _model(data, editable=True)
+    indexes = _value_indexes(json_model, EDIT_ROWS)
+
+    def run():
+        for index in indexes:
+            value = index.data(QtCore.Qt.DisplayRole)
+            if isinstance(value, bool):
+                value = not value
+            elif isinstance(value, (int, float)):
+                value += 1
+            else:
+                value = '%s!' % value
+            json_model.setData(index, value, QtCore.Qt.DisplayRole)
+            json_model.write_back(index)
+    return run
+
+
+OPERATIONS = OrderedDict([
+    ('build', build),
+    ('serialize', serialize),
+    ('dump', dump),
+    ('filter', filter_),
+    ('paint', paint),
+    ('edit', edit),
+])
+
+
+def measure(operation, data, repeat=3):
+    """The best time in seconds and the peak Python memory in bytes.
+
+    The memory is measured in an extra run, tracing the allocations would
+    distort the timings. It is None if tracemalloc is not available.
+    """
+    best = None
+    for _ in range(repeat):
+        run = operation(data)
+        _settle()
+        start = timeit.default_timer()
+        run()
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if tracemalloc is not None:
+        run = operation(data)
+        _settle()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def _settle():
+    """Finish the pending background work so each run starts the same."""
+    pathcache.path_cache().pool.waitForDone()
+    QtWidgets.QApplication.processEvents()
+    gc.collect()
+
+
+def run_benchmarks(sizes=SIZES, documents=None, operations=None, repeat=3,
+                   report=None):
+    """Measure the operations on the documents of the given sizes.
+
+    Returns the {'operation/document/size': {'time': ..., 'memory': ...}}
+    results, report is called with the name and the result of each.
+    """
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    # Warm up, the first paint loads the fonts and the style
+    for operation in operations or OPERATIONS:
+        OPERATIONS[operation](custom(8))()
+    app.processEvents()
+    results = OrderedDict()
+    for size in sizes:
+        for document in documents or DOCUMENTS:
+            data = DOCUMENTS[document](size)
+            for operation in operations or OPERATIONS:
+                name = '%s/%s/%d' % (operation, document, size)
+                elapsed, peak = measure(OPERATIONS[operation], data, repeat)
+                results[name] = {'time': round(elapsed, 6), 'memory': peak}
+                if report is not None:
+                    report(name, results[name])
+    return results
+
+
+def compare(results, baseline, threshold=THRESHOLD,
+            memory_threshold=MEMORY_THRESHOLD):
+    """Describe the results exceeding their baseline by the thresholds."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        limits = (
+            ('time', threshold, MIN_TIME),
+            ('memory', memory_threshold, MIN_MEMORY))
+        for measure_, factor, minimum in limits:
+            value, base = result.get(measure_), reference.get(measure_)
+            if value is None or base is None:
+                continue
+            if value > base * factor and value - base > minimum:
+                regressions.append('%s: %s %s exceeds the baseline %s by %.2fx' % (
+                    name, measure_, _format(measure_, value),
+                    _format(measure_, base), value / float(base or 1)))
+    return regressions
+
+
+def load_baseline(path=BASELINE):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results, path=BASELINE):
+    """Merge the results into the baseline stored at the path."""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    with open(path, 'w') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def _format(measure_, value):
+    if value is None:
+        return '-'
+    if measure_ == 'time':
+        return '%.1fms' % (value * 1000)
+    return '%.0fKiB' % (value / 1024.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--sizes', default=','.join(str(size) for size in SIZES),
+        help='Comma separated document sizes, default: %(default)s')
+    parser.add_argument(
+        '--documents', default=','.join(DOCUMENTS),
+        help='Comma separated documents, default: %(default)s')
+    parser.add_argument(
+        '--operations', default=','.join(OPERATIONS),
+        help='Comma separated operations, default: %(default)s')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument(
+        '--threshold', type=float, default=THRESHOLD,
+        help='Allowed factor over the baseline time, default: %(default)s')
+    parser.add_argument(
+        '--memory-threshold', type=float, default=MEMORY_THRESHOLD,
+        help='Allowed factor over the baseline memory, default: %(default)s')
+    parser.add_argument(
+        '--update', action='store_true',
+        help='Store the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+
+    def report(name, result):
+        reference = baseline.get(name, {})
+        print('%-28s %10s %10s %12s %12s' % (
+            name,
+            _format('time', result['time']),
+            _format('time', reference.get('time')),
+            _format('memory', result['memory']),
+            _format('memory', reference.get('memory'))))
+        sys.stdout.flush()
+
+    print('%-28s %10s %10s %12s %12s' % (
+        'benchmark', 'time', 'baseline', 'memory', 'baseline'))
+    results = run_benchmarks(
+        sizes=[int(size) for size in args.sizes.split(',')],
+        documents=args.documents.split(','),
+        operations=args.operations.split(','),
+        repeat=args.repeat,
+        report=report)
+
+    if args.update:
+        save_baseline(results, args.baseline)
+        print('Stored the baseline in %s' % args.baseline)
+        return 0
+    regressions = compare(
+        results, baseline, args.threshold, args.memory_threshold)
+    for regression in regressions:
+        print(regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
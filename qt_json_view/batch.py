@@ -0,0 +1,78 @@
+import threading
+
+import six
+from Qt import QtCore
+
+
+class JsonBatchUpdater(QtCore.QObject):
+    """Apply high-frequency value changes to a JsonModel once per frame.
+
+    Changes can be put from any thread. They are collected by key path,
+    only the latest value of a path is kept, and applied in the GUI thread
+    at most once per interval in milliseconds through JsonModel.set_values.
+    """
+
+    applied = QtCore.Signal(int)
+    queued = QtCore.Signal()
+
+    def __init__(self, model, interval=16, parent=None):
+        super(JsonBatchUpdater, self).__init__(parent or model)
+        self.model = model
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.flush)
+        # Emitted from other threads, the timer is started in the GUI thread
+        self.queued.connect(self._schedule)
+
+    @property
+    def interval(self):
+        return self._timer.interval()
+
+    @interval.setter
+    def interval(self, interval):
+        self._timer.setInterval(interval)
+
+    def put(self, path, value):
+        """Queue the value for the key path or JSON pointer."""
+        self.update(((path, value), ))
+
+    def update(self, changes):
+        """Queue a mapping or pairs of key paths or JSON pointers and values."""
+        if isinstance(changes, dict):
+            changes = changes.items()
+        with self._lock:
+            empty = not self._pending
+            for path, value in changes:
+                if not isinstance(path, six.string_types):
+                    path = tuple(path)
+                self._pending[path] = value
+            notify = empty and bool(self._pending)
+        if notify:
+            self.queued.emit()
+
+    def is_pending(self):
+        """Whether changes have been queued but not applied yet."""
+        with self._lock:
+            return bool(self._pending)
+
+    def flush(self):
+        """Apply the queued changes now, must be called in the GUI thread."""
+        self._timer.stop()
+        with self._lock:
+            changes, self._pending = self._pending, {}
+        if changes:
+            self.model.set_values(changes)
+            self.applied.emit(len(changes))
+
+    def clear(self):
+        """Discard the queued changes."""
+        self._timer.stop()
+        with self._lock:
+            self._pending = {}
+
+    def _schedule(self):
+        if not self._timer.isActive():
+            self._timer.start()
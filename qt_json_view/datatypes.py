@@ -1,3 +1,4 @@
+import array
 import os
 import re
 import webbrowser
@@ -7,8 +8,63 @@ from functools import partial
 import six
 from Qt import QtCore, QtGui, QtWidgets
 
+from qt_json_view import pathcache, profiling, table
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 TypeRole = QtCore.Qt.UserRole + 1
 SchemaRole = QtCore.Qt.UserRole + 2
+LazyRole = QtCore.Qt.UserRole + 3
+
+# Roles that only affect the presentation of an item, see DataType.role_data
+PRESENTATION_ROLES = (
+    QtCore.Qt.ForegroundRole,
+    QtCore.Qt.FontRole,
+    QtCore.Qt.DecorationRole,
+    QtCore.Qt.ToolTipRole
+)
+
+# Brushes, fonts and icons shared by all items, see brush, font and standard_icon
+_STYLES = {}
+
+
+def brush(color):
+    """A shared QBrush of the given color."""
+    key = ('brush', color)
+    resource = _STYLES.get(key)
+    if resource is None:
+        resource = _STYLES[key] = QtGui.QBrush(color)
+    return resource
+
+
+def font(underline=False, italic=False):
+    """A shared copy of the application font with the given attributes."""
+    key = ('font', underline, italic)
+    resource = _STYLES.get(key)
+    if resource is None:
+        resource = QtWidgets.QApplication.instance().font()
+        resource.setUnderline(underline)
+        resource.setItalic(italic)
+        _STYLES[key] = resource
+    return resource
+
+
+def standard_icon(pixmap):
+    """A shared standard icon of the application style."""
+    key = ('icon', pixmap)
+    resource = _STYLES.get(key)
+    if resource is None:
+        style = QtWidgets.QApplication.instance().style()
+        resource = _STYLES[key] = style.standardIcon(pixmap)
+    return resource
+
+
+def clear_styles():
+    """Forget the shared resources, e.g. after the application font changed."""
+    _STYLES.clear()
 
 
 class DataType(object):
@@ -20,6 +76,19 @@ class DataType(object):
     DEFAULT = None
     ITEM = QtGui.QStandardItem
 
+    # The Python types this DataType can match, None for any type.
+    # match_type only calls matches for data of one of these types.
+    TYPES = None
+
+    # Let the delegate cache the cells drawn by paint, see paint_key.
+    CACHE_PAINT = False
+
+    # Add the children on demand, also if the model is not lazy.
+    LAZY_CHILDREN = False
+
+    # The entries per bucket if the model has no bucket_size, see BucketType.
+    PAGE_SIZE = None
+
     def matches(self, data):
         """Logic to define whether the given data matches this type."""
         raise NotImplementedError
@@ -32,6 +101,33 @@ class DataType(object):
         """Implement if this data type has to add child items to itself."""
         pass
 
+    def append_child(self, model, key, value, parent, schema=None):
+        """Add the row of a single child entry to the parent item.
+
+        The schema is the entry of the parent, it is looked up by the path
+        of the parent if not given.
+        """
+        self.insert_child(model, parent.rowCount(), key, value, parent, schema)
+
+    def insert_child(self, model, row, key, value, parent, schema=None):
+        """Insert the row of a single child entry at the given row."""
+        raise NotImplementedError
+
+    def has_children(self, data):
+        """Return True if next would add child items for the given data."""
+        return False
+
+    def children(self, data):
+        """Return the (key, value) pairs of a container, None for leaves."""
+        return None
+
+    def defer(self, model, data, parent):
+        """Keep the data on the parent, the model adds the children on demand.
+
+        The data is wrapped in a tuple, Qt would store a copy of a list or dict.
+        """
+        parent.setData((data, ), LazyRole)
+
     def actions(self, index):
         """Re-implement to return custom QActions."""
         model = index.model()
@@ -51,6 +147,14 @@ class DataType(object):
         """Optionally re-implement for use by the delegate."""
         raise NotImplementedError
 
+    def paint_key(self, index):
+        """What paint draws for the index, for the paint cache of the delegate.
+
+        The delegate adds the style option, the foreground and the font of
+        the index. Re-implement if paint depends on any other data.
+        """
+        return repr(index.data(QtCore.Qt.DisplayRole)), int(index.flags())
+
     def createEditor(self, delegate, parent, option, index):
         """Optionally re-implement for use by the delegate."""
         raise NotImplementedError
@@ -62,7 +166,8 @@ class DataType(object):
             model = model.sourceModel()
         schema = index.data(SchemaRole)
         default = schema.get("default", self.__class__.DEFAULT)
-        model.itemFromIndex(index).setData(default, QtCore.Qt.DisplayRole)
+        model.setData(index, default, QtCore.Qt.DisplayRole)
+        model.write_back(index)
 
     def copy(self, index):
         """Put the given display value into the clipboard."""
@@ -79,7 +184,7 @@ class DataType(object):
             index = model.mapToSource(index)
             model = model.sourceModel()
         return_value = super(delegate.__class__, delegate).setModelData(editor, model, index)
-        model.data_object.update(model.serialize())
+        model.write_back(index)
         return return_value
 
     def serialize(self, model, item, data, parent):
@@ -97,34 +202,63 @@ class DataType(object):
         """Create an item for the key column for this data type."""
         item = QtGui.QStandardItem(key)
         item.setData(datatype, TypeRole)
-        item.setData(datatype.__class__.__name__, QtCore.Qt.ToolTipRole)
-        item.setData(
-            QtGui.QBrush(datatype.COLOR), QtCore.Qt.ForegroundRole)
-        item.setFlags(QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled)
-        if editable and model.editable_keys:
-            item.setFlags(item.flags() | QtCore.Qt.ItemIsEditable)
+        item.setFlags(datatype.key_flags(model, editable))
         return item
 
-    def value_item(self, value, model, key=None):
-        """Create an item for the value column for this data type."""
-        display_value = value
+    def value_item(self, value, model, key=None, schema=None):
+        """Create an item for the value column for this data type.
+
+        The schema entry of the value is not stored, the model looks it up
+        by the path of the item when the SchemaRole is requested.
+        """
         item = self.ITEM()
-        item.setData(display_value, QtCore.Qt.DisplayRole)
+        item.setData(self.display_value(value), QtCore.Qt.DisplayRole)
         item.setData(value, QtCore.Qt.UserRole)
         item.setData(self, TypeRole)
-        item.setData(QtGui.QBrush(self.COLOR), QtCore.Qt.ForegroundRole)
-
-        schema = model.current_schema.get(key, {})
-        item.setData(schema, SchemaRole)
-        item.setData(schema.get('tooltip', self.__class__.__name__),
-                     QtCore.Qt.ToolTipRole)
-        item.setFlags(QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled)
-        if model.editable_values and schema.get('editable', True):
-            item.setFlags(item.flags() | QtCore.Qt.ItemIsEditable)
-        else:
-            item.setData(QtGui.QBrush(self.INACTIVE_COLOR), QtCore.Qt.ForegroundRole)
+        item.setFlags(self.value_flags(model, schema or {}))
         return item
 
+    def display_value(self, value):
+        """The value shown in the value column."""
+        return value
+
+    def is_editable(self, model, schema):
+        """Whether the value can be edited according to model and schema."""
+        return bool(model.editable_values and schema.get('editable', True))
+
+    def key_flags(self, model, editable=True):
+        """Item flags of the key column."""
+        flags = QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+        if editable and model.editable_keys:
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def value_flags(self, model, schema):
+        """Item flags of the value column."""
+        flags = QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+        if self.is_editable(model, schema):
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def role_data(self, model, column, role, value, schema, index=None):
+        """Return the data for one of the PRESENTATION_ROLES.
+
+        The models call this whenever the view asks for one of the roles,
+        so the items do not have to store them. Return shared resources
+        from brush, font and standard_icon instead of creating new ones.
+        Data that is not known yet can be resolved in the background and
+        announced through dataChanged on the index.
+        """
+        if role == QtCore.Qt.ForegroundRole:
+            if column == 1 and not self.is_editable(model, schema):
+                return brush(self.INACTIVE_COLOR)
+            return brush(self.COLOR)
+        elif role == QtCore.Qt.ToolTipRole:
+            if column == 1:
+                return schema.get('tooltip', self.__class__.__name__)
+            return self.__class__.__name__
+        return None
+
     def clicked(self, parent, index, pos, rect):
         pass
 
@@ -140,13 +274,13 @@ class DataType(object):
 class NoneType(DataType):
     """None"""
 
+    TYPES = (type(None), )
+
     def matches(self, data):
         return data is None
 
-    def value_item(self, value, model, key=None):
-        item = super(NoneType, self).value_item(value, model, key)
-        item.setData('None', QtCore.Qt.DisplayRole)
-        return item
+    def display_value(self, value):
+        return 'None' if value is None else value
 
     def serialize(self, model, item, data, parent):
         value_item = parent.child(item.row(), 1)
@@ -164,6 +298,7 @@ class StrType(DataType):
     """Strings and unicodes"""
 
     DEFAULT = ""
+    TYPES = six.string_types
 
     def matches(self, data):
         return isinstance(data, six.string_types)
@@ -173,6 +308,7 @@ class IntType(DataType):
     """Integers"""
 
     DEFAULT = 0
+    TYPES = (int, )
 
     def matches(self, data):
         return isinstance(data, int) and not isinstance(data, bool)
@@ -182,6 +318,7 @@ class FloatType(DataType):
     """Floats"""
 
     DEFAULT = 0.0
+    TYPES = (float, )
 
     def matches(self, data):
         return isinstance(data, float)
@@ -191,6 +328,8 @@ class BoolType(DataType):
     """Bools are displayed as checkable items with a check box."""
 
     DEFAULT = False
+    CACHE_PAINT = True
+    TYPES = (bool, )
 
     def matches(self, data):
         return isinstance(data, bool)
@@ -217,10 +356,10 @@ class BoolType(DataType):
         if isinstance(model, QtCore.QAbstractProxyModel):
             index = model.mapToSource(index)
             model = model.sourceModel()
-        item = model.itemFromIndex(index)
         if pos.x() - rect.x() < 18:
-            item.setData(not item.data(QtCore.Qt.DisplayRole), QtCore.Qt.DisplayRole)
-        model.data_object.update(model.serialize())
+            model.setData(
+                index, not index.data(QtCore.Qt.DisplayRole), QtCore.Qt.DisplayRole)
+        model.write_back(index)
 
     def createEditor(self, delegate, parent, option, index):
         pass
@@ -229,41 +368,63 @@ class BoolType(DataType):
 class ListType(DataType):
     """Lists"""
 
+    TYPES = (list, )
+
     def matches(self, data):
         return isinstance(data, list)
 
     def empty_container(self):
         return []
 
+    def has_children(self, data):
+        return bool(data)
+
+    def children(self, data):
+        return enumerate(data)
+
     def next(self, model, data, parent):
+        if model.bucket_size and len(data) > model.bucket_size:
+            BUCKETS.add_buckets(model, self, data, None, 0, len(data), parent)
+            return
+        schema = model.schema_entry(parent.index())
         for i, value in enumerate(data):
-            type_ = match_type(value, key=i, schema=model.current_schema)
-            key_item = type_.key_item(
-                str(i), datatype=type_, editable=False, model=model)
-            value_item = type_.value_item(value, model=model, key=i)
-            parent.appendRow([key_item, value_item])
+            self.append_child(model, i, value, parent, schema)
+
+    def insert_child(self, model, row, key, value, parent, schema=None):
+        """Insert the row of the list entry at the given index."""
+        if schema is None:
+            schema = model.schema_entry(parent.index())
+        entry = model.schema_index.child(schema, key)
+        type_ = match_type(value, entry=entry)
+        start = profiling.clock() if profiling.enabled else None
+        key_item = type_.key_item(
+            str(key), datatype=type_, editable=False, model=model)
+        value_item = type_.value_item(value, model=model, key=key, schema=entry)
+        model.update_modified(value_item, entry)
+        parent.insertRow(row, [key_item, value_item])
+        if start is not None:
+            profiling.add('create_item', type_, start)
+        if (model.lazy or type_.LAZY_CHILDREN) and type_.has_children(value):
+            type_.defer(model, data=value, parent=key_item)
+        else:
             type_.next(model, data=value, parent=key_item)
-        if model.prev_schemas:
-            model.current_schema = model.prev_schemas.pop(-1)
 
-    def value_item(self, value, model, key):
+    def value_item(self, value, model, key, schema=None):
         item = QtGui.QStandardItem()
-        font = QtWidgets.QApplication.instance().font()
-        font.setItalic(True)
-        item.setData(font, QtCore.Qt.FontRole)
-        item.setData(QtGui.QBrush(QtCore.Qt.lightGray), QtCore.Qt.ForegroundRole)
-        item.setFlags(QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled)
-        schema = model.current_schema.get(key, {})
-        item.setData(schema.get('tooltip', self.__class__.__name__),
-                     QtCore.Qt.ToolTipRole)
+        item.setFlags(self.value_flags(model, {}))
         return item
 
-    def key_item(self, key, model, datatype=None, editable=True):
-        """Create an item for the key column for this data type."""
-        item = super(ListType, self).key_item(key, model, datatype, editable)
-        model.prev_schemas.append(model.current_schema)
-        model.current_schema = model.current_schema.get(key, {}).get('properties', {})
-        return item
+    def value_flags(self, model, schema):
+        return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+
+    def role_data(self, model, column, role, value, schema, index=None):
+        if column == 1:
+            if role == QtCore.Qt.ForegroundRole:
+                return brush(QtCore.Qt.lightGray)
+            elif role == QtCore.Qt.FontRole:
+                return font(italic=True)
+        return super(ListType, self).role_data(
+            model, column, role, value, schema, index)
 
     def serialize(self, model, item, data, parent):
         key_item = parent.child(item.row(), 0)
@@ -276,51 +437,83 @@ class ListType(DataType):
                 new_data = self.empty_container()
                 data.append(new_data)
                 data = new_data
+        pending = item.data(LazyRole)
+        if pending is not None:
+            data.extend(copy_data(pending[0]))
+            return
         for row in range(item.rowCount()):
             child_item = item.child(row, 0)
             type_ = child_item.data(TypeRole)
+            # Containers are measured through their leaves
+            start = None
+            if profiling.enabled and not child_item.rowCount():
+                start = profiling.clock()
             type_.serialize(
                 model=self, item=child_item, data=data, parent=item)
+            if start is not None:
+                profiling.add('serialize', type_, start)
 
 
 class DictType(DataType):
     """Dictionaries"""
 
+    TYPES = (dict, )
+
     def matches(self, data):
         return isinstance(data, dict)
 
     def empty_container(self):
         return {}
 
+    def has_children(self, data):
+        return bool(data)
+
+    def children(self, data):
+        return data.items()
+
     def next(self, model, data, parent):
+        if model.bucket_size and len(data) > model.bucket_size:
+            BUCKETS.add_buckets(model, self, data, list(data), 0, len(data), parent)
+            return
+        schema = model.schema_entry(parent.index())
         for key, value in data.items():
-            type_ = match_type(value, key=key, schema=model.current_schema)
-            key_item = type_.key_item(key, datatype=type_, model=model)
-            value_item = type_.value_item(value, model, key)
-            parent.appendRow([key_item, value_item])
+            self.append_child(model, key, value, parent, schema)
+
+    def insert_child(self, model, row, key, value, parent, schema=None):
+        """Insert the row of the dict entry with the given key."""
+        if schema is None:
+            schema = model.schema_entry(parent.index())
+        entry = model.schema_index.child(schema, key)
+        type_ = match_type(value, entry=entry)
+        start = profiling.clock() if profiling.enabled else None
+        key_item = type_.key_item(key, datatype=type_, model=model)
+        value_item = type_.value_item(value, model, key, entry)
+        model.update_modified(value_item, entry)
+        parent.insertRow(row, [key_item, value_item])
+        if start is not None:
+            profiling.add('create_item', type_, start)
+        if (model.lazy or type_.LAZY_CHILDREN) and type_.has_children(value):
+            type_.defer(model, data=value, parent=key_item)
+        else:
             type_.next(model, data=value, parent=key_item)
-        if model.prev_schemas:
-            model.current_schema = model.prev_schemas.pop(-1)
 
-    def key_item(self, key, model, datatype=None, editable=True):
-        """Create an item for the key column for this data type."""
-        item = super(DictType, self).key_item(key, model, datatype, editable)
-        model.prev_schemas.append(model.current_schema)
-        model.current_schema = model.current_schema.get(key, {}).get('properties', {})
-        return item
-
-    def value_item(self, value, model, key):
+    def value_item(self, value, model, key, schema=None):
         item = QtGui.QStandardItem()
-        font = QtWidgets.QApplication.instance().font()
-        font.setItalic(True)
-        item.setData(font, QtCore.Qt.FontRole)
-        item.setData(QtGui.QBrush(QtCore.Qt.lightGray), QtCore.Qt.ForegroundRole)
-        item.setFlags(QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled)
-        schema = model.current_schema.get(key, {})
-        item.setData(schema.get('tooltip', self.__class__.__name__),
-                     QtCore.Qt.ToolTipRole)
+        item.setFlags(self.value_flags(model, {}))
         return item
 
+    def value_flags(self, model, schema):
+        return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+
+    def role_data(self, model, column, role, value, schema, index=None):
+        if column == 1:
+            if role == QtCore.Qt.ForegroundRole:
+                return brush(QtCore.Qt.lightGray)
+            elif role == QtCore.Qt.FontRole:
+                return font(italic=True)
+        return super(DictType, self).role_data(
+            model, column, role, value, schema, index)
+
     def serialize(self, model, item, data, parent):
         key_item = parent.child(item.row(), 0)
         if key_item:
@@ -332,22 +525,360 @@ class DictType(DataType):
                 new_data = self.empty_container()
                 data.append(new_data)
                 data = new_data
+        pending = item.data(LazyRole)
+        if pending is not None:
+            data.update(copy_data(pending[0]))
+            return
         for row in range(item.rowCount()):
             child_item = item.child(row, 0)
             type_ = child_item.data(TypeRole)
+            # Containers are measured through their leaves
+            start = None
+            if profiling.enabled and not child_item.rowCount():
+                start = profiling.clock()
             type_.serialize(model=self, item=child_item, data=data, parent=item)
+            if start is not None:
+                profiling.add('serialize', type_, start)
 
 
-class AnyType(DataType):
+class BucketType(DataType):
+    """A range of the entries of a large list or dict, see JsonModel.bucket_size.
+
+    Bucket rows are virtual, the rows of their entries are only added once
+    the bucket is expanded. The data of a bucket is the DataType of the
+    container, the container, the list of its keys (None for lists) and
+    the start and end of the range. Buckets of more than bucket_size
+    entries hold buckets themselves.
+
+    The key item of a list bucket stores the index of its first entry in
+    the UserRole, so the entries still know their index in the list.
+    """
+
+    def matches(self, data):
+        return False
+
+    def has_children(self, data):
+        return True
+
+    def size(self, model, container_type):
+        """The maximum number of entries or buckets per bucket."""
+        return model.bucket_size or container_type.PAGE_SIZE
+
+    def add_buckets(self, model, container_type, container, keys, start, end, parent):
+        """Append the buckets of the container entries from start to end."""
+        size = self.size(model, container_type)
+        span = size
+        while end - start > span * size:
+            span *= size
+        for first in range(start, end, span):
+            last = min(first + span, end)
+            if keys is None:
+                label = u'[%d \u2026 %d]' % (first, last - 1)
+            else:
+                label = u'[%s \u2026 %s]' % (keys[first], keys[last - 1])
+            key_item = self.key_item(label, datatype=self, editable=False, model=model)
+            key_item.setData(first if keys is None else None, QtCore.Qt.UserRole)
+            value_item = QtGui.QStandardItem()
+            value_item.setFlags(self.value_flags(model, {}))
+            parent.appendRow([key_item, value_item])
+            self.defer(model, (container_type, container, keys, first, last), key_item)
+
+    def next(self, model, data, parent):
+        container_type, container, keys, start, end = data
+        if end - start > self.size(model, container_type):
+            self.add_buckets(model, container_type, container, keys, start, end, parent)
+            return
+        schema = model.schema_entry(parent.index())
+        for key in range(start, end) if keys is None else keys[start:end]:
+            container_type.append_child(model, key, container[key], parent, schema)
+
+    def value_flags(self, model, schema):
+        return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+
+    def role_data(self, model, column, role, value, schema, index=None):
+        if role == QtCore.Qt.ForegroundRole:
+            return brush(QtCore.Qt.lightGray)
+        elif role == QtCore.Qt.FontRole:
+            return font(italic=True)
+        return super(BucketType, self).role_data(
+            model, column, role, value, schema, index)
+
+    def serialize(self, model, item, data, parent):
+        """Add the entries of the bucket to the data of its container."""
+        pending = item.data(LazyRole)
+        if pending is not None:
+            _, container, keys, start, end = pending[0]
+            if keys is None:
+                data.extend(copy_data(container[start:end]))
+            else:
+                for key in keys[start:end]:
+                    data[key] = copy_data(container[key])
+            return
+        for row in range(item.rowCount()):
+            child_item = item.child(row, 0)
+            type_ = child_item.data(TypeRole)
+            type_.serialize(model=model, item=child_item, data=data, parent=item)
+
+
+BUCKETS = BucketType()
+
+
+class BufferType(DataType):
+    """NumPy arrays, array.array, bytes, bytearray and memoryview objects.
+
+    The value shows the element type, the shape and the min, max and mean
+    of numeric buffers. The elements are read straight from the buffer when
+    the row is expanded, in buckets of up to PAGE_SIZE rows. Serializing
+    returns the original object, see JsonModel.serialize for lists.
+    """
+
+    TYPES = (array.array, bytes, bytearray, memoryview) + (
+        (numpy.ndarray, ) if numpy is not None else ())
+    LAZY_CHILDREN = True
+    PAGE_SIZE = 1000
 
     def matches(self, data):
         return True
 
-    def value_item(self, value, model, key):
-        item = super(AnyType, self).value_item(str(value), model, key)
-        item.setFlags(QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled)
+    def elements(self, data):
+        """The indexable elements of the buffer, None if it has none.
+
+        Multi-dimensional memoryviews are only indexable through NumPy.
+        """
+        if isinstance(data, memoryview) and data.ndim != 1:
+            if numpy is None:
+                return None
+            data = numpy.asarray(data)
+        if numpy is not None and isinstance(data, numpy.ndarray) and data.ndim == 0:
+            return None
+        return data
+
+    def is_writable(self, data):
+        """Whether the elements can be written by their key path.
+
+        Multi-dimensional memoryviews do not support writing to sub-views.
+        """
+        if isinstance(data, memoryview):
+            return not data.readonly and data.ndim == 1
+        if numpy is not None and isinstance(data, numpy.ndarray):
+            return data.flags.writeable
+        return not isinstance(data, bytes)
+
+    def display_value(self, value):
+        if numpy is not None and isinstance(value, numpy.ndarray):
+            kind = str(value.dtype)
+            shape = value.shape
+            numeric = value.dtype.kind in 'biuf' and value.size
+            stats = (value.min(), value.max(), value.mean()) if numeric else None
+        else:
+            if isinstance(value, array.array):
+                kind = 'array(%s)' % value.typecode
+            elif isinstance(value, memoryview):
+                kind = 'memoryview(%s)' % value.format
+            else:
+                kind = type(value).__name__
+            shape = value.shape if isinstance(value, memoryview) else (len(value), )
+            stats = None
+            if (not isinstance(value, memoryview) or (
+                    value.ndim == 1 and value.format in _NUMERIC_FORMATS)) and len(value):
+                if not isinstance(value, array.array) or value.typecode not in 'uw':
+                    stats = (min(value), max(value), sum(value) / float(len(value)))
+        text = '%s %s' % (kind, '(%s)' % ', '.join(str(size) for size in shape))
+        if stats is not None:
+            text += ' min %g max %g mean %g' % stats
+        return text
+
+    def value_flags(self, model, schema):
+        return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+
+    def has_children(self, data):
+        elements = self.elements(data)
+        return elements is not None and len(elements) > 0
+
+    def next(self, model, data, parent):
+        elements = self.elements(data)
+        if elements is None:
+            return
+        if len(elements) > BUCKETS.size(model, self):
+            BUCKETS.add_buckets(model, self, elements, None, 0, len(elements), parent)
+            return
+        schema = model.schema_entry(parent.index())
+        for i in range(len(elements)):
+            self.append_child(model, i, elements[i], parent, schema)
+
+    def insert_child(self, model, row, key, value, parent, schema=None):
+        """Insert the row of the element at the given index."""
+        if schema is None:
+            schema = model.schema_entry(parent.index())
+        entry = model.schema_index.child(schema, key)
+        if numpy is not None and isinstance(value, numpy.generic):
+            value = value.item()
+        type_ = match_type(value, entry=entry)
+        if not self._is_writable(model, parent):
+            entry = dict(entry, editable=False)
+        key_item = type_.key_item(
+            str(key), datatype=type_, editable=False, model=model)
+        value_item = type_.value_item(value, model=model, key=key, schema=entry)
+        model.update_modified(value_item, entry)
+        parent.insertRow(row, [key_item, value_item])
+        if type_.has_children(value):
+            type_.defer(model, data=value, parent=key_item)
+
+    def _is_writable(self, model, parent):
+        """Whether the elements below the parent item can be edited.
+
+        The elements of the rows of multi-dimensional buffers are written
+        through all the buffers they are nested in.
+        """
+        item = parent
+        while True:
+            while isinstance(item.data(TypeRole), BucketType):
+                item = item.parent() or model.invisibleRootItem()
+            if not item.index().isValid():
+                return self.is_writable(model.data_object)
+            row_parent = item.parent() or model.invisibleRootItem()
+            buffer = row_parent.child(item.row(), 1).data(QtCore.Qt.UserRole)
+            if not self.is_writable(buffer):
+                return False
+            item = row_parent
+            while isinstance(item.data(TypeRole), BucketType):
+                item = item.parent() or model.invisibleRootItem()
+            if not isinstance(item.data(TypeRole), BufferType):
+                return True
+
+    def serialize(self, model, item, data, parent):
+        """Add the buffer object itself."""
+        value = parent.child(item.row(), 1).data(QtCore.Qt.UserRole)
+        if isinstance(data, dict):
+            data[parent.child(item.row(), 0).data(QtCore.Qt.DisplayRole)] = value
+        elif isinstance(data, list):
+            data.append(value)
+
+    def to_list(self, value):
+        """The elements of the buffer as (nested) lists."""
+        if isinstance(value, (bytes, bytearray)):
+            return list(bytearray(value))
+        return value.tolist()
+
+
+BUFFERS = BufferType()
+
+# The memoryview formats of numbers
+_NUMERIC_FORMATS = frozenset('bBhHiIlLqQnNfd')
+
+
+def copy_data(data):
+    """A copy of the dicts and lists of the data, the other values are shared.
+
+    Used to serialize subtrees that were never added to the model, so the
+    result does not share containers with the data_object.
+    """
+    if isinstance(data, dict):
+        return type(data)((key, copy_data(value)) for key, value in data.items())
+    if isinstance(data, list):
+        return [copy_data(value) for value in data]
+    return data
+
+
+def buffers_to_lists(data):
+    """A copy of the data with all buffers converted to lists."""
+    if isinstance(data, dict):
+        return type(data)(
+            (key, buffers_to_lists(value)) for key, value in data.items())
+    if isinstance(data, list):
+        return [buffers_to_lists(value) for value in data]
+    if BUFFERS.TYPES and isinstance(data, BUFFERS.TYPES) and not isinstance(
+            data, six.string_types):
+        return BUFFERS.to_list(data)
+    return data
+
+
+class RecordListType(ListType):
+    """Lists of dicts with the same keys, shown as a table instead of a tree.
+
+    Whether a list holds records is decided on a sample of its entries,
+    see table.record_keys. The records are not added to the tree, the
+    "Show as Table" action opens them in a RecordTableWidget, which edits
+    the records in place. A record list at the top level is shown as a
+    list.
+
+    Not in DATA_TYPES by default, insert it before the ListType or set it
+    as the type in the schema.
+    """
+
+    LAZY_CHILDREN = True
+    MIN_RECORDS = 2
+
+    def matches(self, data):
+        if isinstance(data, list) and len(data) >= self.MIN_RECORDS:
+            return table.record_keys(data) is not None
+        return False
+
+    def has_children(self, data):
+        return False
+
+    def next(self, model, data, parent):
+        if not parent.index().isValid():
+            super(RecordListType, self).next(model, data, parent)
+
+    def value_item(self, value, model, key, schema=None):
+        """Keep the records themselves, Qt would store a copy of a list."""
+        item = QtGui.QStandardItem(self.display_value(value))
+        item.setData((value, ), QtCore.Qt.UserRole)
+        item.setData(self, TypeRole)
+        item.setFlags(self.value_flags(model, {}))
         return item
 
+    def display_value(self, value):
+        return u'%d records: %s' % (
+            len(value), u', '.join(six.text_type(key) for key in table.record_keys(value)))
+
+    def actions(self, index):
+        actions = super(RecordListType, self).actions(index)
+        show = QtWidgets.QAction('Show as Table', None)
+        show.triggered.connect(partial(self.show_table, index))
+        actions.append(show)
+        return actions
+
+    def show_table(self, index):
+        """Open the records of the index in a window."""
+        model = index.model()
+        if isinstance(model, QtCore.QAbstractProxyModel):
+            index = model.mapToSource(index)
+            model = model.sourceModel()
+        records, = index.sibling(index.row(), 1).data(QtCore.Qt.UserRole)
+        editable = self.is_editable(model, model.schema_entry(index))
+        widget = table.RecordTableWidget(
+            records, editable=editable, parent=QtWidgets.QApplication.activeWindow())
+        widget.setWindowFlags(QtCore.Qt.Window)
+        widget.setAttribute(QtCore.Qt.WA_DeleteOnClose)
+        widget.setWindowTitle(index.sibling(index.row(), 0).data(QtCore.Qt.DisplayRole))
+        widget.resize(800, 600)
+        widget.show()
+        return widget
+
+    def serialize(self, model, item, data, parent):
+        if item.row() < 0:
+            super(RecordListType, self).serialize(model, item, data, parent)
+            return
+        records, = parent.child(item.row(), 1).data(QtCore.Qt.UserRole)
+        if isinstance(data, dict):
+            data[parent.child(item.row(), 0).data(QtCore.Qt.DisplayRole)] = list(records)
+        elif isinstance(data, list):
+            data.append(list(records))
+
+
+class AnyType(DataType):
+
+    def matches(self, data):
+        return True
+
+    def display_value(self, value):
+        return str(value)
+
+    def value_flags(self, model, schema):
+        return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+
 
 # -----------------------------------------------------------------------------
 # Derived Types
@@ -357,6 +888,8 @@ class AnyType(DataType):
 class OrderedDictType(DictType):
     """Ordered Dictionaries"""
 
+    TYPES = (OrderedDict, )
+
     def matches(self, data):
         return isinstance(data, OrderedDict)
 
@@ -372,12 +905,14 @@ class RangeType(DataType):
     """
 
     KEYS = ['start', 'end', 'step']
+    KEY_SET = frozenset(KEYS)
     DEFAULT = [0, 1, 1]
+    TYPES = (dict, )
+    CACHE_PAINT = True
 
     def matches(self, data):
         if isinstance(data, dict) and len(data) == 3:
-            if all([True if k in self.KEYS else False for k in data.keys()]):
-                return True
+            return self.KEY_SET.issuperset(data)
         return False
 
     def paint(self, delegate, painter, option, index):
@@ -389,7 +924,7 @@ class RangeType(DataType):
         metrics = painter.fontMetrics()
         spinbox_option = QtWidgets.QStyleOptionSpinBox()
         start_rect = QtCore.QRect(option.rect)
-        start_rect.setWidth(start_rect.width() / 3.0)
+        start_rect.setWidth(start_rect.width() // 3)
         spinbox_option.rect = start_rect
         spinbox_option.frame = True
         spinbox_option.state = option.state
@@ -405,11 +940,14 @@ class RangeType(DataType):
             value_rect = QtCore.QRectF(
                 spinbox_option.rect.adjusted(6, 1, -2, -2))
             value = metrics.elidedText(
-                value, QtCore.Qt.ElideRight, value_rect.width() - 20)
+                value, QtCore.Qt.ElideRight, int(value_rect.width()) - 20)
             painter.drawText(value_rect, value)
 
         painter.restore()
 
+    def paint_key(self, index):
+        return repr(index.data(QtCore.Qt.UserRole)), int(index.flags())
+
     def createEditor(self, delegate, parent, option, index):
         data = index.data(QtCore.Qt.UserRole)
         wid = QtWidgets.QWidget(parent)
@@ -451,18 +989,17 @@ class RangeType(DataType):
         if isinstance(model, QtCore.QAbstractProxyModel):
             index = model.mapToSource(index)
             model = model.sourceModel()
-        data = index.data(QtCore.Qt.UserRole)
+        # A copy, the previous value is still needed for the undo_stack
+        data = dict(index.data(QtCore.Qt.UserRole))
         data['start'] = editor.layout().itemAt(0).widget().value()
         data['end'] = editor.layout().itemAt(1).widget().value()
         data['step'] = editor.layout().itemAt(2).widget().value()
-        model.itemFromIndex(index).setData(data, QtCore.Qt.UserRole)
-        model.data_object.update(model.serialize())
+        model.setData(index, data, QtCore.Qt.UserRole)
+        model.write_back(index)
 
-    def value_item(self, value, model, key=None):
-        """Item representing a value."""
-        value_item = super(RangeType, self).value_item(None, model, key)
-        value_item.setData(value, QtCore.Qt.UserRole)
-        return value_item
+    def display_value(self, value):
+        """The range is painted from the UserRole, it has no display value."""
+        return None
 
     def serialize(self, model, item, data, parent):
         value_item = parent.child(item.row(), 1)
@@ -482,12 +1019,13 @@ class RangeType(DataType):
         schema = index.data(SchemaRole)
         default = schema.get("default", self.__class__.DEFAULT)
 
-        data = index.data(QtCore.Qt.UserRole)
+        data = dict(index.data(QtCore.Qt.UserRole))
         data['start'] = default[0]
         data['end'] = default[1]
         data['step'] = default[2]
 
-        model.itemFromIndex(index).setData(data, QtCore.Qt.UserRole)
+        model.setData(index, data, QtCore.Qt.UserRole)
+        model.write_back(index)
 
     def copy(self, index):
         """Put the given display value into the clipboard."""
@@ -503,8 +1041,14 @@ class UrlType(DataType):
     """Provide a link to urls."""
 
     REGEX = re.compile(r'(?:https?):\/\/|(?:file):\/\/')
+    TYPES = six.string_types
 
     def matches(self, data):
+        """Match strings against the REGEX.
+
+        Subclasses that only change the REGEX are matched in a single pass
+        together with the other regex types, see match_type.
+        """
         if isinstance(data, six.string_types):
             if self.REGEX.match(data) is not None:
                 return True
@@ -551,17 +1095,22 @@ class UrlType(DataType):
                 return super(delegate.__class__, delegate).createEditor(
                     parent, option, index)
 
-    def value_item(self, value, model, key=None):
-        """Create an item for the value column for this data type."""
-        item = super(UrlType, self).value_item(value, model, key)
-        font = QtWidgets.QApplication.instance().font()
-        font.setUnderline(True)
-        item.setData(font, QtCore.Qt.FontRole)
-        icon = QtWidgets.QApplication.instance().style().standardIcon(
-            QtWidgets.QApplication.instance().style().SP_DriveNetIcon)
-        item.setData(icon, QtCore.Qt.DecorationRole)
-        item.setFlags(item.flags() | QtCore.Qt.ItemIsEditable)
-        return item
+    def value_flags(self, model, schema):
+        flags = super(UrlType, self).value_flags(model, schema)
+        return flags | QtCore.Qt.ItemIsEditable
+
+    def role_data(self, model, column, role, value, schema, index=None):
+        if column == 1:
+            if role == QtCore.Qt.FontRole:
+                return font(underline=True)
+            elif role == QtCore.Qt.DecorationRole:
+                return self.icon(value)
+        return super(UrlType, self).role_data(
+            model, column, role, value, schema, index)
+
+    def icon(self, value):
+        """The icon shown next to the value."""
+        return standard_icon(QtWidgets.QStyle.SP_DriveNetIcon)
 
     def _explore(self, url):
         """Open the url"""
@@ -573,18 +1122,16 @@ class FilepathType(UrlType):
 
     REGEX = re.compile(r'(\/.*)|([A-Z]:\\.*)')
 
-    def matches(self, data):
-        if isinstance(data, six.string_types):
-            if self.REGEX.match(data) is not None:
-                return True
-        return False
-
     def actions(self, index):
         actions = super(UrlType, self).actions(index)
         explore_path = QtWidgets.QAction('Explore Path ...', None)
         actions.append(explore_path)
         path = index.data(QtCore.Qt.DisplayRole)
-        if os.path.isfile(path):
+        # Never probe the file system here, the menu would block on it
+        cache = pathcache.path_cache()
+        if cache.is_expired(path):
+            cache.request(path)
+        if cache.status(path) == pathcache.FILE:
             open_file = QtWidgets.QAction('Open File ...', None)
             actions.append(open_file)
             open_file.triggered.connect(partial(self._explore, path))
@@ -592,19 +1139,25 @@ class FilepathType(UrlType):
         explore_path.triggered.connect(partial(self._explore, path))
         return actions
 
-    def value_item(self, value, model, key=None):
-        """Create an item for the value column for this data type."""
-        item = super(FilepathType, self).value_item(value, model, key)
-        if os.path.isfile(value):
-            icon = QtWidgets.QApplication.instance().style().standardIcon(
-                QtWidgets.QApplication.instance().style().SP_FileIcon)
-        elif os.path.isdir(value):
-            icon = QtWidgets.QApplication.instance().style().standardIcon(
-                QtWidgets.QApplication.instance().style().SP_DirIcon)
-        else:
-            return item
-        item.setData(icon, QtCore.Qt.DecorationRole)
-        return item
+    def role_data(self, model, column, role, value, schema, index=None):
+        """The file system is probed in the background for the icon."""
+        if column == 1 and role == QtCore.Qt.DecorationRole:
+            cache = pathcache.path_cache()
+            if index is not None and cache.is_expired(value):
+                cache.request(value, index)
+        return super(FilepathType, self).role_data(
+            model, column, role, value, schema, index)
+
+    def icon(self, value):
+        """Show a file or folder icon if the path exists, None if unknown."""
+        status = pathcache.path_cache().status(value)
+        if status == pathcache.FILE:
+            return standard_icon(QtWidgets.QStyle.SP_FileIcon)
+        elif status == pathcache.DIRECTORY:
+            return standard_icon(QtWidgets.QStyle.SP_DirIcon)
+        elif status == pathcache.MISSING:
+            return super(FilepathType, self).icon(value)
+        return None
 
 
 class ChoiceType(DataType):
@@ -618,11 +1171,12 @@ class ChoiceType(DataType):
     """
 
     KEYS = ['value', 'choices']
+    KEY_SET = frozenset(KEYS)
+    TYPES = (dict, )
 
     def matches(self, data):
         if isinstance(data, dict) and len(data) == 2:
-            if all([True if k in self.KEYS else False for k in data.keys()]):
-                return True
+            return self.KEY_SET.issuperset(data)
         return False
 
     def createEditor(self, delegate, parent, option, index):
@@ -636,17 +1190,14 @@ class ChoiceType(DataType):
         if isinstance(model, QtCore.QAbstractProxyModel):
             index = model.mapToSource(index)
             model = model.sourceModel()
-        data = index.data(QtCore.Qt.UserRole)
+        data = dict(index.data(QtCore.Qt.UserRole))
         data['value'] = data['choices'][editor.currentIndex()]
-        model.itemFromIndex(index).setData(data['value'] , QtCore.Qt.DisplayRole)
-        model.itemFromIndex(index).setData(data, QtCore.Qt.UserRole)
-        model.data_object.update(model.serialize())
+        model.setData(index, data['value'], QtCore.Qt.DisplayRole)
+        model.setData(index, data, QtCore.Qt.UserRole)
+        model.write_back(index)
 
-    def value_item(self, value, model, key=None):
-        """Item representing a value."""
-        item = super(ChoiceType, self).value_item(value['value'], model, key)
-        item.setData(value, QtCore.Qt.UserRole)
-        return item
+    def display_value(self, value):
+        return value['value']
 
     def serialize(self, model, item, data, parent):
         value_item = parent.child(item.row(), 1)
@@ -675,24 +1226,135 @@ DATA_TYPES = [
     ChoiceType(),
     OrderedDictType(),
     DictType(),
+    BufferType(),
     AnyType()
 ]
 
+# The match_type caches and a copy of the DATA_TYPES they were built for
+_CACHE = {
+    'types': [],
+    'dispatch': {},
+    'schema_types': {}
+}
 
-def match_type(data, key=None, schema=None):
-    """Try to match the given data object to a DataType"""
 
-    if key and schema:
-        type_cls = schema.get(key, {}).get("type", None)
-        if type_cls is not None:
-            for type_ in DATA_TYPES:
-                if isinstance(type_, type_cls):
-                    return type_
-            new_type = type_cls()
-            DATA_TYPES.append(new_type)
-            return new_type
+def clear_cache():
+    """Forget the cached match_type lookups.
+
+    Changes to the DATA_TYPES are detected automatically, only call this
+    after changing how a DataType in the list matches its data.
+    """
+    _CACHE['types'] = []
+    _CACHE['dispatch'] = {}
+    _CACHE['schema_types'] = {}
+
+
+def _regex_matcher(types):
+    """Match a string against the REGEX of several UrlTypes at once.
+
+    The patterns are joined in the order of the types, so the first type
+    whose REGEX matches wins, as if their matches methods ran one by one.
+    Return the match method and the types by the index of their group.
+    """
+    regex = re.compile('|'.join(
+        '(?P<type{0}>{1})'.format(i, t.REGEX.pattern)
+        for i, t in enumerate(types)), types[0].REGEX.flags)
+    groups = dict(
+        (regex.groupindex['type{0}'.format(i)], t) for i, t in enumerate(types))
+    return regex.match, groups
+
+
+# Inline global flags like (?i) are only allowed at the start of a pattern
+_GLOBAL_FLAGS = re.compile(r'\(\?[aiLmsux]+\)')
+
+
+def _mergeable(type_, others):
+    """Whether the REGEX of the type can be joined with the ones of others."""
+    matches = six.get_unbound_function(type(type_).matches)
+    if matches is not six.get_unbound_function(UrlType.matches):
+        return False
+    regex = type_.REGEX
+    if regex.groupindex or re.search(r'\\[1-9]', regex.pattern):
+        return False
+    if _GLOBAL_FLAGS.search(regex.pattern):
+        return False
+    return not others or others[0].REGEX.flags == regex.flags
 
+
+def _dispatch(python_type):
+    """The (matches, DataType) candidates for data of the given Python type.
+
+    Only DataTypes whose TYPES include the Python type are candidates.
+    Consecutive regex types are merged into one regex, stored as its match
+    method and the DataTypes by group index.
+    """
+    candidates = []
+    regex_types = []
     for type_ in DATA_TYPES:
-        if type_.matches(data):
-            return type_
-    return AnyType()
+        types = getattr(type_, 'TYPES', None)
+        if types is not None and not issubclass(python_type, types):
+            continue
+        if regex_types and not _mergeable(type_, regex_types):
+            candidates.append(_regex_matcher(regex_types))
+            regex_types = []
+        if _mergeable(type_, regex_types):
+            regex_types.append(type_)
+        else:
+            candidates.append((type_.matches, type_))
+    if regex_types:
+        candidates.append(_regex_matcher(regex_types))
+    return candidates
+
+
+def _schema_type(type_cls, schema_types):
+    type_ = schema_types.get(type_cls)
+    if type_ is None:
+        for type_ in DATA_TYPES:
+            if isinstance(type_, type_cls):
+                break
+        else:
+            type_ = type_cls()
+        schema_types[type_cls] = type_
+    return type_
+
+
+def match_type(data, key=None, schema=None, entry=None):
+    """Try to match the given data object to a DataType.
+
+    The first DataType in DATA_TYPES that matches the data wins, a type set
+    in the schema entry of the data, or in the schema for the key, takes
+    precedence.
+    """
+    if _CACHE['types'] != DATA_TYPES:
+        clear_cache()
+        _CACHE['types'] = list(DATA_TYPES)
+
+    start = profiling.clock() if profiling.enabled else None
+    type_ = None
+    if entry is None and key and schema:
+        entry = schema.get(key)
+    if entry:
+        type_cls = entry.get("type", None)
+        if type_cls is not None:
+            type_ = _schema_type(type_cls, _CACHE['schema_types'])
+
+    if type_ is None:
+        python_type = type(data)
+        candidates = _CACHE['dispatch'].get(python_type)
+        if candidates is None:
+            candidates = _CACHE['dispatch'][python_type] = _dispatch(python_type)
+        for matches, candidate in candidates:
+            if candidate.__class__ is dict:
+                match = matches(data)
+                if match is not None:
+                    type_ = candidate[match.lastindex]
+                    break
+            elif matches(data):
+                type_ = candidate
+                break
+        else:
+            type_ = AnyType()
+    if start is not None:
+        profiling.add('match_type', type_, start)
+    return type_
+
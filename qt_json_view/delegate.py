@@ -1,25 +1,96 @@
-from Qt import QtWidgets, QtCore
+from collections import OrderedDict
 
+from Qt import QtWidgets, QtCore, QtGui
+
+from qt_json_view import profiling
 from qt_json_view.datatypes import DataType, TypeRole
 
 
 class JsonDelegate(QtWidgets.QStyledItemDelegate):
-    """Display the data based on the definitions on the DataTypes."""
+    """Display the data based on the definitions on the DataTypes.
+
+    The cells of DataTypes that set CACHE_PAINT are painted into a pixmap
+    once and drawn from a cache afterwards. The cache holds up to
+    cache_limit KiB of pixmaps, the least recently drawn are dropped first.
+    """
+
+    def __init__(self, parent=None, cache_limit=10240):
+        super(JsonDelegate, self).__init__(parent)
+        self.cache_limit = cache_limit
+        self._pixmaps = OrderedDict()
+        self._cache_size = 0
 
     def sizeHint(self, option, index):
         return QtCore.QSize(option.rect.width(), 20)
 
     def paint(self, painter, option, index):
         """Use method from the data type or fall back to the default."""
-        if index.column() == 0:
+        start = profiling.clock() if profiling.enabled else None
+        type_ = index.data(TypeRole) if index.column() > 0 else None
+        try:
+            if type_ is not None:
+                try:
+                    if type_.CACHE_PAINT and not option.rect.isEmpty():
+                        return self.paint_cached(type_, painter, option, index)
+                    return type_.paint(self, painter, option, index)
+                except NotImplementedError:
+                    pass
             return super(JsonDelegate, self).paint(painter, option, index)
-        type_ = index.data(TypeRole)
-        if type_ is not None:
-            try:
-                return type_.paint(self, painter, option, index)
-            except NotImplementedError:
-                pass
-        return super(JsonDelegate, self).paint(painter, option, index)
+        finally:
+            if start is not None:
+                profiling.add('paint', type_, start)
+
+    def paint_cached(self, type_, painter, option, index):
+        """Draw the cell from the cache, painting it with the DataType if needed."""
+        ratio = painter.device().devicePixelRatioF()
+        key = self.paint_key(type_, painter, option, index, ratio)
+        pixmap = self._pixmaps.pop(key, None)
+        if pixmap is None:
+            pixmap = self._render(type_, painter, option, index, ratio)
+            self._cache_size += _pixmap_size(pixmap)
+        self._pixmaps[key] = pixmap
+        while self._cache_size > self.cache_limit * 1024 and len(self._pixmaps) > 1:
+            self._cache_size -= _pixmap_size(self._pixmaps.popitem(last=False)[1])
+        painter.drawPixmap(option.rect.topLeft(), pixmap)
+
+    def paint_key(self, type_, painter, option, index, ratio):
+        """Everything the painted cell of the index depends on."""
+        foreground = index.data(QtCore.Qt.ForegroundRole)
+        font = index.data(QtCore.Qt.FontRole)
+        return (
+            type_.__class__,
+            type_.paint_key(index),
+            None if foreground is None else QtGui.QBrush(foreground).color().rgba(),
+            None if font is None else font.key(),
+            int(option.state),
+            int(option.features),
+            option.rect.width(),
+            option.rect.height(),
+            option.palette.cacheKey(),
+            option.font.key(),
+            painter.font().key(),
+            ratio)
+
+    def clear_cache(self):
+        """Forget the painted cells, e.g. after the style changed."""
+        self._pixmaps.clear()
+        self._cache_size = 0
+
+    def _render(self, type_, painter, option, index, ratio):
+        size = option.rect.size()
+        pixmap = QtGui.QPixmap(size * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(QtCore.Qt.transparent)
+        cell_option = QtWidgets.QStyleOptionViewItem(option)
+        cell_option.rect = QtCore.QRect(QtCore.QPoint(0, 0), size)
+        cell_painter = QtGui.QPainter(pixmap)
+        try:
+            cell_painter.setFont(painter.font())
+            cell_painter.setRenderHints(painter.renderHints())
+            type_.paint(self, cell_painter, cell_option, index)
+        finally:
+            cell_painter.end()
+        return pixmap
 
     def createEditor(self, parent, option, index):
         """Use method from the data type or fall back to the default."""
@@ -35,8 +106,19 @@ class JsonDelegate(QtWidgets.QStyledItemDelegate):
     def setModelData(self, editor, model, index):
         """Use method from the data type or fall back to the default."""
         if index.column() == 0:
-            return super(JsonDelegate, self).setModelData(editor, model, index)
+            source_model, source_index = model, index
+            if isinstance(model, QtCore.QAbstractProxyModel):
+                source_index = model.mapToSource(index)
+                source_model = model.sourceModel()
+            old_key = source_index.data(QtCore.Qt.DisplayRole)
+            return_value = super(JsonDelegate, self).setModelData(editor, model, index)
+            source_model.write_back_key(source_index, old_key)
+            return return_value
         try:
             return index.data(TypeRole).setModelData(self, editor, model, index)
         except NotImplementedError:
             return super(JsonDelegate, self).setModelData(editor, model, index)
+
+
+def _pixmap_size(pixmap):
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
@@ -0,0 +1,218 @@
+import codecs
+import json
+import os
+import time
+
+import six
+from Qt import QtCore
+
+from qt_json_view.datatypes import TypeRole
+
+WHITESPACE = ' \t\n\r'
+
+
+class JsonStream(object):
+    """Read the entries of the top level container of a JSON document.
+
+    The file is read in chunks and each entry is decoded on its own with the
+    stdlib decoder, so only the entry being decoded has to be held in memory.
+    """
+
+    def __init__(self, source, chunk_size=65536):
+        if isinstance(source, six.string_types):
+            self.file = open(source, 'rb')
+            self._owns_file = True
+        else:
+            self.file = source
+            self._owns_file = False
+        self.chunk_size = chunk_size
+        self.total = _size(self.file)
+        self.bytes_read = 0
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._container = None
+
+    def container(self):
+        """An empty list or dict matching the top level of the document."""
+        if self._container is None:
+            char = self._next_char()
+            if char == '[':
+                self._container = []
+            elif char == '{':
+                self._container = {}
+            else:
+                raise ValueError(
+                    'The top level of the document must be an array or an object')
+            self._pos += 1
+        return type(self._container)()
+
+    def close(self):
+        if self._owns_file:
+            self.file.close()
+
+    def __iter__(self):
+        """Yield the (key, value) pairs of the top level, list keys are indices."""
+        is_dict = isinstance(self.container(), dict)
+        close = '}' if is_dict else ']'
+        index = 0
+        char = self._next_char()
+        if char == close:
+            self._pos += 1
+            return
+        while True:
+            if is_dict:
+                if char != '"':
+                    self._error('property name')
+                key = self._decode()
+                if self._next_char() != ':':
+                    self._error("':'")
+                self._pos += 1
+                self._next_char()
+            else:
+                key = index
+            value = self._decode()
+            yield key, value
+            index += 1
+            char = self._next_char()
+            if char == close:
+                self._pos += 1
+                return
+            if char != ',':
+                self._error("',' or '%s'" % close)
+            self._pos += 1
+            char = self._next_char()
+
+    def _error(self, expected):
+        raise ValueError('Expecting %s after byte %d' % (expected, self.bytes_read))
+
+    def _read(self):
+        """Add the next chunk to the buffer, False at the end of the file.
+
+        The chunk is at least as large as the undecoded part of the buffer,
+        so a single huge entry is decoded an amortized constant number of times.
+        """
+        if self._eof:
+            return False
+        remaining = len(self._buffer) - self._pos
+        chunk = self.file.read(max(self.chunk_size, remaining))
+        if not chunk:
+            self._eof = True
+            return False
+        if isinstance(chunk, bytes):
+            self.bytes_read += len(chunk)
+            chunk = self._text_decoder.decode(chunk)
+        else:
+            self.bytes_read += len(chunk.encode('utf-8'))
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _next_char(self):
+        """Skip whitespace and return the next character, None at the end."""
+        while True:
+            buffer = self._buffer
+            pos = self._pos
+            size = len(buffer)
+            while pos < size and buffer[pos] in WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < size:
+                return buffer[pos]
+            if not self._read():
+                return None
+
+    def _decode(self):
+        """Decode the value at the current position, reading more as needed."""
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if not self._read():
+                    raise
+                continue
+            # A number at the end of the buffer might continue in the next chunk
+            if end == len(self._buffer) and self._read():
+                continue
+            self._pos = end
+            return value
+
+
+def _size(file_):
+    """The size of the file in bytes, -1 if it can not be determined."""
+    try:
+        return os.fstat(file_.fileno()).st_size
+    except (AttributeError, OSError, ValueError, IOError):
+        return -1
+
+
+class JsonLoader(QtCore.QObject):
+    """Append the entries of a JsonStream to a JsonModel from the event loop.
+
+    The entries are added in batches that stop once their time budget is
+    used up, so the view stays responsive and the first rows show up right
+    away. The data_object of the model grows along with the rows.
+
+    With a bucket_size on the model, rows are only appended up to the
+    bucket_size. The top level is shown in buckets once the document is
+    loaded, if it has more entries than that.
+    """
+
+    progress = QtCore.Signal(object, object)
+    finished = QtCore.Signal()
+    failed = QtCore.Signal(str)
+
+    def __init__(self, model, stream, batch_time=0.01, parent=None):
+        super(JsonLoader, self).__init__(parent or model)
+        self.model = model
+        self.stream = stream
+        self.batch_time = batch_time
+        self._entries = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._step)
+
+    def start(self):
+        self._entries = iter(self.stream)
+        self._timer.start()
+
+    def is_loading(self):
+        return self._timer.isActive()
+
+    def cancel(self):
+        """Stop loading, the rows added so far stay in the model."""
+        self._timer.stop()
+        self.stream.close()
+
+    def _step(self):
+        model = self.model
+        parent = model.invisibleRootItem()
+        type_ = parent.data(TypeRole)
+        data = model.data_object
+        schema = model.schema_index.root
+        deadline = time.time() + self.batch_time
+        try:
+            for key, value in self._entries:
+                if not model.bucket_size or len(data) < model.bucket_size:
+                    type_.append_child(model, key, value, parent, schema)
+                if isinstance(data, list):
+                    data.append(value)
+                else:
+                    data[key] = value
+                if time.time() >= deadline:
+                    break
+            else:
+                self.cancel()
+                if model.bucket_size and len(data) > model.bucket_size:
+                    parent.removeRows(0, parent.rowCount())
+                    type_.next(model=model, data=data, parent=parent)
+                self.progress.emit(self.stream.bytes_read, self.stream.total)
+                self.finished.emit()
+                return
+        except ValueError as error:
+            self.cancel()
+            self.failed.emit(str(error))
+            return
+        self.progress.emit(self.stream.bytes_read, self.stream.total)
@@ -0,0 +1,390 @@
+import json
+import mmap
+import re
+from collections import OrderedDict
+
+import six
+from Qt import QtCore
+
+from qt_json_view.datatypes import (
+    brush, match_type, TypeRole, SchemaRole, PRESENTATION_ROLES)
+from qt_json_view.schema import SchemaIndex
+
+_SPACE = re.compile(br'[ \t\n\r]*')
+_STRING = re.compile(br'"(?:[^"\\]|\\.)*"', re.S)
+_STRUCTURE = re.compile(br'["\[\]{}]')
+_SCALAR = re.compile(br'[^,:\]}\s]+')
+
+#: Containers up to this many bytes are decoded to find their DataType
+SMALL_CONTAINER = 4096
+
+
+def skip_value(buffer, pos):
+    """The offset right after the JSON value starting at pos."""
+    char = buffer[pos:pos + 1]
+    if char == b'"':
+        match = _STRING.match(buffer, pos)
+    elif char in (b'[', b'{'):
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(buffer, pos)
+            if match is None:
+                break
+            char = match.group()
+            if char == b'"':
+                match = _STRING.match(buffer, match.start())
+                if match is None:
+                    break
+            elif char in (b'[', b'{'):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return match.end()
+            pos = match.end()
+    else:
+        match = _SCALAR.match(buffer, pos)
+    if match is None:
+        raise ValueError('Invalid JSON value at byte %d' % pos)
+    return match.end()
+
+
+def scan_children(buffer, start, pos, limit):
+    """Index up to limit children of the container starting at start.
+
+    Scanning begins at pos, which is right after the opening bracket for
+    the first call. Returns the (key, value_start, value_end) entries and
+    the offset to continue from, None once the container is exhausted.
+    """
+    is_dict = buffer[start:start + 1] == b'{'
+    close = b'}' if is_dict else b']'
+    entries = []
+    pos = _SPACE.match(buffer, pos).end()
+    if buffer[pos:pos + 1] == close:
+        return entries, None
+    while len(entries) < limit:
+        key = None
+        if is_dict:
+            end = skip_value(buffer, pos)
+            key = json.loads(buffer[pos:end].decode('utf-8'))
+            pos = _SPACE.match(buffer, end).end()
+            if buffer[pos:pos + 1] != b':':
+                raise ValueError("Expecting ':' at byte %d" % pos)
+            pos = _SPACE.match(buffer, pos + 1).end()
+        end = skip_value(buffer, pos)
+        entries.append((key, pos, end))
+        pos = _SPACE.match(buffer, end).end()
+        char = buffer[pos:pos + 1]
+        if char == close:
+            return entries, None
+        if char != b',':
+            raise ValueError("Expecting ',' at byte %d" % pos)
+        pos = _SPACE.match(buffer, pos + 1).end()
+    return entries, pos
+
+
+class MappedNode(object):
+    """A row of the JsonMapModel, pointing at its value in the file.
+
+    The DataType is worked out the first time the row is shown. Container
+    nodes index their children in batches, `scan` is the offset to
+    continue from and None once all children are known.
+    """
+
+    __slots__ = (
+        'parent', 'position', 'key', 'start', 'end', 'datatype', 'schema',
+        'children', 'scan')
+
+    def __init__(self, parent, position, key, start, end, schema):
+        self.parent = parent
+        self.position = position
+        self.key = key
+        self.start = start
+        self.end = end
+        self.schema = schema
+        self.datatype = None
+        self.children = None
+        self.scan = None
+
+
+class JsonMapModel(QtCore.QAbstractItemModel):
+    """Read-only model of a memory-mapped JSON file.
+
+    Only the byte offsets of the children of expanded containers are kept,
+    values are decoded when the view asks for them and held in a bounded
+    cache. Large documents can be inspected with memory proportional to
+    what is on screen rather than to the size of the file.
+    """
+
+    NON_DEFAULT_COLOR = QtCore.Qt.yellow
+    HEADERS = ['Key', 'Value']
+
+    def __init__(self, parent=None, path=None, schema=None, batch_size=1000,
+                 cache_size=10000):
+        super(JsonMapModel, self).__init__(parent)
+        self.editable_keys = False
+        self.editable_values = False
+        self.schema = schema or {}
+        self.schema_index = SchemaIndex(self.schema)
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._file = None
+        self._buffer = None
+        self._root = None
+        self._values = OrderedDict()
+        if path is not None:
+            self.open(path, schema)
+
+    def open(self, path, schema=None):
+        """Map the file at the given path and show its top level.
+
+        The file is mapped and its top level indexed before the model is
+        reset, so the previous document is kept if that fails.
+        """
+        json_file = open(path, 'rb')
+        buffer = None
+        try:
+            try:
+                buffer = mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                buffer = None
+            start = _SPACE.match(buffer, 0).end() if buffer is not None else 0
+            if buffer is None or buffer[start:start + 1] not in (b'[', b'{'):
+                raise ValueError(
+                    'The top level of the document must be an array or an object')
+            end = len(buffer)
+            while buffer[end - 1:end] in (b' ', b'\t', b'\n', b'\r'):
+                end -= 1
+            entries, scan = scan_children(buffer, start, start + 1, self.batch_size)
+        except Exception:
+            if buffer is not None:
+                buffer.close()
+            json_file.close()
+            raise
+        schema_index = SchemaIndex(schema or {})
+        self.beginResetModel()
+        try:
+            self.close()
+            self.schema = schema_index.schema
+            self.schema_index = schema_index
+            self._file = json_file
+            self._buffer = buffer
+            self._root = MappedNode(None, -1, None, start, end, schema_index.root)
+            self._root.datatype = match_type(
+                [] if buffer[start:start + 1] == b'[' else {})
+            self._root.children = []
+            self._add_children(self._root, entries, scan)
+        finally:
+            self.endResetModel()
+
+    def close(self):
+        """Release the mapped file."""
+        self._values.clear()
+        self._root = None
+        if self._buffer is not None:
+            self._buffer.close()
+            self._file.close()
+        self._buffer = self._file = None
+
+    def serialize(self):
+        """Decode the whole document."""
+        root = self._root
+        if root is None:
+            return None
+        return json.loads(self._buffer[root.start:root.end].decode('utf-8'))
+
+    def value(self, index):
+        """The decoded value of the given index, containers included."""
+        node = self.node(index)
+        if node is None:
+            return None
+        return json.loads(self._buffer[node.start:node.end].decode('utf-8'))
+
+    def key_path(self, index):
+        """The dict keys and list indices leading to the given index."""
+        path = []
+        node = self.node(index)
+        while node is not None and node.parent is not None:
+            path.append(node.position if node.key is None else node.key)
+            node = node.parent
+        return tuple(reversed(path))
+
+    def node(self, index):
+        """The node of the given index, the root node if invalid."""
+        if index.isValid():
+            return index.internalPointer()
+        return self._root
+
+    def _decode(self, node):
+        """Decode the value of a leaf node through the bounded cache."""
+        value = self._values.pop(node.start, None)
+        if value is None:
+            value = json.loads(self._buffer[node.start:node.end].decode('utf-8'))
+        self._values[node.start] = value
+        if len(self._values) > self.cache_size:
+            self._values.popitem(last=False)
+        return value
+
+    def _datatype(self, node):
+        """Resolve the DataType of the node, decoding small values only.
+
+        Large containers are assumed to be plain lists and dicts unless the
+        schema assigns another container DataType, small ones are decoded
+        so DataTypes like the RangeType still match them.
+        """
+        if node.datatype is not None:
+            return node.datatype
+        char = self._buffer[node.start:node.start + 1]
+        type_ = None
+        if char in (b'[', b'{') and node.end - node.start > SMALL_CONTAINER:
+            empty = [] if char == b'[' else {}
+            type_ = match_type(empty, entry=node.schema)
+            is_container = type_.children(empty) is not None
+            # A DataType assigned by the schema might need the value
+            if not is_container:
+                type_ = None
+        if type_ is None:
+            value = self._decode(node)
+            type_ = match_type(value, entry=node.schema)
+            is_container = type_.children(value) is not None
+            if is_container:
+                self._values.pop(node.start, None)
+        node.datatype = type_
+        if is_container:
+            node.children = []
+            node.scan = node.start + 1
+        return type_
+
+    def _value(self, node):
+        """The decoded value of a leaf, None for containers."""
+        self._datatype(node)
+        if node.children is not None:
+            return None
+        return self._decode(node)
+
+    def _add_children(self, node, entries, scan):
+        """Create the nodes for a batch of indexed children of the node."""
+        node.scan = scan
+        child_entry = self.schema_index.child
+        children = node.children
+        for key, start, end in entries:
+            position = len(children)
+            children.append(MappedNode(
+                node, position, key, start, end,
+                child_entry(node.schema, position if key is None else key)))
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return False
+        node = self.node(parent)
+        if node is None:
+            return False
+        self._datatype(node)
+        if node.children:
+            return True
+        if node.scan is None:
+            return False
+        pos = _SPACE.match(self._buffer, node.scan).end()
+        return self._buffer[pos:pos + 1] not in (b']', b'}')
+
+    def canFetchMore(self, parent):
+        if parent.column() > 0:
+            return False
+        node = self.node(parent)
+        if node is None:
+            return False
+        self._datatype(node)
+        return node.scan is not None
+
+    def fetchMore(self, parent):
+        """Index the next batch of children of the given index."""
+        if not self.canFetchMore(parent):
+            return
+        node = self.node(parent)
+        entries, scan = scan_children(
+            self._buffer, node.start, node.scan, self.batch_size)
+        if not entries:
+            node.scan = None
+            return
+        first = len(node.children)
+        self.beginInsertRows(parent, first, first + len(entries) - 1)
+        self._add_children(node, entries, scan)
+        self.endInsertRows()
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        node = self.node(parent)
+        if node is None or not node.children or not 0 <= row < len(node.children):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index=None):
+        if index is None:
+            return super(JsonMapModel, self).parent()
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self._root:
+            return QtCore.QModelIndex()
+        return self.createIndex(parent.position, 0, parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = self.node(parent)
+        if node is None or not node.children:
+            return 0
+        return len(node.children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 2
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        node = index.internalPointer()
+        type_ = self._datatype(node)
+        if index.column() == 0:
+            return type_.key_flags(self, False)
+        return type_.value_flags(self, node.schema)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        type_ = self._datatype(node)
+        if index.column() == 0:
+            if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+                key = node.position if node.key is None else node.key
+                return key if isinstance(key, six.string_types) else str(key)
+            elif role == TypeRole:
+                return type_
+            elif role in PRESENTATION_ROLES:
+                return type_.role_data(
+                    self, 0, role, self._value(node), node.schema, index)
+            return None
+
+        if node.children is not None:
+            if role in PRESENTATION_ROLES:
+                return type_.role_data(self, 1, role, None, node.schema, index)
+            return None
+        value = self._value(node)
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return type_.display_value(value)
+        elif role == QtCore.Qt.UserRole:
+            return value
+        elif role == TypeRole:
+            return type_
+        elif role == SchemaRole:
+            return node.schema
+        elif role in PRESENTATION_ROLES:
+            if role == QtCore.Qt.ForegroundRole:
+                default = node.schema.get('default')
+                if default is not None and default != type_.display_value(value):
+                    return brush(self.NON_DEFAULT_COLOR)
+            return type_.role_data(self, 1, role, value, node.schema, index)
+        return None
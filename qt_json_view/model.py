@@ -1,15 +1,43 @@
-from Qt import QtGui, QtCore
+import re
+
+import six
+from Qt import QtGui, QtCore, QtWidgets
 from collections import OrderedDict
 
-from qt_json_view import datatypes
+from qt_json_view import (
+    batch, datatypes, loader, paths, profiling, undo, watcher, writer)
+
+from qt_json_view.datatypes import (
+    match_type, brush, buffers_to_lists, TypeRole, ListType, DictType,
+    BucketType, BufferType, SchemaRole, LazyRole, PRESENTATION_ROLES)
+from qt_json_view.paths import equal as _equal
+from qt_json_view.schema import SchemaIndex, EMPTY
 
-from qt_json_view.datatypes import match_type, TypeRole, ListType, DictType, SchemaRole
+_MISSING = object()
 
 
 class JsonModel(QtGui.QStandardItemModel):
-    """Represent JSON-serializable data."""
+    """Represent JSON-serializable data.
+
+    The value items that differ from their schema default are tracked by
+    their id, which is updated whenever a value changes. They are
+    highlighted with the NON_DEFAULT_COLOR.
+
+    The edits written back to the data_object are pushed onto the
+    undo_stack as commands holding the key path and the values before and
+    after the change. At most undo_limit commands are kept.
+
+    The key items are indexed by their key path once they are looked up,
+    so index_for_path and the other path based methods take constant time
+    for entries that were found before. Removed rows are dropped from the
+    index, it is cleared when list entries shift or keys are renamed.
+    """
 
     NON_DEFAULT_COLOR = QtCore.Qt.yellow
+    UNDO_LIMIT = 100
+    VALUE_ROLES = (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole, QtCore.Qt.UserRole)
+
+    modified_changed = QtCore.Signal(int)
 
     def __init__(
             self,
@@ -17,71 +45,1244 @@ class JsonModel(QtGui.QStandardItemModel):
             data=None,
             editable_keys=False,
             editable_values=False,
-            schema=None):
+            schema=None,
+            lazy=False,
+            bucket_size=None,
+            undo_limit=UNDO_LIMIT):
         super(JsonModel, self).__init__(parent=parent)
         self.data_object = data
         self.schema = schema
+        self.schema_index = SchemaIndex(schema)
+        self.editable_keys = editable_keys
+        self.editable_values = editable_values
+        self.lazy = lazy
+        self.bucket_size = bucket_size
+        self._loader = None
+        self._watcher = None
+        self._batch = None
+        self._modified = {}
+        self._path_items = {}
+        self._item_paths = {}
+        self._indexed_dicts = set()
+        self.undo_stack = QtWidgets.QUndoStack(self)
+        self.undo_stack.setUndoLimit(undo_limit)
+        # Connected first, so the set is up to date for all other slots
+        self.dataChanged.connect(self._data_changed)
+        self.rowsAboutToBeRemoved.connect(self._rows_removed)
+        self.rowsInserted.connect(self._rows_inserted)
+        self.rowsMoved.connect(self.forget_paths)
+        self.layoutChanged.connect(self.forget_paths)
         if data is not None:
-            self.init(data, editable_keys, editable_values, schema)
+            self.init(data, editable_keys, editable_values, schema, lazy,
+                      bucket_size)
+
+    def init(self, data, editable_keys=False, editable_values=False, schema=None,
+             lazy=False, bucket_size=None):
+        """Convert the data to items and populate the model.
+
+        In lazy mode only the top level items are created, the children of
+        a container are added the first time the view fetches them.
 
-    def init(self, data, editable_keys=False, editable_values=False, schema=None):
-        """Convert the data to items and populate the model."""
+        Lists and dicts with more than bucket_size entries are shown as
+        buckets of up to bucket_size entries, see datatypes.BucketType.
+        """
+        if self._loader is not None:
+            self._loader.cancel()
+            self._loader = None
+        self._modified = {}
+        self.forget_paths()
+        self.undo_stack.clear()
         self.clear()
         self.setHorizontalHeaderLabels(['Key', 'Value'])
         self.data_object = data
         self.editable_keys = editable_keys
         self.editable_values = editable_values
+        self.lazy = lazy
+        self.bucket_size = bucket_size
         self.schema = schema or {}
-        self.current_schema = self.schema
-        self.prev_schemas = []
+        self.schema_index = SchemaIndex(self.schema)
         parent = self.invisibleRootItem()
         type_ = match_type(data)
         parent.setData(type_, TypeRole)
         type_.next(model=self, data=data, parent=parent)
 
-    def serialize(self):
-        """Assemble the model back into a dict or list."""
+    def load(self, source, editable_keys=False, editable_values=False,
+             schema=None, lazy=False, batch_time=0.01, chunk_size=65536,
+             bucket_size=None):
+        """Populate the model progressively from a JSON file path or file object.
+
+        The file is parsed in chunks and the top level rows are appended from
+        the event loop in batches of at most batch_time seconds. Returns the
+        JsonLoader, connect to its progress, finished and failed signals.
+        The other arguments are the same as for init.
+        """
+        stream = loader.JsonStream(source, chunk_size)
+        try:
+            data = stream.container()
+        except ValueError:
+            stream.close()
+            raise
+        self.init(data, editable_keys, editable_values, schema, lazy, bucket_size)
+        self._loader = loader.JsonLoader(self, stream, batch_time)
+        self._loader.start()
+        return self._loader
+
+    def watch(self, path, interval=500):
+        """Show the JSON file at the given path and follow its changes.
+
+        The file is reloaded at most once per interval in milliseconds,
+        parsed in a background thread and applied through update_data.
+        Returns the JsonFileWatcher, call its stop method to stop watching.
+        """
+        if self._watcher is not None:
+            self._watcher.stop()
+        self._watcher = watcher.JsonFileWatcher(self, path, interval)
+        self._watcher.reload()
+        return self._watcher
+
+    def update_data(self, data):
+        """Change the model to represent the given data, touching only what differs.
+
+        Changed values are updated in place, missing entries are removed and
+        new ones inserted, so the view keeps its expanded rows, selection and
+        scroll position. An entry whose DataType changed is replaced by a new
+        row at the same position. The model is only rebuilt if the type of the
+        top level changed.
+
+        Subtrees that compare equal to the current data_object are skipped
+        without looking at their items, pass a new object rather than the
+        data_object changed in place. The undo history is cleared.
+        """
+        self.undo_stack.clear()
+        root = self.invisibleRootItem()
+        type_ = root.data(TypeRole)
+        if type_ is None or match_type(data).__class__ is not type_.__class__:
+            self.init(data, self.editable_keys, self.editable_values, self.schema,
+                      self.lazy, self.bucket_size)
+            return
+        old = self.data_object if self.data_object is not data else _MISSING
+        self.data_object = data
+        self._update_children(root, type_, data, self.schema_index.root, old)
+
+    def _update_children(self, parent, type_, data, schema, old=_MISSING):
+        """Update the child rows of the parent item to the given container.
+
+        The previous data of the container is used to skip unchanged entries.
+        """
+        if parent.data(LazyRole) is not None:
+            parent.setData((data, ), LazyRole)
+            return
+        if self._has_buckets(parent, data):
+            # Rebuild the buckets, their rows do not line up with the entries
+            if not _equal(old, data):
+                parent.removeRows(0, parent.rowCount())
+                type_.next(model=self, data=data, parent=parent)
+            return
+        is_list = isinstance(type_, ListType)
+        entries = list(type_.children(data))
+        if type(old) is not type(data):
+            old = _MISSING
+        elif parent.rowCount() == len(entries) and (
+                len(old) == len(data) if is_list else list(old) == list(data)):
+            # Same keys in the same order, the rows line up with the entries
+            for row, (key, value) in enumerate(entries):
+                self._update_row(parent, type_, row, key, value, schema, old[key])
+            return
+        keys = set(key for key, _ in entries)
+
+        def key_at(row):
+            return row if is_list else parent.child(row, 0).data(QtCore.Qt.DisplayRole)
+
+        last = parent.rowCount() - 1
+        while last >= 0:
+            if key_at(last) in keys:
+                last -= 1
+                continue
+            first = last
+            while first > 0 and key_at(first - 1) not in keys:
+                first -= 1
+            parent.removeRows(first, last - first + 1)
+            last = first - 1
+
+        for row, (key, value) in enumerate(entries):
+            if row < parent.rowCount():
+                if key_at(row) == key:
+                    old_value = _MISSING
+                    if old is _MISSING:
+                        pass
+                    elif not is_list:
+                        old_value = old.get(key, _MISSING)
+                    elif key < len(old):
+                        old_value = old[key]
+                    self._update_row(parent, type_, row, key, value, schema, old_value)
+                    continue
+                # The entry moved, rebuild it at its new position
+                for old_row in range(row + 1, parent.rowCount()):
+                    if key_at(old_row) == key:
+                        parent.removeRow(old_row)
+                        break
+            type_.insert_child(self, row, key, value, parent, schema)
+
+    def _has_buckets(self, parent, data):
+        """Whether the children of the parent are, or will be, in buckets."""
+        if self.bucket_size and len(data) > self.bucket_size:
+            return True
+        return parent.rowCount() > 0 and isinstance(
+            parent.child(0, 0).data(TypeRole), BucketType)
+
+    def _update_row(self, parent, parent_type, row, key, value, schema,
+                    old_value=_MISSING):
+        if _equal(old_value, value):
+            return
+        key_item = parent.child(row, 0)
+        entry = self.schema_index.child(schema, key)
+        type_ = match_type(value, entry=entry)
+        if type_.__class__ is not key_item.data(TypeRole).__class__ or (
+                type_.LAZY_CHILDREN):
+            parent.removeRow(row)
+            parent_type.insert_child(self, row, key, value, parent, schema)
+        elif type_.children(value) is not None:
+            self._update_children(key_item, type_, value, entry, old_value)
+        else:
+            value_item = parent.child(row, 1)
+            # Edits only set the DisplayRole of most DataTypes, compare both
+            display = type_.display_value(value)
+            if _equal(value_item.data(QtCore.Qt.UserRole), value) and _equal(
+                    value_item.data(QtCore.Qt.DisplayRole), display):
+                return
+            # Set both roles silently and announce them in a single signal
+            blocked = self.blockSignals(True)
+            value_item.setData(display, QtCore.Qt.DisplayRole)
+            value_item.setData(value, QtCore.Qt.UserRole)
+            self.blockSignals(blocked)
+            index = value_item.index()
+            self.dataChanged.emit(index, index, [
+                QtCore.Qt.DisplayRole, QtCore.Qt.EditRole, QtCore.Qt.UserRole])
+
+    def serialize(self, buffers_as_lists=False):
+        """Assemble the model back into a dict or list.
+
+        Buffers like NumPy arrays are returned as they are, unless
+        buffers_as_lists is set.
+        """
         parent = self.invisibleRootItem()
         type_ = parent.data(TypeRole)
         data = type_.empty_container()
         type_.serialize(model=self, item=parent, data=data, parent=parent)
+        if buffers_as_lists:
+            data = buffers_to_lists(data)
         return data
 
-    def data(self, index, role):
-        if index.column() == 1 and role == QtCore.Qt.ForegroundRole:
-            schema = index.data(SchemaRole) or {}
-            default = schema.get('default')
-            if default is not None and default != index.data(QtCore.Qt.DisplayRole):
-                return QtGui.QBrush(self.NON_DEFAULT_COLOR)
+    def dump(self, target, indent=None, sort_keys=False, threaded=False):
+        """Write the model as JSON text to a file path or file object.
+
+        The text is the same as json.dumps of serialize(), with buffers
+        converted to lists. It is encoded while walking the items, without
+        assembling the data first.
+
+        With threaded, a snapshot is taken right away and written in a
+        worker thread. Returns the JsonDumper, connect to its finished and
+        failed signals. The file object must not be used until finished.
+        """
+        if threaded:
+            dumper = writer.JsonDumper(self, target, indent, sort_keys)
+            dumper.start()
+            return dumper
+        json_writer = writer.JsonWriter(self, indent, sort_keys)
+        if isinstance(target, six.string_types):
+            with open(target, 'wb') as json_file:
+                json_writer.dump(json_file)
+        else:
+            json_writer.dump(target)
+
+    def key_path(self, index):
+        """The dict keys and list indices leading to the given index."""
+        path = []
+        item = self.itemFromIndex(index.sibling(index.row(), 0))
+        while item is not None:
+            parent = item.parent() or self.invisibleRootItem()
+            parent_type = parent.data(TypeRole)
+            if isinstance(item.data(TypeRole), BucketType):
+                pass
+            elif isinstance(parent_type, (ListType, BufferType)):
+                path.append(item.row())
+            elif isinstance(parent_type, BucketType) and (
+                    parent.data(QtCore.Qt.UserRole) is not None):
+                path.append(parent.data(QtCore.Qt.UserRole) + item.row())
+            else:
+                path.append(item.data(QtCore.Qt.DisplayRole))
+            item = item.parent()
+        return tuple(reversed(path))
+
+    def write_back(self, index):
+        """Patch the value of the given index into the data_object.
+
+        Only the entry itself is serialized, so an edit costs O(depth)
+        instead of serializing the whole document. The change is pushed
+        onto the undo_stack.
+        """
+        path = self.key_path(index)
+        if not path:
+            return
+        item = self.itemFromIndex(index.sibling(index.row(), 0))
+        parent = item.parent() or self.invisibleRootItem()
+        data = []
+        item.data(TypeRole).serialize(model=self, item=item, data=data, parent=parent)
+        old = paths.get_value(self.data_object, path)
+        paths.set_value(self.data_object, path, data[0])
+        if not _equal(old, data[0]):
+            self.undo_stack.push(undo.EditCommand(self, path, old, data[0]))
+
+    def write_back_key(self, index, old_key):
+        """Rename the key of the given index in the data_object."""
+        path = self.key_path(index)
+        if path and old_key != path[-1]:
+            paths.rename_key(self.data_object, path[:-1], old_key, path[-1])
+            self.undo_stack.push(
+                undo.RenameCommand(self, path[:-1], old_key, path[-1]))
+
+    def set_undo_limit(self, limit):
+        """Keep at most limit undo commands, 0 for no limit.
+
+        The undo history is cleared.
+        """
+        self.undo_stack.clear()
+        self.undo_stack.setUndoLimit(limit)
+
+    def apply_value(self, path, value):
+        """Set the value at the key path in the data_object and the items.
+
+        Used by the undo commands, nothing is pushed onto the undo_stack.
+        Entries without items, like the children of unfetched rows, are
+        only changed in the data_object.
+        """
+        paths.set_value(self.data_object, path, value)
+        item = self._key_item(path)
+        if item is None:
+            return
+        parent = item.parent() or self.invisibleRootItem()
+        schema = self.schema_index.entry(path[:-1]) if (
+            self.schema_index.schema) else EMPTY
+        self._update_row(
+            parent, self._container_type(parent), item.row(), path[-1], value, schema)
+
+    def apply_key(self, path, old_key, new_key):
+        """Rename a key of the dict at the key path in the data_object and the items.
+
+        Used by the undo commands, nothing is pushed onto the undo_stack.
+        """
+        item = self._key_item(path + (old_key, ))
+        paths.rename_key(self.data_object, path, old_key, new_key)
+        if item is not None:
+            item.setData(new_key, QtCore.Qt.DisplayRole)
+
+    def index_for_path(self, path, column=0):
+        """The index of the entry at the key path or JSON pointer.
+
+        Return an invalid index if the path does not exist or the entry
+        has no row yet, like the children of rows that were not fetched.
+        """
+        try:
+            path = self._key_path(path)
+        except KeyError:
+            return QtCore.QModelIndex()
+        item = self._key_item(path)
+        if item is None:
+            return QtCore.QModelIndex()
+        index = item.index()
+        return index if column == 0 else index.sibling(index.row(), column)
+
+    def path_of(self, index):
+        """The JSON pointer of the given index."""
+        return paths.to_pointer(self.key_path(index))
+
+    def value_at(self, path):
+        """The value at the key path or JSON pointer in the data_object.
+
+        Raise KeyError if a JSON pointer does not exist.
+        """
+        return paths.get_value(self.data_object, self._key_path(path))
+
+    def set_value_at(self, path, value):
+        """Set the value at the key path or JSON pointer.
+
+        The data_object and the items are updated, the change is not pushed
+        onto the undo_stack.
+        """
+        path = self._key_path(path)
+        if not path:
+            raise ValueError('The root can not be set, use update_data')
+        self.apply_value(path, value)
+
+    def set_values(self, changes):
+        """Set many values at once, given as a mapping or pairs of paths and values.
+
+        The paths are key paths or JSON pointers. The values are patched
+        into the data_object in one pass and the value items are updated
+        silently. The changed rows are then announced with one dataChanged
+        per range of adjacent rows. Values that change their DataType or
+        are containers are updated like in update_data. The changes are
+        not pushed onto the undo_stack.
+
+        All paths are resolved before anything is changed, KeyError is
+        raised if one of them does not exist.
+        """
+        if isinstance(changes, dict):
+            changes = changes.items()
+        resolved = []
+        for path, value in changes:
+            path = self._key_path(path)
+            if not path:
+                raise ValueError('The root can not be set, use update_data')
+            try:
+                paths.get_value(self.data_object, path[:-1])
+            except (LookupError, TypeError):
+                raise KeyError(path)
+            resolved.append((path, value))
+        changed = {}
+        replaced = []
+        blocked = self.blockSignals(True)
+        try:
+            for path, value in resolved:
+                paths.set_value(self.data_object, path, value)
+                item = self._key_item(path)
+                if item is None:
+                    continue
+                entry = self.schema_index.entry(path) if self.schema_index.schema else EMPTY
+                type_ = match_type(value, entry=entry)
+                if type_.__class__ is not item.data(TypeRole).__class__ or (
+                        type_.LAZY_CHILDREN or type_.children(value) is not None):
+                    replaced.append((path, value))
+                    continue
+                parent = item.parent() or self.invisibleRootItem()
+                value_item = parent.child(item.row(), 1)
+                display = type_.display_value(value)
+                if _equal(value_item.data(QtCore.Qt.UserRole), value) and _equal(
+                        value_item.data(QtCore.Qt.DisplayRole), display):
+                    continue
+                value_item.setData(display, QtCore.Qt.DisplayRole)
+                value_item.setData(value, QtCore.Qt.UserRole)
+                changed.setdefault(id(parent), (parent, set()))[1].add(item.row())
+        finally:
+            # Announce what was changed, even if a value could not be set
+            self.blockSignals(blocked)
+            self._emit_value_ranges(changed.values())
+            for path, value in replaced:
+                self.apply_value(path, value)
+
+    def _emit_value_ranges(self, changed):
+        """Emit dataChanged for the value items of the (parent, rows) pairs."""
+        roles = [QtCore.Qt.DisplayRole, QtCore.Qt.EditRole, QtCore.Qt.UserRole]
+        for parent, rows in changed:
+            parent_index = parent.index()
+            rows = sorted(rows)
+            first = rows[0]
+            for previous, row in zip(rows, rows[1:] + [None]):
+                if row == previous + 1:
+                    continue
+                self.dataChanged.emit(
+                    self.index(first, 1, parent_index),
+                    self.index(previous, 1, parent_index), roles)
+                first = row
+
+    def batch_updater(self, interval=16):
+        """The JsonBatchUpdater applying queued changes at most once per interval.
+
+        Changes can be queued from any thread through its put and update
+        methods, they are applied through set_values.
+        """
+        if self._batch is None:
+            self._batch = batch.JsonBatchUpdater(self, interval)
+        else:
+            self._batch.interval = interval
+        return self._batch
+
+    def forget_paths(self, *args):
+        """Clear the index of the key items by their key path."""
+        self._path_items = {}
+        self._item_paths = {}
+        self._indexed_dicts = set()
+
+    def _key_path(self, path):
+        if isinstance(path, six.string_types):
+            return paths.from_pointer(self.data_object, path)
+        return tuple(path)
+
+    def _key_item(self, path):
+        """The key item of the entry at the key path, None if it has no row yet."""
+        item = self._path_items.get(path)
+        if item is not None or not path:
+            return item
+        parent = self.invisibleRootItem()
+        container = self.data_object
+        for depth in range(len(path)):
+            key = path[depth]
+            item = self._path_items.get(path[:depth + 1])
+            if item is None:
+                item = self._find_child(parent, container, path[:depth], key)
+                if item is None:
+                    return None
+            parent = item
+            container = container[key]
+        return item
+
+    def _find_child(self, parent, container, parent_path, key):
+        """Find and index the key item of the entry of the parent item.
+
+        The rows of list entries line up with their indices, buckets are
+        descended by the range of entries they hold. The rows of a dict are
+        scanned once and all their key items indexed, rows inserted later
+        are indexed as they are added, see _rows_inserted.
+        """
+        if isinstance(container, dict):
+            if id(parent) not in self._indexed_dicts:
+                self._indexed_dicts.add(id(parent))
+                self._index_rows(parent_path, parent, 0, parent.rowCount() - 1)
+            return self._path_items.get(parent_path + (key, ))
+        if parent.data(LazyRole) is not None or not parent.rowCount():
+            return None
+        container_type = parent.data(TypeRole)
+        start, end = 0, len(container)
+        if not isinstance(key, six.integer_types) or not 0 <= key < end:
+            return None
+        first = parent.child(0, 0)
+        while isinstance(first.data(TypeRole), BucketType):
+            span = size = first.data(TypeRole).size(self, container_type)
+            while end - start > span * size:
+                span *= size
+            bucket = (key - start) // span
+            parent = parent.child(bucket, 0)
+            start, end = start + bucket * span, min(start + (bucket + 1) * span, end)
+            if parent.data(LazyRole) is not None or not parent.rowCount():
+                return None
+            first = parent.child(0, 0)
+        if key - start >= parent.rowCount():
+            return None
+        item = parent.child(key - start, 0)
+        self._index_path(parent_path + (key, ), item)
+        return item
+
+    def _index_rows(self, path, parent, first, last):
+        """Index the key items of the dict rows, including those in buckets."""
+        stack = [parent.child(row, 0) for row in range(first, last + 1)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item.data(TypeRole), BucketType):
+                stack.extend(item.child(row, 0) for row in range(item.rowCount()))
+            else:
+                self._index_path(path + (item.data(QtCore.Qt.DisplayRole), ), item)
+
+    def _index_path(self, path, item):
+        self._path_items[path] = item
+        self._item_paths[id(item)] = path
+
+    def _move_paths(self, moves):
+        """Change the indexed key paths of the (key item, old path, new path) subtrees."""
+        changed = []
+        for root, old, new in moves:
+            stack = [root]
+            while stack:
+                item = stack.pop()
+                children = [item.child(row, 0) for row in range(item.rowCount())]
+                if isinstance(item.data(TypeRole), BucketType):
+                    stack.extend(children)
+                    continue
+                path = self._item_paths.get(id(item))
+                # Descendants are only indexed below indexed items
+                if path is None or path[:len(old)] != old:
+                    continue
+                changed.append((item, path, new + path[len(old):]))
+                stack.extend(children)
+        for item, path, _ in changed:
+            if self._path_items.get(path) is item:
+                del self._path_items[path]
+        for item, _, path in changed:
+            self._index_path(path, item)
+
+    def _shift_rows(self, parent, first, offset):
+        """Move the indices of the list rows from the first row by the offset."""
+        moves = []
+        for row in range(first, parent.rowCount()):
+            item = parent.child(row, 0)
+            path = self._item_paths.get(id(item))
+            if path is not None:
+                moves.append((item, path, path[:-1] + (path[-1] + offset, )))
+        self._move_paths(moves)
+
+    def _container_type(self, item):
+        """The DataType of the container the children of the item belong to."""
+        while isinstance(item.data(TypeRole), BucketType):
+            item = item.parent() or self.invisibleRootItem()
+        return item.data(TypeRole)
+
+    def _is_list_like(self, item):
+        """Whether the rows of the children of the item are their keys."""
+        type_ = item.data(TypeRole)
+        if isinstance(type_, BucketType):
+            return item.data(QtCore.Qt.UserRole) is not None
+        return isinstance(type_, (ListType, BufferType))
+
+    def schema_entry(self, index):
+        """The schema entry of the given index, looked up by its key path."""
+        if not self.schema_index.schema:
+            return EMPTY
+        return self.schema_index.entry(self.key_path(index))
+
+    def update_modified(self, item, schema=None):
+        """Track whether the value item differs from its schema default."""
+        if schema is None:
+            if not self.schema_index.schema:
+                return
+            schema = self.schema_entry(item.index())
+        default = schema.get('default') if schema else None
+        if default is not None and default != item.data(QtCore.Qt.DisplayRole):
+            self._modified[id(item)] = item
+        else:
+            self._modified.pop(id(item), None)
+
+    def is_modified(self, index):
+        """Whether the value of the row differs from its schema default."""
+        return id(self.itemFromIndex(index.sibling(index.row(), 1))) in self._modified
+
+    def modified_count(self):
+        return len(self._modified)
+
+    def modified_indexes(self):
+        """The value indexes that differ from their schema default."""
+        return [item.index() for item in self._modified.values()]
+
+    def modified_paths(self):
+        """The key paths of the values that differ from their schema default."""
+        return [self.key_path(item.index()) for item in self._modified.values()]
+
+    def _data_changed(self, top_left, bottom_right, roles=()):
+        """Update the modified values and key paths of the changed rows.
+
+        Renaming a key can change the schema of all its descendants, and
+        changes the key paths of the whole subtree.
+        """
+        if self._path_items and top_left.column() == 0 and (
+                not roles or QtCore.Qt.DisplayRole in roles
+                or QtCore.Qt.EditRole in roles):
+            self._rename_paths(top_left, bottom_right)
+        if not self.schema_index.schema:
+            return
+        if roles and not any(role in self.VALUE_ROLES for role in roles):
+            return
+        count = len(self._modified)
+        parent = top_left.parent()
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            if top_left.column() == 0:
+                self._update_subtree(self.index(row, 0, parent))
+            if bottom_right.column() >= 1:
+                self.update_modified(self.itemFromIndex(self.index(row, 1, parent)))
+        if len(self._modified) != count:
+            self.modified_changed.emit(len(self._modified))
+
+    def _rename_paths(self, top_left, bottom_right):
+        """Move the indexed key paths of the renamed dict rows."""
+        parent = self.itemFromIndex(top_left.parent()) or self.invisibleRootItem()
+        if self._is_list_like(parent):
+            return
+        moves = []
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            item = parent.child(row, 0)
+            path = self._item_paths.get(id(item))
+            key = item.data(QtCore.Qt.DisplayRole)
+            if path is not None and path[-1] != key:
+                moves.append((item, path, path[:-1] + (key, )))
+        self._move_paths(moves)
+
+    def _update_subtree(self, index):
+        stack = [self.itemFromIndex(index)]
+        while stack:
+            item = stack.pop()
+            for row in range(item.rowCount()):
+                self.update_modified(item.child(row, 1))
+                stack.append(item.child(row, 0))
+
+    def _rows_inserted(self, parent, first, last):
+        """Shift the list entries after the new rows, index new rows of indexed dicts."""
+        if not self._path_items and not self._indexed_dicts:
+            return
+        parent_item = self.itemFromIndex(parent) or self.invisibleRootItem()
+        if self._is_list_like(parent_item):
+            self._shift_rows(parent_item, last + 1, last - first + 1)
+            return
+        root = self.invisibleRootItem()
+        container = parent_item
+        while isinstance(container.data(TypeRole), BucketType):
+            container = container.parent() or root
+        if id(container) not in self._indexed_dicts:
+            return
+        path = () if container is root else self._item_paths.get(id(container))
+        if path is not None:
+            self._index_rows(path, parent_item, first, last)
+
+    def _rows_removed(self, parent, first, last):
+        """Forget the modified values and key paths of the rows that are about to be removed."""
+        if not self._modified and not self._path_items and not self._indexed_dicts:
+            return
+        count = len(self._modified)
+        parent_item = self.itemFromIndex(parent) or self.invisibleRootItem()
+        stack = [parent_item.child(row, 0) for row in range(first, last + 1)]
+        for row in range(first, last + 1):
+            self._modified.pop(id(parent_item.child(row, 1)), None)
+        while stack:
+            item = stack.pop()
+            self._indexed_dicts.discard(id(item))
+            path = self._item_paths.pop(id(item), None)
+            if path is not None and self._path_items.get(path) is item:
+                del self._path_items[path]
+            for row in range(item.rowCount()):
+                self._modified.pop(id(item.child(row, 1)), None)
+                stack.append(item.child(row, 0))
+        if self._path_items and self._is_list_like(parent_item):
+            self._shift_rows(parent_item, last + 1, first - last - 1)
+        if len(self._modified) != count:
+            self.modified_changed.emit(len(self._modified))
 
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if self.canFetchMore(parent):
+            return True
+        return super(JsonModel, self).hasChildren(parent)
+
+    def canFetchMore(self, parent):
+        if parent.isValid() and parent.column() == 0:
+            return parent.data(LazyRole) is not None
+        return False
+
+    def fetchMore(self, parent):
+        """Add the deferred children of the given index."""
+        if not self.canFetchMore(parent):
+            return
+        item = self.itemFromIndex(parent)
+        data, = item.data(LazyRole)
+        item.setData(None, LazyRole)
+        item.data(TypeRole).next(model=self, data=data, parent=item)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        """Serve the PRESENTATION_ROLES from the DataTypes of the items.
+
+        The items do not store brushes, fonts, icons and tooltips, they are
+        requested from DataType.role_data whenever the view asks for them.
+        """
+        if role in PRESENTATION_ROLES and index.isValid():
+            return self.role_data(index, role)
+        if role == SchemaRole:
+            return self.schema_entry(index) if index.isValid() else None
         return super(JsonModel, self).data(index, role)
 
+    def role_data(self, index, role):
+        """The data of one of the PRESENTATION_ROLES for the given index."""
+        column = index.column()
+        item = self.itemFromIndex(index)
+        if column == 1 and role == QtCore.Qt.ForegroundRole and id(item) in self._modified:
+            return brush(self.NON_DEFAULT_COLOR)
+        data = item.data(role)
+        if data is not None:
+            return data
+        schema = EMPTY
+        if column == 0:
+            type_ = item.data(TypeRole)
+            value = None
+        else:
+            schema = self.schema_entry(index)
+            parent = item.parent() or self.invisibleRootItem()
+            type_ = parent.child(index.row(), 0).data(TypeRole)
+            value = item.data(QtCore.Qt.UserRole)
+        if type_ is None:
+            return None
+        return type_.role_data(self, column, role, value, schema, index)
+
 
 class JsonSortFilterProxyModel(QtCore.QSortFilterProxyModel):
-    """Show ALL occurences by keeping the parents of each occurence visible."""
+    """Show ALL occurences by keeping the parents of each occurence visible.
+
+    Whether a row matches the filter is worked out for all rows in a single
+    pass whenever the filter or the source model changes, filterAcceptsRow
+    then only has to look up the result. The filter key column is matched
+    for every row, the tree structure is taken from the first column.
+
+    A filter set through setFilterFixedString matches plain substrings,
+    setFilterRegExp patterns are compiled once per pass.
+
+    Set modified_only to only show the values of a JsonModel that differ
+    from their schema default, and their parents.
+
+    Source data changes are ignored unless they touch the filter role and
+    column. The matches of changed rows are worked out again one by one,
+    together with their ancestors, only structural changes start a new pass.
+    """
 
     def __init__(self, parent=None):
         super(JsonSortFilterProxyModel, self).__init__(parent=parent)
         self.keep_children = False
+        self.modified_only = False
+        self._state = None
+        self._accepted = None
+        self._accepted_keep_children = None
+        self._dirty = True
+        self._modified_rows = None
 
     def filterAcceptsRow(self, sourceRow, sourceParent):
         """Accept the row if the parent has been accepted."""
-        index = self.sourceModel().index(sourceRow, self.filterKeyColumn(), sourceParent)
+        index = self.sourceModel().index(sourceRow, 0, sourceParent)
+        if self.modified_only and not self.accept_modified(index):
+            return False
         return self.accept_index(index)
 
+    def accept_modified(self, index):
+        """Accept rows that are modified or have a modified descendant."""
+        if self._modified_rows is None:
+            self._modified_rows = modified_rows(self.sourceModel())
+        return row_key(index) in self._modified_rows
+
     def accept_index(self, index):
-        if index.isValid():
-            text = str(index.data(self.filterRole()))
-            if self.filterRegExp().indexIn(text) >= 0:
-                return True
-            if self.keep_children:
-                parent = index.parent()
-                while parent.isValid():
-                    parent_text = str(parent.data(self.filterRole()))
-                    if self.filterRegExp().indexIn(parent_text) >= 0:
-                        return True
-                    parent = parent.parent()
-            for row in range(index.model().rowCount(index)):
-                if self.accept_index(index.model().index(row, self.filterKeyColumn(), index)):
-                    return True
-        return False
+        if not index.isValid():
+            return False
+        if self._dirty or self._accepted_keep_children != self.keep_children:
+            self._state = self.match_state()
+            self._accepted = None if self._state is None else self._state.accepted
+            self._accepted_keep_children = self.keep_children
+            self._dirty = False
+        return self._accepted is None or row_key(index) in self._accepted
+
+    def accepted_rows(self):
+        """The row_keys of all accepted source rows, None to accept all."""
+        state = self.match_state()
+        return None if state is None else state.accepted
+
+    def match_state(self):
+        """Match all source rows, None if the filter accepts all."""
+        matcher = self.matcher()
+        if matcher is None or self.sourceModel() is None:
+            return None
+        rows = snapshot(self.sourceModel(), self.filterKeyColumn(), self.filterRole())
+        return MatchState.build(rows, matcher, self.keep_children)
+
+    def filters_data(self, top_left, bottom_right, roles=()):
+        """Whether the changed data is in the filter role and column."""
+        if roles:
+            role = self.filterRole()
+            text_roles = (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole)
+            if role not in roles and not (
+                    role in text_roles and any(r in text_roles for r in roles)):
+                return False
+        column = self.filterKeyColumn()
+        return column < 0 or top_left.column() <= column <= bottom_right.column()
+
+    def update_matches(self, top_left, bottom_right):
+        """Match the changed source rows again and update their ancestors.
+
+        The rows that change whether they are accepted are filtered by the
+        base class, the whole filter is only applied again if an ancestor
+        changed too, or if the changed rows can not be updated one by one.
+        """
+        state = self._state
+        if self._dirty or state is None:
+            return
+        if state.keep_children != self.keep_children:
+            self._refilter()
+            return
+        model = self.sourceModel()
+        parent = top_left.parent()
+        column = self.filterKeyColumn()
+        columns = range(model.columnCount(parent)) if column < 0 else [column]
+        role = self.filterRole()
+        refilter = False
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            index = model.index(row, 0, parent)
+            key = row_key(index)
+            if key not in state.parents:
+                self._refilter()
+                return
+            match = any(state.matcher(str(model.index(row, c, parent).data(role)))
+                        for c in columns)
+            if match == (key in state.matches):
+                continue
+            if state.keep_children and model.hasChildren(index):
+                # The matches of all descendants change
+                self._refilter()
+                return
+            refilter = state.set_match(key, match) or refilter
+        if refilter:
+            QtCore.QSortFilterProxyModel.invalidateFilter(self)
+
+    def _refilter(self):
+        """Match all rows again and filter the whole tree."""
+        self._state = None
+        self.invalidateFilter()
+
+    def matcher(self):
+        """Compile the filter into a function matching a string.
+
+        Return None if the filter is empty and all rows are accepted.
+        """
+        regexp = self.filterRegExp()
+        pattern = regexp.pattern()
+        if not pattern:
+            return None
+        case_sensitive = regexp.caseSensitivity() == QtCore.Qt.CaseSensitive
+        syntax = regexp.patternSyntax()
+        if syntax == QtCore.QRegExp.FixedString:
+            if case_sensitive:
+                return lambda text: pattern in text
+            pattern = pattern.lower()
+            return lambda text: pattern in text.lower()
+        if syntax in (QtCore.QRegExp.RegExp, QtCore.QRegExp.RegExp2):
+            try:
+                return re.compile(pattern, 0 if case_sensitive else re.IGNORECASE).search
+            except re.error:
+                pass
+        regexp = QtCore.QRegExp(regexp)
+        return lambda text: regexp.indexIn(text) >= 0
+
+    def invalidate_matches(self):
+        """Recalculate the matches the next time a row is filtered."""
+        self._dirty = True
+
+    def setSourceModel(self, model):
+        source = self.sourceModel()
+        if source is not None:
+            for signal in self._source_signals(source):
+                signal.disconnect(self.invalidate_matches)
+                signal.disconnect(self._forget_modified_rows)
+            source.dataChanged.disconnect(self._source_data_changed)
+            if isinstance(source, JsonModel):
+                source.modified_changed.disconnect(self._modified_changed)
+        # Connect before the base class, so the matches are invalidated
+        # before the proxy filters the changed rows.
+        if model is not None:
+            for signal in self._source_signals(model):
+                signal.connect(self.invalidate_matches)
+                signal.connect(self._forget_modified_rows)
+            model.dataChanged.connect(self._source_data_changed)
+            if isinstance(model, JsonModel):
+                model.modified_changed.connect(self._modified_changed)
+        self.invalidate_matches()
+        self._forget_modified_rows()
+        super(JsonSortFilterProxyModel, self).setSourceModel(model)
+
+    def _forget_modified_rows(self, *args):
+        self._modified_rows = None
+
+    def _modified_changed(self, count):
+        """Filter all rows again, parents might have lost their last modified child."""
+        self._forget_modified_rows()
+        if self.modified_only:
+            self.invalidateFilter()
+
+    def _source_data_changed(self, top_left, bottom_right, roles=()):
+        self._forget_modified_rows()
+        if self.filters_data(top_left, bottom_right, roles):
+            self.update_matches(top_left, bottom_right)
+
+    def _source_signals(self, model):
+        """The structural changes of the source, which start a new pass."""
+        return (
+            model.rowsInserted, model.rowsRemoved,
+            model.rowsMoved, model.modelReset, model.layoutChanged)
+
+    def setFilterRegExp(self, *args):
+        self.invalidate_matches()
+        super(JsonSortFilterProxyModel, self).setFilterRegExp(*args)
+
+    def setFilterFixedString(self, pattern):
+        self.invalidate_matches()
+        super(JsonSortFilterProxyModel, self).setFilterFixedString(pattern)
+
+    def setFilterWildcard(self, pattern):
+        self.invalidate_matches()
+        super(JsonSortFilterProxyModel, self).setFilterWildcard(pattern)
+
+    def setFilterKeyColumn(self, column):
+        self.invalidate_matches()
+        super(JsonSortFilterProxyModel, self).setFilterKeyColumn(column)
+
+    def setFilterRole(self, role):
+        self.invalidate_matches()
+        super(JsonSortFilterProxyModel, self).setFilterRole(role)
+
+    def setFilterCaseSensitivity(self, sensitivity):
+        self.invalidate_matches()
+        super(JsonSortFilterProxyModel, self).setFilterCaseSensitivity(sensitivity)
+
+    def invalidateFilter(self):
+        self.invalidate_matches()
+        super(JsonSortFilterProxyModel, self).invalidateFilter()
+
+
+def row_key(index):
+    """Identify the row of the index, independent of its column."""
+    return (index.internalId(), index.row())
+
+
+def modified_rows(model):
+    """The row_keys of the modified rows of a JsonModel and their ancestors."""
+    rows = set()
+    for index in model.modified_indexes():
+        index = index.sibling(index.row(), 0)
+        while index.isValid():
+            key = row_key(index)
+            if key in rows:
+                break
+            rows.add(key)
+            index = index.parent()
+    return rows
+
+
+def snapshot(model, column, role):
+    """Collect the rows of the model for filtering.
+
+    Return the row_keys, the texts of the filter column and the position of
+    the parent row in these lists, -1 for top level rows. Parents always
+    come before their children. A column of -1 collects the texts of all
+    columns.
+    """
+    start = profiling.clock() if profiling.enabled else None
+    columns = range(model.columnCount()) if column < 0 else [column]
+    keys = []
+    texts = []
+    parents = []
+    stack = [(QtCore.QModelIndex(), -1)]
+    while stack:
+        parent, position = stack.pop()
+        for row in range(model.rowCount(parent)):
+            index = model.index(row, 0, parent)
+            keys.append(row_key(index))
+            texts.append(tuple(
+                str(model.index(row, c, parent).data(role)) for c in columns))
+            parents.append(position)
+            stack.append((index, len(keys) - 1))
+    if start is not None:
+        profiling.add('snapshot', None, start)
+    return keys, texts, parents
+
+
+def accepted_rows(rows, matcher, keep_children=False, cancelled=None):
+    """The keys of the rows that match, have a matching descendant or, with
+    keep_children, a matching ancestor.
+
+    Args:
+        rows (tuple): keys, texts and parents as collected by snapshot.
+        matcher (callable): Return True if the given text matches.
+        cancelled (callable): Checked every few rows, return None as soon
+            as it returns True.
+    """
+    state = MatchState.build(rows, matcher, keep_children, cancelled)
+    return None if state is None else state.accepted
+
+
+class MatchState(object):
+    """The matches of the rows collected by snapshot, by their row_keys.
+
+    A row is a hit if it matches or has a matching descendant, hits counts
+    the children of a row that are hits. This allows changing the match
+    of a single row in O(depth).
+    """
+
+    def __init__(self, matcher, keep_children=False):
+        self.matcher = matcher
+        self.keep_children = keep_children
+        self.parents = {}
+        self.matches = set()
+        self.hits = {}
+        self.inherited = set()
+        self.accepted = set()
+
+    @classmethod
+    def build(cls, rows, matcher, keep_children=False, cancelled=None):
+        """Match all rows, None if cancelled returned True."""
+        start = profiling.clock() if profiling.enabled else None
+        keys, texts, parents = rows
+        matches = []
+        for position, row_texts in enumerate(texts):
+            if cancelled is not None and not position % 1000 and cancelled():
+                return None
+            matches.append(any(matcher(text) for text in row_texts))
+        hits = [0] * len(keys)
+        for position in range(len(keys) - 1, -1, -1):
+            parent = parents[position]
+            if parent >= 0 and (matches[position] or hits[position]):
+                hits[parent] += 1
+        ancestor_matches = [False] * len(keys)
+        if keep_children:
+            for position, parent in enumerate(parents):
+                if parent >= 0 and (matches[parent] or ancestor_matches[parent]):
+                    ancestor_matches[position] = True
+        state = cls(matcher, keep_children)
+        state.parents = dict(
+            (key, keys[parent] if parent >= 0 else None)
+            for key, parent in zip(keys, parents))
+        for key, match, count, ancestor in zip(keys, matches, hits, ancestor_matches):
+            if match:
+                state.matches.add(key)
+            if count:
+                state.hits[key] = count
+            if ancestor:
+                state.inherited.add(key)
+            if match or count or ancestor:
+                state.accepted.add(key)
+        if start is not None:
+            profiling.add('filter', None, start)
+        return state
+
+    def is_hit(self, key):
+        return key in self.matches or key in self.hits
+
+    def set_match(self, key, match):
+        """Change whether the row matches.
+
+        Return whether an ancestor of the row changed whether it is accepted.
+        """
+        before = self.is_hit(key)
+        if match:
+            self.matches.add(key)
+        else:
+            self.matches.discard(key)
+        after = self.is_hit(key)
+        self._accept(key)
+        changed = False
+        while before != after:
+            key = self.parents[key]
+            if key is None:
+                break
+            before = self.is_hit(key)
+            count = self.hits.get(key, 0) + (1 if after else -1)
+            if count:
+                self.hits[key] = count
+            else:
+                self.hits.pop(key, None)
+            after = self.is_hit(key)
+            changed = self._accept(key) or changed
+        return changed
+
+    def _accept(self, key):
+        """Update whether the row is accepted, return whether that changed."""
+        accepted = self.is_hit(key) or key in self.inherited
+        if accepted == (key in self.accepted):
+            return False
+        if accepted:
+            self.accepted.add(key)
+        else:
+            self.accepted.discard(key)
+        return True
+
+
+class _MatchRunner(QtCore.QRunnable):
+    """Match the collected rows in the thread pool of the proxy."""
+
+    def __init__(self, proxy, generation, rows, matcher, keep_children):
+        super(_MatchRunner, self).__init__()
+        self.proxy = proxy
+        self.generation = generation
+        self.rows = rows
+        self.matcher = matcher
+        self.keep_children = keep_children
+
+    def cancelled(self):
+        return self.proxy.generation != self.generation
+
+    def run(self):
+        accepted = accepted_rows(
+            self.rows, self.matcher, self.keep_children, self.cancelled)
+        if accepted is not None:
+            self.proxy.matched.emit(self.generation, accepted)
+
+
+class AsyncJsonSortFilterProxyModel(JsonSortFilterProxyModel):
+    """Work out the matches in a background thread.
+
+    Changes to the filter are debounced by the delay in milliseconds. The
+    rows of the source are collected in the GUI thread once per source
+    change and matched in a worker thread. Every change starts a new
+    generation, which cancels the runs of the previous ones, and only the
+    result of the latest run is applied, in one batch. The proxy keeps
+    showing the previous result until then.
+    """
+
+    filtered = QtCore.Signal()
+    matched = QtCore.Signal(int, object)
+
+    def __init__(self, parent=None, delay=250):
+        super(AsyncJsonSortFilterProxyModel, self).__init__(parent=parent)
+        self.generation = 0
+        self._rows = None
+        self._rows_filter = None
+        self._accepted = None
+        self._accepted_keep_children = self.keep_children
+        self._dirty = False
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._start)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.matched.connect(self._apply)
+
+    @property
+    def delay(self):
+        return self._timer.interval()
+
+    @delay.setter
+    def delay(self, delay):
+        self._timer.setInterval(delay)
+
+    def is_filtering(self):
+        """Whether a filter change has not been applied yet."""
+        return self._timer.isActive() or self._dirty
+
+    def accept_index(self, index):
+        if not index.isValid():
+            return False
+        if self._accepted_keep_children != self.keep_children:
+            self.invalidate_matches()
+        return self._accepted is None or row_key(index) in self._accepted
+
+    def invalidate_matches(self):
+        """Cancel the current run and start a new one after the delay."""
+        self.generation += 1
+        self._dirty = True
+        self._accepted_keep_children = self.keep_children
+        self._timer.start()
+
+    def setSourceModel(self, model):
+        source = self.sourceModel()
+        if source is not None:
+            for signal in self._source_signals(source):
+                signal.disconnect(self._forget_rows)
+        if model is not None:
+            for signal in self._source_signals(model):
+                signal.connect(self._forget_rows)
+        self._forget_rows()
+        super(AsyncJsonSortFilterProxyModel, self).setSourceModel(model)
+
+    def update_matches(self, top_left, bottom_right):
+        """Collect the rows again and match them in the background."""
+        self._forget_rows()
+        self.invalidate_matches()
+
+    def _forget_rows(self, *args):
+        self._rows = None
+
+    def _start(self):
+        generation = self.generation
+        matcher = self.matcher()
+        if matcher is None or self.sourceModel() is None:
+            self._apply(generation, None)
+            return
+        rows_filter = (self.filterKeyColumn(), self.filterRole())
+        if self._rows is None or self._rows_filter != rows_filter:
+            self._rows = snapshot(self.sourceModel(), *rows_filter)
+            self._rows_filter = rows_filter
+        self.pool.start(_MatchRunner(
+            self, generation, self._rows, matcher, self.keep_children))
+
+    def _apply(self, generation, accepted):
+        if generation != self.generation:
+            return
+        self._accepted = accepted
+        self._dirty = False
+        QtCore.QSortFilterProxyModel.invalidateFilter(self)
+        self.filtered.emit()
@@ -0,0 +1,258 @@
+import six
+from Qt import QtCore
+
+from qt_json_view import paths
+from qt_json_view.datatypes import (
+    brush, match_type, TypeRole, SchemaRole, ListType, PRESENTATION_ROLES)
+from qt_json_view.schema import SchemaIndex
+
+
+class Node(object):
+    """A row of the JsonNodeModel.
+
+    The node only keeps the data needed to serialize the row, all other
+    role data is worked out by the model when the view asks for it.
+    It mimics the parts of the QStandardItem API that the DataTypes use
+    during serialization, so the node itself acts as the key item.
+    """
+
+    __slots__ = (
+        'parent', 'position', 'key', 'value', 'display', 'datatype', 'schema',
+        'children')
+
+    def __init__(self, parent, position, key, value, display, datatype,
+                 schema, children=None):
+        self.parent = parent
+        self.position = position
+        self.key = key
+        self.value = value
+        self.display = display
+        self.datatype = datatype
+        self.schema = schema
+        self.children = children
+
+    def row(self):
+        return self.position
+
+    def rowCount(self):
+        return len(self.children) if self.children else 0
+
+    def child(self, row, column=0):
+        if not self.children or not 0 <= row < len(self.children):
+            return None
+        node = self.children[row]
+        return node if column == 0 else ValueCell(node)
+
+    def data(self, role=QtCore.Qt.DisplayRole):
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return self.key
+        elif role == TypeRole:
+            return self.datatype
+        return None
+
+
+class ValueCell(object):
+    """Stand-in for the value item of a node, created on demand."""
+
+    __slots__ = ('node', )
+
+    def __init__(self, node):
+        self.node = node
+
+    def row(self):
+        return self.node.position
+
+    def data(self, role=QtCore.Qt.DisplayRole):
+        return value_data(self.node, role)
+
+
+def value_data(node, role):
+    """The data of the value column, containers only show their key."""
+    if node.children is not None:
+        return None
+    if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+        return node.display
+    elif role == QtCore.Qt.UserRole:
+        return node.value
+    elif role == TypeRole:
+        return node.datatype
+    elif role == SchemaRole:
+        return node.schema
+    return None
+
+
+class JsonNodeModel(QtCore.QAbstractItemModel):
+    """Represent JSON-serializable data as a compact tree of nodes.
+
+    An alternative to the JsonModel for very large documents. Instead of two
+    QStandardItems per entry, each entry is a single Node and the role data
+    is calculated in data() from the DataType of the node.
+    """
+
+    NON_DEFAULT_COLOR = QtCore.Qt.yellow
+    HEADERS = ['Key', 'Value']
+
+    def __init__(
+            self,
+            parent=None,
+            data=None,
+            editable_keys=False,
+            editable_values=False,
+            schema=None):
+        super(JsonNodeModel, self).__init__(parent)
+        self.data_object = data
+        self.schema = schema
+        self.schema_index = SchemaIndex(schema)
+        self.editable_keys = editable_keys
+        self.editable_values = editable_values
+        self._root = Node(None, -1, None, None, None, None, self.schema_index.root, [])
+        if data is not None:
+            self.init(data, editable_keys, editable_values, schema)
+
+    def init(self, data, editable_keys=False, editable_values=False, schema=None):
+        """Convert the data to nodes and populate the model."""
+        self.beginResetModel()
+        self.data_object = data
+        self.editable_keys = editable_keys
+        self.editable_values = editable_values
+        self.schema = schema or {}
+        self.schema_index = SchemaIndex(self.schema)
+        type_ = match_type(data)
+        self._root = Node(
+            None, -1, None, data, None, type_, self.schema_index.root, [])
+        self._build(self._root, type_.children(data))
+        self.endResetModel()
+
+    def _build(self, parent, items):
+        """Create the child nodes of the parent, depth first without recursion."""
+        child_entry = self.schema_index.child
+        stack = [(parent, items)]
+        while stack:
+            parent, items = stack.pop()
+            children = parent.children
+            for key, value in items:
+                node_schema = child_entry(parent.schema, key)
+                type_ = match_type(value, entry=node_schema)
+                node = Node(parent, len(children), key, value,
+                            type_.display_value(value), type_, node_schema)
+                children.append(node)
+                child_items = type_.children(value)
+                if child_items is not None:
+                    node.children = []
+                    node.display = None
+                    stack.append((node, child_items))
+
+    def serialize(self):
+        """Assemble the model back into a dict or list."""
+        root = self._root
+        type_ = root.datatype
+        data = type_.empty_container()
+        type_.serialize(model=self, item=root, data=data, parent=root)
+        return data
+
+    def key_path(self, index):
+        """The dict keys and list indices leading to the given index."""
+        path = []
+        node = self.node(index)
+        while node.parent is not None:
+            path.append(node.key)
+            node = node.parent
+        return tuple(reversed(path))
+
+    def write_back(self, index):
+        """Patch the value of the given index into the data_object."""
+        path = self.key_path(index)
+        if not path:
+            return
+        node = self.node(index)
+        data = []
+        node.datatype.serialize(model=self, item=node, data=data, parent=node.parent)
+        paths.set_value(self.data_object, path, data[0])
+
+    def write_back_key(self, index, old_key):
+        """Rename the key of the given index in the data_object."""
+        path = self.key_path(index)
+        if path and old_key != path[-1]:
+            paths.rename_key(self.data_object, path[:-1], old_key, path[-1])
+
+    def node(self, index):
+        """The node of the given index, the root node if invalid."""
+        if index.isValid():
+            return index.internalPointer()
+        return self._root
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        node = self.node(parent)
+        if not node.children or not 0 <= row < len(node.children):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index=None):
+        if index is None:
+            return super(JsonNodeModel, self).parent()
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self._root:
+            return QtCore.QModelIndex()
+        return self.createIndex(parent.position, 0, parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self.node(parent).rowCount()
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 2
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        node = index.internalPointer()
+        if index.column() == 0:
+            editable = not isinstance(node.parent.datatype, ListType)
+            return node.datatype.key_flags(self, editable)
+        return node.datatype.value_flags(self, node.schema)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        type_ = node.datatype
+        if index.column() == 0:
+            if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+                return node.key if isinstance(node.key, six.string_types) else str(node.key)
+            elif role == TypeRole:
+                return type_
+            elif role in PRESENTATION_ROLES:
+                return type_.role_data(self, 0, role, node.value, node.schema, index)
+            return None
+
+        if role in PRESENTATION_ROLES:
+            if role == QtCore.Qt.ForegroundRole and node.children is None:
+                default = node.schema.get('default')
+                if default is not None and default != node.display:
+                    return brush(self.NON_DEFAULT_COLOR)
+            return type_.role_data(self, 1, role, node.value, node.schema, index)
+        return value_data(node, role)
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid():
+            return False
+        node = index.internalPointer()
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            if index.column() == 0:
+                node.key = value
+            else:
+                node.display = value
+        elif role == QtCore.Qt.UserRole and index.column() == 1:
+            node.value = value
+        else:
+            return False
+        self.dataChanged.emit(index, index, [role])
+        return True
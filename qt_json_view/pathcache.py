@@ -0,0 +1,112 @@
+import os
+import time
+from collections import OrderedDict
+
+from Qt import QtCore
+
+FILE = 'file'
+DIRECTORY = 'directory'
+MISSING = 'missing'
+
+
+def probe(path):
+    """Find out whether the path is a file, a directory or missing."""
+    if os.path.isfile(path):
+        return FILE
+    elif os.path.isdir(path):
+        return DIRECTORY
+    return MISSING
+
+
+class _Probe(QtCore.QRunnable):
+    """Probe a path in the thread pool and report back to the cache."""
+
+    def __init__(self, cache, path):
+        super(_Probe, self).__init__()
+        self.cache = cache
+        self.path = path
+
+    def run(self):
+        self.cache.probed.emit(self.path, probe(self.path))
+
+
+class PathCache(QtCore.QObject):
+    """Resolve the status of file paths in a thread pool.
+
+    The results are kept for a limited time in a bounded cache, so the model
+    never blocks on the file system while it is built or painted. Indexes
+    waiting for a path are updated through dataChanged once it is resolved.
+    """
+
+    probed = QtCore.Signal(str, str)
+    resolved = QtCore.Signal(str, str)
+
+    def __init__(self, parent=None, max_size=10000, timeout=30.0, max_threads=4):
+        super(PathCache, self).__init__(parent)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._entries = OrderedDict()
+        self._waiting = {}
+        self.probed.connect(self._on_probed)
+
+    def status(self, path):
+        """The cached status of the path, None if it is unknown.
+
+        An expired status is still returned until it is refreshed, so the
+        icons do not disappear while the path is probed again.
+        """
+        entry = self._entries.get(path)
+        return None if entry is None else entry[0]
+
+    def is_expired(self, path):
+        """Whether the status of the path is unknown or older than the timeout."""
+        entry = self._entries.get(path)
+        return entry is None or time.time() - entry[1] > self.timeout
+
+    def request(self, path, index=None):
+        """Probe the path in the background and update the index afterwards."""
+        waiting = self._waiting.get(path)
+        if waiting is None:
+            waiting = self._waiting[path] = []
+            self.pool.start(_Probe(self, path))
+        if index is not None and index.isValid():
+            index = QtCore.QPersistentModelIndex(index)
+            if index not in waiting:
+                waiting.append(index)
+
+    def resolve(self, path):
+        """Return the status of the path, probing it right away if needed."""
+        if self.is_expired(path):
+            self._store(path, probe(path))
+        return self.status(path)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _store(self, path, status):
+        self._entries.pop(path, None)
+        self._entries[path] = (status, time.time())
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _on_probed(self, path, status):
+        self._store(path, status)
+        for index in self._waiting.pop(path, []):
+            if index.isValid():
+                index = QtCore.QModelIndex(index)
+                index.model().dataChanged.emit(
+                    index, index, [QtCore.Qt.DecorationRole])
+        self.resolved.emit(path, status)
+
+
+_path_cache = None
+
+
+def path_cache():
+    """The PathCache shared by all models."""
+    global _path_cache
+    if _path_cache is None:
+        _path_cache = PathCache()
+    return _path_cache
@@ -0,0 +1,67 @@
+"""Address the entries of JSON-serializable data by their key path.
+
+A key path is a tuple of the dict keys and list indices leading from the
+root of the data to an entry.
+"""
+
+
+def get_value(data, path):
+    """Return the value at the given key path."""
+    for key in path:
+        data = data[key]
+    return data
+
+
+def set_value(data, path, value):
+    """Replace the value at the given, non-empty key path."""
+    get_value(data, path[:-1])[path[-1]] = value
+
+
+def rename_key(data, path, old_key, new_key):
+    """Rename a key of the dict at the given key path, keeping the key order."""
+    container = get_value(data, path)
+    items = [(new_key if key == old_key else key, value)
+             for key, value in container.items()]
+    container.clear()
+    container.update(items)
+
+
+def equal(old, new):
+    """Whether the values are equal, arrays compare element-wise."""
+    if type(old) is not type(new):
+        return False
+    if old is new:
+        return True
+    try:
+        return bool(old == new)
+    except ValueError:
+        return False
+
+
+def to_pointer(path):
+    """The JSON pointer of the given key path, like /a/b/3/c."""
+    return ''.join(
+        '/' + str(key).replace('~', '~0').replace('/', '~1') for key in path)
+
+
+def from_pointer(data, pointer):
+    """The key path of the given JSON pointer into the data.
+
+    The leading slash is optional. Tokens addressing list entries are
+    converted to indices, so the data must contain the path, KeyError is
+    raised otherwise.
+    """
+    if not pointer:
+        return ()
+    if pointer.startswith('/'):
+        pointer = pointer[1:]
+    path = []
+    for token in pointer.split('/'):
+        token = token.replace('~1', '/').replace('~0', '~')
+        try:
+            key = token if isinstance(data, dict) else int(token)
+            data = data[key]
+        except (LookupError, TypeError, ValueError):
+            raise KeyError(pointer)
+        path.append(key)
+    return tuple(path)
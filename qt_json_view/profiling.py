@@ -0,0 +1,144 @@
+"""Opt-in counters and timers for the hot paths of the models and the delegate.
+
+The instrumented code only checks the module level `enabled` flag while
+profiling is disabled. Once enabled, these operations are counted and
+timed per DataType class:
+
+    match_type    Finding the DataType of a value.
+    create_item   Creating and inserting the items of one JsonModel row,
+                  without the rows of its children.
+    serialize     Serializing a leaf value of a JsonModel.
+    snapshot      Collecting the rows of the source model for filtering.
+    filter        Matching the collected rows against the filter.
+    paint         Painting an index with the JsonDelegate, keys have no
+                  DataType.
+
+    profiling.enable()
+    view.model().init(data)
+    print(profiling.summary())
+"""
+import threading
+import timeit
+from collections import namedtuple
+
+from Qt import QtCore
+
+#: Checked by the instrumented code before taking any measurement
+enabled = False
+
+clock = timeit.default_timer
+
+Stat = namedtuple('Stat', ['count', 'total', 'max'])
+
+_stats = {}
+_callbacks = []
+_lock = threading.Lock()
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """Forget the measurements taken so far."""
+    with _lock:
+        _stats.clear()
+
+
+def add(operation, datatype, start):
+    """Record the time since the clock() start for the operation.
+
+    Args:
+        datatype (DataType): The DataType the operation is attributed to,
+            None if it has none.
+    """
+    elapsed = clock() - start
+    name = '' if datatype is None else datatype.__class__.__name__
+    key = (operation, name)
+    with _lock:
+        stat = _stats.get(key)
+        if stat is None:
+            _stats[key] = [1, elapsed, elapsed]
+        else:
+            stat[0] += 1
+            stat[1] += elapsed
+            if elapsed > stat[2]:
+                stat[2] = elapsed
+    for callback in _callbacks:
+        callback(operation, name, elapsed)
+
+
+def stats(operation=None):
+    """The {(operation, DataType class name): Stat} measured so far."""
+    with _lock:
+        return dict(
+            (key, Stat(*values)) for key, values in _stats.items()
+            if operation is None or key[0] == operation)
+
+
+def summary():
+    """The measurements as a table, the most expensive first."""
+    lines = ['%-12s %-20s %10s %12s %12s' % (
+        'operation', 'datatype', 'count', 'total ms', 'max ms')]
+    for (operation, name), stat in sorted(
+            stats().items(), key=lambda item: -item[1].total):
+        lines.append('%-12s %-20s %10d %12.3f %12.3f' % (
+            operation, name, stat.count, stat.total * 1000, stat.max * 1000))
+    return '\n'.join(lines)
+
+
+def add_callback(callback):
+    """Call callback(operation, datatype_name, seconds) for every measurement.
+
+    Callbacks are called from the thread that took the measurement.
+    """
+    _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    _callbacks.remove(callback)
+
+
+class measure(object):
+    """Time a block of code as the operation of the DataType, if enabled.
+
+    with profiling.measure('validate', datatype):
+        ...
+    """
+
+    def __init__(self, operation, datatype=None):
+        self.operation = operation
+        self.datatype = datatype
+        self.start = None
+
+    def __enter__(self):
+        self.start = clock() if enabled else None
+        return self
+
+    def __exit__(self, *args):
+        if self.start is not None:
+            add(self.operation, self.datatype, self.start)
+
+
+class Notifier(QtCore.QObject):
+    """Emit every measurement as a Qt signal."""
+
+    measured = QtCore.Signal(str, str, float)
+
+
+_notifier = None
+
+
+def notifier():
+    """The Notifier shared by all listeners, created on first use."""
+    global _notifier
+    if _notifier is None:
+        _notifier = Notifier()
+        add_callback(_notifier.measured.emit)
+    return _notifier
@@ -0,0 +1,62 @@
+import six
+
+PROPERTIES = 'properties'
+ITEMS = 'items'
+
+EMPTY = {}
+
+
+class SchemaIndex(object):
+    """Look up the schema entry of any entry of a document by its key path.
+
+    The schema maps keys to entries. An entry holds the 'type', 'default',
+    'tooltip' and 'editable' settings of a value and the 'properties' of its
+    children. The 'items' entry of a list applies to every element of the
+    list, a top level list uses the 'items' of the schema itself.
+
+    Lookups walk the path once and are cached, so they cost O(depth) and do
+    not depend on the order the entries are created in.
+    """
+
+    def __init__(self, schema=None, cache_size=10000):
+        self.schema = schema or {}
+        self.cache_size = cache_size
+        self.root = {PROPERTIES: self.schema}
+        if isinstance(self.schema.get(ITEMS), dict):
+            self.root[ITEMS] = self.schema[ITEMS]
+        self._cache = {}
+
+    def child(self, entry, key):
+        """The entry of the child with the given key or list index."""
+        if not entry:
+            return EMPTY
+        if isinstance(key, int) and not isinstance(key, bool):
+            items = entry.get(ITEMS)
+            if items is not None:
+                return items
+        properties = entry.get(PROPERTIES)
+        if not properties:
+            return EMPTY
+        child = properties.get(key)
+        if child is None and not isinstance(key, six.string_types):
+            child = properties.get(str(key))
+        return child or EMPTY
+
+    def entry(self, path):
+        """The entry of the given key path, empty if the schema has none."""
+        if not path:
+            return self.root
+        if not self.schema:
+            return EMPTY
+        path = tuple(path)
+        entry = self._cache.get(path)
+        if entry is None:
+            entry = self.root
+            for key in path:
+                entry = self.child(entry, key)
+                if not entry:
+                    break
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[path] = entry
+        return entry
@@ -0,0 +1,217 @@
+"""Show lists of records with the same keys as a table.
+
+The values are stored column by column, numbers in compact arrays, so
+sorting and filtering run over one column at a time. The records
+themselves are kept, edits are written to them.
+"""
+import array
+
+import six
+from Qt import QtCore, QtWidgets
+
+SAMPLE_SIZE = 100
+
+# The array typecodes of homogeneous int and float columns
+_TYPECODES = {int: 'q', float: 'd'}
+
+
+def record_keys(data, sample_size=SAMPLE_SIZE):
+    """The keys of a list of records, None if the data does not look like one.
+
+    Up to sample_size records spread over the list are checked. They have
+    to be dicts with the same keys and only scalar values.
+    """
+    if not isinstance(data, list) or not data:
+        return None
+    step = max(1, len(data) // sample_size)
+    keys = None
+    for record in data[::step] + data[-1:]:
+        if not isinstance(record, dict) or not record:
+            return None
+        if keys is None:
+            keys = list(record)
+            key_set = set(keys)
+        elif len(record) != len(keys) or not key_set.issuperset(record):
+            return None
+        for value in record.values():
+            if isinstance(value, (dict, list)):
+                return None
+    return keys
+
+
+def column_array(values):
+    """The values in an array if they are all ints or all floats."""
+    types = set(type(value) for value in values)
+    if len(types) == 1:
+        typecode = _TYPECODES.get(types.pop())
+        if typecode is not None:
+            try:
+                return array.array(typecode, values)
+            except OverflowError:
+                pass
+    return values
+
+
+class RecordTableModel(QtCore.QAbstractTableModel):
+    """A table with one row per record and one column per key.
+
+    Rows are sorted with sort and filtered with set_filter, both work on
+    the column arrays and keep the original position of the records,
+    which is shown in the vertical header. Records missing a key show
+    None in its column.
+    """
+
+    record_changed = QtCore.Signal(int, object)
+
+    def __init__(self, records, keys=None, editable=False, parent=None):
+        super(RecordTableModel, self).__init__(parent)
+        self.records = records
+        self.keys = keys or record_keys(records) or []
+        self.editable = editable
+        self.columns = [
+            column_array([record.get(key) for record in records])
+            for key in self.keys]
+        self._order = None
+        self._pattern = ''
+        self._filter_column = -1
+        self._column_texts = {}
+        self._rows = list(range(len(records)))
+
+    def record(self, row):
+        """The position of the record shown in the given row."""
+        return self._rows[row]
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.layoutAboutToBeChanged.emit()
+        if column < 0:
+            self._order = None
+        else:
+            values = self.columns[column]
+            reverse = order == QtCore.Qt.DescendingOrder
+            order_ = list(range(len(values)))
+            try:
+                order_.sort(key=values.__getitem__, reverse=reverse)
+            except TypeError:
+                order_.sort(key=lambda record: _sort_key(values[record]), reverse=reverse)
+            self._order = order_
+        self._update_rows()
+        self.layoutChanged.emit()
+
+    def set_filter(self, pattern, column=-1):
+        """Only show the records with a value containing the pattern.
+
+        The pattern is matched case-insensitively against the given column,
+        or against all columns for -1.
+        """
+        self.beginResetModel()
+        self._pattern = pattern.lower()
+        self._filter_column = column
+        self._update_rows()
+        self.endResetModel()
+
+    def _texts(self, column):
+        """The lower case text of the values in the column, kept for filtering."""
+        texts = self._column_texts.get(column)
+        if texts is None:
+            texts = self._column_texts[column] = [
+                _text(value).lower() for value in self.columns[column]]
+        return texts
+
+    def _update_rows(self):
+        order = self._order or range(len(self.records))
+        if not self._pattern:
+            self._rows = list(order)
+            return
+        columns = range(len(self.columns))
+        if self._filter_column >= 0:
+            columns = [self._filter_column]
+        pattern = self._pattern
+        matches = set()
+        for column in columns:
+            matches.update(
+                record for record, text in enumerate(self._texts(column))
+                if pattern in text)
+        self._rows = [record for record in order if record in matches]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.keys)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return _text(self.keys[section])
+        return str(self._rows[section])
+
+    def flags(self, index):
+        flags = QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+        if self.editable:
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            value = self.columns[index.column()][self._rows[index.row()]]
+            return 'None' if value is None else value
+        elif role == QtCore.Qt.UserRole:
+            return self.columns[index.column()][self._rows[index.row()]]
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        """Change the value in the column array and in the record."""
+        if not index.isValid() or role not in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return False
+        column = index.column()
+        record = self._rows[index.row()]
+        values = self.columns[column]
+        try:
+            values[record] = value
+        except TypeError:
+            values = self.columns[column] = list(values)
+            values[record] = value
+        self._column_texts.pop(column, None)
+        key = self.keys[column]
+        self.records[record][key] = value
+        self.dataChanged.emit(index, index, [QtCore.Qt.DisplayRole, QtCore.Qt.EditRole])
+        self.record_changed.emit(record, key)
+        return True
+
+
+class RecordTableWidget(QtWidgets.QWidget):
+    """A sortable table of a RecordTableModel with a filter field."""
+
+    def __init__(self, records, keys=None, editable=False, parent=None):
+        super(RecordTableWidget, self).__init__(parent)
+        self.model = RecordTableModel(records, keys, editable, parent=self)
+        self.filter = QtWidgets.QLineEdit(self)
+        self.filter.setPlaceholderText('Filter')
+        self.filter.textChanged.connect(self.model.set_filter)
+        self.table = QtWidgets.QTableView(self)
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.horizontalHeader().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+        self.table.verticalHeader().setDefaultSectionSize(20)
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.filter)
+        layout.addWidget(self.table)
+
+
+def _text(value):
+    return value if isinstance(value, six.string_types) else str(value)
+
+
+def _sort_key(value):
+    """Sort values of different types by type name, then value."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return ('', value, '')
+    return (type(value).__name__, 0, _text(value))
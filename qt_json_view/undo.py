@@ -0,0 +1,90 @@
+"""Undo commands that store the changes of a JsonModel as deltas.
+
+A command only holds the key path and the values before and after the
+change, never a copy of the document. The JsonModel pushes them onto its
+undo_stack whenever an edit is written back.
+"""
+from Qt import QtWidgets
+
+from qt_json_view.paths import equal
+
+EDIT_ID = 1
+RENAME_ID = 2
+
+
+def _label(path):
+    return '/'.join(str(key) for key in path)
+
+
+class EditCommand(QtWidgets.QUndoCommand):
+    """Replace the value at a key path.
+
+    Consecutive edits of the same value are merged into one command.
+    """
+
+    def __init__(self, model, path, old, new):
+        super(EditCommand, self).__init__('Edit %s' % _label(path))
+        self.model = model
+        self.path = path
+        self.old = old
+        self.new = new
+        # The change is already applied when the command is pushed
+        self._applied = True
+
+    def id(self):
+        return EDIT_ID
+
+    def mergeWith(self, other):
+        if other.model is not self.model or other.path != self.path:
+            return False
+        self.new = other.new
+        if equal(self.old, self.new) and hasattr(self, 'setObsolete'):
+            self.setObsolete(True)
+        return True
+
+    def redo(self):
+        if self._applied:
+            self._applied = False
+            return
+        self.model.apply_value(self.path, self.new)
+
+    def undo(self):
+        self.model.apply_value(self.path, self.old)
+
+
+class RenameCommand(QtWidgets.QUndoCommand):
+    """Rename a key of the dict at a key path.
+
+    Renaming the same key again is merged into one command.
+    """
+
+    def __init__(self, model, path, old_key, new_key):
+        super(RenameCommand, self).__init__(
+            'Rename %s to %s' % (_label(path + (old_key, )), new_key))
+        self.model = model
+        self.path = path
+        self.old_key = old_key
+        self.new_key = new_key
+        self._applied = True
+
+    def id(self):
+        return RENAME_ID
+
+    def mergeWith(self, other):
+        if (other.model is not self.model or other.path != self.path
+                or other.old_key != self.new_key):
+            return False
+        self.new_key = other.new_key
+        if self.old_key == self.new_key and hasattr(self, 'setObsolete'):
+            self.setObsolete(True)
+        return True
+
+    def redo(self):
+        if self._applied:
+            self._applied = False
+            return
+        self.model.apply_key(self.path, self.old_key, self.new_key)
+
+    def undo(self):
+        self.model.apply_key(self.path, self.new_key, self.old_key)
+
@@ -1,13 +1,115 @@
+import time
+from collections import deque
+
 from Qt import QtCore, QtWidgets, QtGui
 
-from qt_json_view import delegate
+from qt_json_view import delegate, model
 from qt_json_view.datatypes import TypeRole
 
 
+class TreeExpander(QtCore.QObject):
+    """Expand the rows of a tree view from the event loop.
+
+    The rows are expanded breadth first in batches that stop once their
+    time budget is used up, so the view stays responsive and can be
+    scrolled while it expands. Expanding stops after limit rows.
+
+    The view lays out its rows once per batch. A batch takes at least as
+    long as the view took for the previous one, so the layouts do not
+    dominate the time it takes to expand large trees.
+    """
+
+    progress = QtCore.Signal(int)
+    finished = QtCore.Signal()
+
+    def __init__(self, view, depth=None, limit=None, batch_time=0.01, parent=None):
+        super(TreeExpander, self).__init__(parent or view)
+        self.view = view
+        self.depth = depth
+        self.limit = limit
+        self.batch_time = batch_time
+        self.expanded = 0
+        self._stepped = None
+        # [parent, depth of its children, next row], None for the root index
+        self._queue = deque()
+        self._timer = QtCore.QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._step)
+
+    def start(self):
+        self._queue.append([None, 0, 0])
+        self._timer.start()
+
+    def is_expanding(self):
+        return self._timer.isActive()
+
+    def cancel(self):
+        """Stop expanding, the rows expanded so far stay expanded."""
+        self._timer.stop()
+        self._queue.clear()
+
+    def _step(self):
+        view = self.view
+        source = view.model()
+        now = time.time()
+        budget = self.batch_time
+        if self._stepped is not None:
+            budget = max(budget, now - self._stepped)
+        deadline = now + budget
+        # Only remember the expanded rows, the view lays them out at once
+        view.scheduleDelayedItemsLayout()
+        queue = self._queue
+        visited = 0
+        while queue:
+            entry = queue[0]
+            parent, depth, row = entry
+            if parent is None:
+                parent = view.rootIndex()
+            elif not parent.isValid():
+                queue.popleft()
+                continue
+            else:
+                parent = QtCore.QModelIndex(parent)
+            rows = source.rowCount(parent)
+            while row < rows:
+                visited += 1
+                if not visited % 64 and time.time() >= deadline:
+                    entry[2] = row
+                    self.progress.emit(self.expanded)
+                    self._stepped = time.time()
+                    return
+                index = source.index(row, 0, parent)
+                row += 1
+                if not source.hasChildren(index):
+                    continue
+                if source.canFetchMore(index):
+                    source.fetchMore(index)
+                if not view.isExpanded(index):
+                    view.expand(index)
+                self.expanded += 1
+                if self.limit is not None and self.expanded >= self.limit:
+                    queue.clear()
+                    break
+                if self.depth is None or depth < self.depth:
+                    queue.append([QtCore.QPersistentModelIndex(index), depth + 1, 0])
+            else:
+                queue.popleft()
+        self.cancel()
+        self.progress.emit(self.expanded)
+        self.finished.emit()
+
+
 class JsonView(QtWidgets.QTreeView):
-    """Tree to display the JsonModel."""
+    """Tree to display the JsonModel.
 
-    def __init__(self, parent=None):
+    In the large document mode all rows have the height of the first one,
+    so the view does not ask the delegate for the size of every row.
+    """
+
+    #: Expanding from the context menu stops after this many rows
+    EXPAND_LIMIT = 100000
+
+    def __init__(self, parent=None, large_document=False):
         super(JsonView, self).__init__(parent=parent)
         self.setMouseTracking(True)
         self.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
@@ -16,16 +118,102 @@ class JsonView(QtWidgets.QTreeView):
         ctrl_c = QtWidgets.QShortcut(
             QtGui.QKeySequence(self.tr("Ctrl+c")), self)
         ctrl_c.activated.connect(self.copy)
+        undo = QtWidgets.QShortcut(QtGui.QKeySequence.Undo, self)
+        undo.activated.connect(self.undo)
+        redo = QtWidgets.QShortcut(QtGui.QKeySequence.Redo, self)
+        redo.activated.connect(self.redo)
         self.clicked.connect(self._on_clicked)
+        self._expander = None
+        self.set_large_document(large_document)
+
+    def set_large_document(self, enabled):
+        """Use uniform row heights, the delegate draws all rows equally high."""
+        self.setUniformRowHeights(enabled)
+
+    def is_large_document(self):
+        return self.uniformRowHeights()
+
+    def expand_to_depth(self, depth, limit=None, batch_time=0.01):
+        """Expand the rows up to the given depth without blocking the view.
+
+        Depth 0 expands the top level rows. Returns the TreeExpander, a
+        running expand is cancelled.
+        """
+        self.cancel_expand()
+        self._expander = TreeExpander(self, depth, limit, batch_time)
+        self._expander.start()
+        return self._expander
+
+    def expand_all(self, limit=None, batch_time=0.01):
+        """Expand all rows, up to limit, without blocking the view."""
+        return self.expand_to_depth(None, limit, batch_time)
+
+    def is_expanding(self):
+        return self._expander is not None and self._expander.is_expanding()
+
+    def cancel_expand(self):
+        if self._expander is not None:
+            self._expander.cancel()
+            self._expander.deleteLater()
+            self._expander = None
+
+    def setModel(self, source_model):
+        self.cancel_expand()
+        previous = self.model()
+        if previous is not None:
+            previous.modelAboutToBeReset.disconnect(self.cancel_expand)
+        super(JsonView, self).setModel(source_model)
+        if source_model is not None:
+            source_model.modelAboutToBeReset.connect(self.cancel_expand)
+
+    def collapseAll(self):
+        self.cancel_expand()
+        super(JsonView, self).collapseAll()
+
+    def source_model(self):
+        """The model behind the proxy models of the view."""
+        source = self.model()
+        while isinstance(source, QtCore.QAbstractProxyModel):
+            source = source.sourceModel()
+        return source
+
+    def undo(self):
+        """Undo the last edit of the JsonModel."""
+        source = self.source_model()
+        if isinstance(source, model.JsonModel):
+            source.undo_stack.undo()
+
+    def redo(self):
+        """Redo the last undone edit of the JsonModel."""
+        source = self.source_model()
+        if isinstance(source, model.JsonModel):
+            source.undo_stack.redo()
+
+    def watch(self, path, interval=500):
+        """Show the JSON file at the given path and follow its changes.
+
+        A JsonModel is created if the view does not show one yet, see
+        JsonModel.watch.
+        """
+        source = self.source_model()
+        if not isinstance(source, model.JsonModel):
+            source = model.JsonModel(parent=self)
+            self.setModel(source)
+        return source.watch(path, interval)
 
     def _menu(self, position):
         """Show the actions of the DataType (if any)."""
         menu = QtWidgets.QMenu()
         actions = self.actions()
 
-        expand_all = QtWidgets.QAction("Expand All", self)
-        expand_all.triggered.connect(self.expandAll)
-        actions.append(expand_all)
+        if self.is_expanding():
+            stop = QtWidgets.QAction("Stop Expanding", self)
+            stop.triggered.connect(self.cancel_expand)
+            actions.append(stop)
+        else:
+            expand_all = QtWidgets.QAction("Expand All", self)
+            expand_all.triggered.connect(lambda: self.expand_all(self.EXPAND_LIMIT))
+            actions.append(expand_all)
         collapse_all = QtWidgets.QAction("Collapse All", self)
         collapse_all.triggered.connect(self.collapseAll)
         actions.append(collapse_all)
@@ -0,0 +1,113 @@
+import json
+import os
+
+from Qt import QtCore
+
+
+class _Parse(QtCore.QRunnable):
+    """Parse the watched file in the thread pool of the watcher."""
+
+    def __init__(self, watcher, generation, path):
+        super(_Parse, self).__init__()
+        self.watcher = watcher
+        self.generation = generation
+        self.path = path
+
+    def run(self):
+        try:
+            with open(self.path, 'rb') as json_file:
+                data = json.loads(json_file.read().decode('utf-8'))
+        except (IOError, OSError, ValueError) as error:
+            self.watcher.parsed.emit(self.generation, error)
+            return
+        self.watcher.parsed.emit(self.generation, data)
+
+
+class JsonFileWatcher(QtCore.QObject):
+    """Keep a JsonModel in sync with a file that is rewritten by other processes.
+
+    Change notifications are coalesced, the file is reloaded at most once
+    per interval in milliseconds. It is parsed in a worker thread and only
+    the differences are applied to the model through JsonModel.update_data,
+    so the view keeps its expanded rows and selection. Files replaced by
+    renaming a new file over them are picked up through their directory.
+    """
+
+    reloaded = QtCore.Signal()
+    failed = QtCore.Signal(str)
+    parsed = QtCore.Signal(int, object)
+
+    def __init__(self, model, path, interval=500, parent=None):
+        super(JsonFileWatcher, self).__init__(parent or model)
+        self.model = model
+        self.path = os.path.abspath(path)
+        self.generation = 0
+        self._parsing = False
+        self._pending = False
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(interval)
+        self._timer.timeout.connect(self.reload)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.parsed.connect(self._apply)
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._changed)
+        self._watcher.directoryChanged.connect(self._changed)
+        self._watcher.addPath(os.path.dirname(self.path))
+        if os.path.exists(self.path):
+            self._watcher.addPath(self.path)
+
+    @property
+    def interval(self):
+        return self._timer.interval()
+
+    @interval.setter
+    def interval(self, interval):
+        self._timer.setInterval(interval)
+
+    def is_reloading(self):
+        """Whether a change has been noticed but not applied yet."""
+        return self._timer.isActive() or self._parsing or self._pending
+
+    def reload(self):
+        """Parse the file in the background and apply it to the model."""
+        if self._parsing:
+            self._pending = True
+            return
+        self._parsing = True
+        self._pending = False
+        self.generation += 1
+        self.pool.start(_Parse(self, self.generation, self.path))
+
+    def stop(self):
+        """Stop watching, a running parse is discarded."""
+        self._timer.stop()
+        self.generation += 1
+        self._parsing = self._pending = False
+        paths = self._watcher.files() + self._watcher.directories()
+        if paths:
+            self._watcher.removePaths(paths)
+
+    def _changed(self, path):
+        # Replacing the file removes it from the watcher, watch the new one
+        if self.path not in self._watcher.files():
+            if not os.path.exists(self.path):
+                return
+            self._watcher.addPath(self.path)
+        elif path != self.path:
+            return
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _apply(self, generation, data):
+        if generation != self.generation:
+            return
+        self._parsing = False
+        if isinstance(data, Exception):
+            self.failed.emit(str(data))
+        else:
+            self.model.update_data(data)
+            self.reloaded.emit()
+        if self._pending and not self._timer.isActive():
+            self._timer.start()
@@ -0,0 +1,243 @@
+import io
+import json
+
+import six
+from Qt import QtCore
+
+from qt_json_view.datatypes import (
+    BUFFERS, BucketType, DictType, ListType, LazyRole, TypeRole)
+
+#: Encoded text is collected up to this many characters before each write
+CHUNK_SIZE = 65536
+
+_CONSTANTS = {None: 'null', True: 'true', False: 'false'}
+
+# The containers whose rows are streamed, other DataTypes serialize themselves
+_STREAMED = (
+    six.get_unbound_function(ListType.serialize),
+    six.get_unbound_function(DictType.serialize),
+)
+
+
+def _default(value):
+    """Encode buffers as lists, like serialize(buffers_as_lists=True)."""
+    if BUFFERS.TYPES and isinstance(value, BUFFERS.TYPES):
+        return BUFFERS.to_list(value)
+    raise TypeError('%r is not JSON serializable' % (value, ))
+
+
+def encoder(indent=None, sort_keys=False):
+    """The JSONEncoder producing the same text as json.dumps."""
+    return json.JSONEncoder(indent=indent, sort_keys=sort_keys, default=_default)
+
+
+def _streamed(type_):
+    return six.get_unbound_function(type(type_).serialize) in _STREAMED
+
+
+class JsonWriter(object):
+    """Encode a JsonModel as JSON text while walking its items.
+
+    The text is the same as json.dumps of JsonModel.serialize(), with
+    buffers converted to lists. The rows of lists and dicts are encoded one
+    by one and other values are added through the serialize method of their
+    DataType, so no copy of the whole document is built. Containers whose
+    children were not added yet are encoded straight from their data.
+    """
+
+    def __init__(self, model, indent=None, sort_keys=False):
+        self.model = model
+        self.encoder = encoder(indent, sort_keys)
+        if indent is not None and not isinstance(indent, six.string_types):
+            indent = ' ' * indent
+        self.indent = indent
+        self.sort_keys = sort_keys
+        if self.encoder.ensure_ascii:
+            self._encode_string = json.encoder.encode_basestring_ascii
+        else:
+            self._encode_string = json.encoder.encode_basestring
+
+    def iterencode(self):
+        """Yield the JSON text in pieces."""
+        root = self.model.invisibleRootItem()
+        type_ = root.data(TypeRole)
+        if isinstance(type_, (ListType, DictType)):
+            return self._container(root, isinstance(type_, DictType), 0)
+        return self.encoder.iterencode(self.model.serialize())
+
+    def dump(self, fp):
+        """Write the JSON text to a text or binary file object."""
+        write(self.iterencode(), fp)
+
+    def _value(self, value, level):
+        scalar = self._scalar(value)
+        if scalar is not None:
+            return (scalar, )
+        chunks = self.encoder.iterencode(value)
+        if not self.indent or not level:
+            return chunks
+        # Strings are escaped, every newline starts a new indented line
+        newline = '\n' + self.indent * level
+        return (chunk.replace('\n', newline) for chunk in chunks)
+
+    def _scalar(self, value):
+        """The text of strings, finite numbers and constants, None otherwise."""
+        if isinstance(value, six.string_types):
+            return self._encode_string(value)
+        if value is None or value is True or value is False:
+            return _CONSTANTS[value]
+        if type(value) in six.integer_types:
+            return int.__repr__(value)
+        if type(value) is float and value - value == 0:
+            return float.__repr__(value)
+        return None
+
+    def _entries(self, item):
+        """The (key, key item, parent item, value) of the rows of a container.
+
+        The rows of buckets are taken from the buckets, the value is the
+        entry itself for buckets whose rows were not added yet.
+        """
+        for row in range(item.rowCount()):
+            child = item.child(row, 0)
+            type_ = child.data(TypeRole)
+            if not isinstance(type_, BucketType):
+                yield child.data(QtCore.Qt.DisplayRole), child, item, None
+                continue
+            pending = child.data(LazyRole)
+            if pending is None:
+                for entry in self._entries(child):
+                    yield entry
+                continue
+            _, container, keys, start, end = pending[0]
+            if keys is None:
+                for value in container[start:end]:
+                    yield None, None, None, value
+            else:
+                for key in keys[start:end]:
+                    yield key, None, None, container[key]
+
+    def _container(self, item, is_dict, level):
+        pending = item.data(LazyRole)
+        if pending is not None:
+            for chunk in self._value(pending[0], level):
+                yield chunk
+            return
+        entries = self._entries(item)
+        if is_dict and self.sort_keys:
+            entries = sorted(entries, key=lambda entry: entry[0])
+        if self.indent is not None:
+            separator = self.encoder.item_separator + '\n' + self.indent * (level + 1)
+        else:
+            separator = self.encoder.item_separator
+        first = True
+        for key, child, parent, value in entries:
+            if first:
+                yield '{' if is_dict else '['
+                if self.indent is not None:
+                    yield '\n' + self.indent * (level + 1)
+                first = False
+            else:
+                yield separator
+            if is_dict:
+                if not isinstance(key, six.string_types):
+                    # Like json, e.g. for the int keys of unexpanded buckets
+                    key = self.encoder.encode(key)
+                yield self._encode_string(key)
+                yield self.encoder.key_separator
+            if child is None:
+                chunks = self._value(value, level + 1)
+            else:
+                chunks = self._row(child, parent, level + 1)
+            for chunk in chunks:
+                yield chunk
+        if first:
+            yield '{}' if is_dict else '[]'
+            return
+        if self.indent is not None:
+            yield '\n' + self.indent * level
+        yield '}' if is_dict else ']'
+
+    def _row(self, child, parent, level):
+        type_ = child.data(TypeRole)
+        if _streamed(type_):
+            return self._container(child, isinstance(type_, DictType), level)
+        data = []
+        type_.serialize(model=self.model, item=child, data=data, parent=parent)
+        return self._value(data[0], level)
+
+
+def write(chunks, fp):
+    """Write the text chunks to the file object in batches of CHUNK_SIZE."""
+    binary = isinstance(fp, (io.RawIOBase, io.BufferedIOBase))
+    batch = []
+    size = 0
+    for chunk in chunks:
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            _write(fp, ''.join(batch), binary)
+            batch = []
+            size = 0
+    if batch:
+        _write(fp, ''.join(batch), binary)
+
+
+def _write(fp, text, binary):
+    if binary:
+        text = text.encode('utf-8')
+    fp.write(text)
+
+
+class _Dump(QtCore.QRunnable):
+    """Encode and write the snapshot in the thread pool of the dumper."""
+
+    def __init__(self, dumper):
+        super(_Dump, self).__init__()
+        self.dumper = dumper
+
+    def run(self):
+        dumper = self.dumper
+        try:
+            chunks = dumper.encoder.iterencode(dumper.snapshot)
+            if isinstance(dumper.target, six.string_types):
+                with open(dumper.target, 'wb') as json_file:
+                    write(chunks, json_file)
+            else:
+                write(chunks, dumper.target)
+        except Exception as error:
+            # Always report back, the dumper would wait forever otherwise
+            dumper.failed.emit(str(error))
+            return
+        dumper.finished.emit()
+
+
+class JsonDumper(QtCore.QObject):
+    """Write a snapshot of a JsonModel as JSON text in a worker thread.
+
+    The snapshot is taken with JsonModel.serialize(buffers_as_lists=True)
+    when the dumper is created, so later edits of the model do not end up
+    in the file. All its lists and dicts are copies, none are shared with
+    the data_object the model keeps changing.
+    """
+
+    finished = QtCore.Signal()
+    failed = QtCore.Signal(str)
+
+    def __init__(self, model, target, indent=None, sort_keys=False, parent=None):
+        super(JsonDumper, self).__init__(parent or model)
+        self.target = target
+        self.snapshot = model.serialize(buffers_as_lists=True)
+        self.encoder = encoder(indent, sort_keys)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+
+    def start(self):
+        self.pool.start(_Dump(self))
+
+    def is_writing(self):
+        return self.pool.activeThreadCount() > 0
+
+    def wait(self, msecs=-1):
+        """Block until the file is written, False if msecs passed first."""
+        return self.pool.waitForDone(msecs)
@@ -1,9 +1,23 @@
+import collections
+import json
 import os
+import re
 import sys
+import tempfile
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
 
+import six
+from Qt import QtCore, QtGui, QtWidgets
 
-from qt_json_view import datatypes, model
+from qt_json_view import (
+    datatypes, delegate, loader, mapmodel, model, nodemodel, pathcache, schema,
+    table, view)
+
+app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'benchmarks'))
+import benchmark
 
 
 def test_none():
@@ -73,6 +87,47 @@ def test_choices():
     assert datatypes.ChoicesType().matches({'value': None, 'choices': ['A', 'B', 'C']})
 
 
+def test_match_type():
+    assert isinstance(datatypes.match_type('http://www.python.com'), datatypes.UrlType)
+    assert isinstance(datatypes.match_type('/some/file/path'), datatypes.FilepathType)
+    assert isinstance(datatypes.match_type('string'), datatypes.StrType)
+    assert isinstance(datatypes.match_type(True), datatypes.BoolType)
+    assert isinstance(datatypes.match_type(1), datatypes.IntType)
+    assert isinstance(datatypes.match_type({'start': 0, 'end': 1, 'step': 1}),
+                      datatypes.RangeType)
+
+    class TestType(datatypes.StrType):
+
+        def matches(self, data):
+            return data == 'TEST'
+
+    test_type = TestType()
+    datatypes.DATA_TYPES.insert(0, test_type)
+    try:
+        assert datatypes.match_type('TEST') is test_type
+        assert datatypes.match_type('TEST2') is not test_type
+    finally:
+        datatypes.DATA_TYPES.remove(test_type)
+    assert datatypes.match_type('TEST') is not test_type
+
+    class FtpType(datatypes.UrlType):
+        REGEX = re.compile(r'(?i)ftp://')
+
+    ftp_type = FtpType()
+    datatypes.DATA_TYPES.insert(0, ftp_type)
+    try:
+        assert datatypes.match_type('FTP://host') is ftp_type
+        assert isinstance(datatypes.match_type('http://www.python.com'), datatypes.UrlType)
+        assert isinstance(datatypes.match_type('string'), datatypes.StrType)
+    finally:
+        datatypes.DATA_TYPES.remove(ftp_type)
+
+    types = list(datatypes.DATA_TYPES)
+    schema = {'a': {'type': TestType}}
+    assert isinstance(datatypes.match_type('b', key='a', schema=schema), TestType)
+    assert datatypes.DATA_TYPES == types
+
+
 DICT_DATA = {
     'none': None,
     'bool': True,
@@ -152,3 +207,938 @@ def test_serialize_model():
     json_model = model.JsonModel(data=LIST_DATA, editable_keys=True, editable_values=True)
     serialized = json_model.serialize()
     assert LIST_DATA == serialized
+
+
+def test_lazy_model():
+    json_model = model.JsonModel(data=DICT_DATA, lazy=True)
+    dict_index = [json_model.index(row, 0) for row in range(json_model.rowCount())
+                  if json_model.index(row, 0).data() == 'dict'][0]
+    assert json_model.rowCount(dict_index) == 0
+    assert json_model.hasChildren(dict_index)
+    assert json_model.canFetchMore(dict_index)
+    serialized = json_model.serialize()
+    assert DICT_DATA == serialized
+    assert serialized['dict'] is not DICT_DATA['dict']
+
+    json_model.fetchMore(dict_index)
+    assert json_model.rowCount(dict_index) == 2
+    assert not json_model.canFetchMore(dict_index)
+    assert DICT_DATA == json_model.serialize()
+
+    json_model = model.JsonModel(data=LIST_DATA, lazy=True)
+    assert LIST_DATA == json_model.serialize()
+
+
+def test_node_model():
+    for data in (DICT_DATA, LIST_DATA):
+        json_model = model.JsonModel(data=data, editable_keys=True, editable_values=True)
+        node_model = nodemodel.JsonNodeModel(
+            data=data, editable_keys=True, editable_values=True)
+        assert data == node_model.serialize()
+        assert json_model.rowCount() == node_model.rowCount()
+        for row in range(json_model.rowCount()):
+            for column in range(2):
+                index = json_model.index(row, column)
+                node_index = node_model.index(row, column)
+                assert index.data() == node_index.data()
+                assert index.data(datatypes.TypeRole) == node_index.data(datatypes.TypeRole)
+                assert index.flags() == node_index.flags()
+            assert (json_model.rowCount(json_model.index(row, 0)) ==
+                    node_model.rowCount(node_model.index(row, 0)))
+
+    node_model = nodemodel.JsonNodeModel(data={'a': {'b': 1}}, editable_values=True)
+    index = node_model.index(0, 1, node_model.index(0, 0))
+    assert index.parent() == node_model.index(0, 0)
+    node_model.setData(index, 2)
+    assert {'a': {'b': 2}} == node_model.serialize()
+
+
+def test_role_data():
+    json_model = model.JsonModel(
+        data=DICT_DATA, schema={'int': {'default': 1, 'tooltip': 'An int'}})
+    keys = [json_model.index(row, 0).data() for row in range(json_model.rowCount())]
+    int_index = json_model.index(keys.index('int'), 1)
+    assert json_model.itemFromIndex(int_index).data(QtCore.Qt.ForegroundRole) is None
+    assert int_index.data(QtCore.Qt.ForegroundRole).color() == QtGui.QColor(
+        json_model.NON_DEFAULT_COLOR)
+    assert int_index.data(QtCore.Qt.ToolTipRole) == 'An int'
+
+    list_index = json_model.index(keys.index('list1'), 1)
+    assert list_index.data(QtCore.Qt.FontRole).italic()
+    assert list_index.data(QtCore.Qt.ToolTipRole) == 'ListType'
+    assert datatypes.brush(QtCore.Qt.white) is datatypes.brush(QtCore.Qt.white)
+
+
+def test_schema_index():
+    point = {'properties': {'x': {'default': 0, 'editable': False}}}
+    index = schema.SchemaIndex({
+        'points': {'items': point},
+        'list': {'properties': {1: {'default': 2}}}})
+    assert index.entry(('points', 3)) is point
+    assert index.entry(('points', 0, 'x')) == {'default': 0, 'editable': False}
+    assert index.entry(('points', 0, 'y')) == {}
+    assert index.entry(('list', 1)) == {'default': 2}
+    assert index.entry(('missing', 0, 'x')) == {}
+
+    data = {'points': [{'x': 1}, {'x': 0}]}
+    for lazy in (False, True):
+        json_model = model.JsonModel(
+            data=data, editable_values=True, schema={'points': {'items': point}}, lazy=lazy)
+        points_index = json_model.index(0, 0)
+        json_model.fetchMore(points_index)
+        first_index = json_model.index(0, 0, points_index)
+        json_model.fetchMore(first_index)
+        x_index = json_model.index(0, 1, first_index)
+        assert x_index.data(datatypes.SchemaRole) == point['properties']['x']
+        assert not x_index.flags() & QtCore.Qt.ItemIsEditable
+
+    node_model = nodemodel.JsonNodeModel(
+        data=data, editable_values=True, schema={'points': {'items': point}})
+    x_index = node_model.index(0, 1, node_model.index(1, 0, node_model.index(0, 0)))
+    assert not x_index.flags() & QtCore.Qt.ItemIsEditable
+
+
+def test_write_back():
+    for model_class in (model.JsonModel, nodemodel.JsonNodeModel):
+        data = [{'a': {'b': 1, 'c': [1, 2]}, 'd': 'e'}]
+        json_model = model_class(data=data, editable_keys=True, editable_values=True)
+        a_index = json_model.index(0, 0, json_model.index(0, 0))
+        c_index = json_model.index(1, 0, a_index)
+        assert json_model.key_path(c_index) == (0, 'a', 'c')
+
+        index = json_model.index(1, 1, c_index)
+        json_model.setData(index, 3, QtCore.Qt.DisplayRole)
+        json_model.write_back(index)
+        assert data == [{'a': {'b': 1, 'c': [1, 3]}, 'd': 'e'}]
+
+        json_delegate = delegate.JsonDelegate()
+        editor = QtWidgets.QLineEdit()
+        editor.setText('x')
+        json_delegate.setModelData(editor, json_model, a_index)
+        assert data == [{'x': {'b': 1, 'c': [1, 3]}, 'd': 'e'}]
+        assert list(data[0].keys()) == ['x', 'd']
+
+
+def test_path_cache():
+    cache = pathcache.path_cache()
+    cache.clear()
+    for model_class in (model.JsonModel, nodemodel.JsonNodeModel):
+        json_model = model_class(data={'file': __file__})
+        index = json_model.index(0, 1)
+        changed = []
+        json_model.dataChanged.connect(lambda *args: changed.append(args))
+        if cache.status(__file__) is None:
+            assert index.data(QtCore.Qt.DecorationRole) is None
+            cache.pool.waitForDone()
+            app.processEvents()
+            assert changed
+        assert cache.status(__file__) == pathcache.FILE
+        assert not index.data(QtCore.Qt.DecorationRole).isNull()
+    assert cache.resolve(os.path.dirname(__file__)) == pathcache.DIRECTORY
+
+    # Expired statuses are served until they are refreshed
+    timeout, cache.timeout = cache.timeout, 0
+    try:
+        assert cache.is_expired(__file__)
+        assert cache.status(__file__) == pathcache.FILE
+        for _ in range(3):
+            cache.request(__file__, index)
+        assert len(cache._waiting[__file__]) == 1
+        cache.pool.waitForDone()
+        app.processEvents()
+        assert not cache._waiting
+    finally:
+        cache.timeout = timeout
+
+    # The context menu does not probe the file system itself
+    cache.clear()
+    json_model = model.JsonModel(data={'file': __file__})
+    index = json_model.index(0, 1)
+    actions = datatypes.FilepathType().actions(index)
+    assert cache.status(__file__) is None
+    assert [action.text() for action in actions][-1] == 'Explore Path ...'
+    cache.pool.waitForDone()
+    app.processEvents()
+    assert cache.status(__file__) == pathcache.FILE
+
+
+def test_filter():
+    json_model = model.JsonModel(data=DICT_DATA)
+    proxy = model.JsonSortFilterProxyModel()
+    proxy.setSourceModel(json_model)
+
+    proxy.setFilterRegExp('another')
+    assert [proxy.index(row, 0).data() for row in range(proxy.rowCount())] == ['dict']
+    dict_index = proxy.index(0, 0)
+    assert proxy.rowCount(dict_index) == 1
+    assert proxy.rowCount(proxy.index(0, 0, dict_index)) == 0
+
+    proxy.keep_children = True
+    proxy.invalidateFilter()
+    assert proxy.rowCount(proxy.index(0, 0, dict_index)) == 1
+
+    proxy.setFilterKeyColumn(1)
+    proxy.setFilterFixedString('www.python')
+    assert sorted(proxy.index(row, 0).data() for row in range(proxy.rowCount())) == [
+        'http', 'https']
+
+    proxy.setFilterFixedString('')
+    assert proxy.rowCount() == json_model.rowCount()
+
+
+def test_filter_data_changed():
+    data = {'a': {'b': 'x', 'c': 'y'}, 'd': 'x'}
+    json_model = model.JsonModel(data=data, editable_values=True)
+    proxy = model.JsonSortFilterProxyModel()
+    proxy.setSourceModel(json_model)
+    proxy.setFilterKeyColumn(1)
+    proxy.setFilterFixedString('z')
+    assert proxy.rowCount() == 0
+    state = proxy._state
+
+    index = json_model.index_for_path('/d', 1)
+    json_model.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
+    key = json_model.index_for_path('/d')
+    json_model.dataChanged.emit(key, key, [QtCore.Qt.DisplayRole])
+    assert proxy._state is state
+
+    json_model.set_values({'/a/c': 'z'})
+    assert proxy._state is state
+    assert [proxy.index(row, 0).data() for row in range(proxy.rowCount())] == ['a']
+    assert proxy.rowCount(proxy.index(0, 0)) == 1
+    json_model.set_values({'/a/c': 'y', '/d': 'z'})
+    assert [proxy.index(row, 0).data() for row in range(proxy.rowCount())] == ['d']
+    assert proxy._state is state
+
+
+def test_filter_rename_keep_children():
+    data = {'g3': {'h0': 1, 'c1': {'g1': 2, 'd2': 3}}, 'x': 0}
+    json_model = model.JsonModel(data=data, editable_keys=True)
+    proxy = model.JsonSortFilterProxyModel()
+    proxy.setSourceModel(json_model)
+    proxy.keep_children = True
+    proxy.setFilterRegExp('a')
+    assert proxy.rowCount() == 0
+
+    json_model.setData(json_model.index_for_path('/g3'), 'ca', QtCore.Qt.DisplayRole)
+    assert [proxy.index(row, 0).data() for row in range(proxy.rowCount())] == ['ca']
+    parent = proxy.index(0, 0)
+    assert sorted(proxy.index(row, 0, parent).data()
+                  for row in range(proxy.rowCount(parent))) == ['c1', 'h0']
+    c1 = [proxy.index(row, 0, parent) for row in range(proxy.rowCount(parent))
+          if proxy.index(row, 0, parent).data() == 'c1'][0]
+    assert proxy.rowCount(c1) == 2
+
+
+def test_async_filter():
+    json_model = model.JsonModel(data=DICT_DATA)
+    proxy = model.AsyncJsonSortFilterProxyModel(delay=0)
+    proxy.setSourceModel(json_model)
+    assert proxy.rowCount() == json_model.rowCount()
+
+    proxy.setFilterFixedString('anoth')
+    proxy.setFilterFixedString('another')
+    assert proxy.is_filtering()
+    while proxy.is_filtering():
+        proxy.pool.waitForDone()
+        app.processEvents()
+    assert [proxy.index(row, 0).data() for row in range(proxy.rowCount())] == ['dict']
+
+
+def test_load():
+    path = os.path.join(tempfile.mkdtemp(), 'data.json')
+    with open(path, 'w') as json_file:
+        json.dump(DICT_DATA, json_file, indent=2)
+    stream = loader.JsonStream(path, chunk_size=5)
+    assert stream.container() == {}
+    assert dict(stream) == DICT_DATA
+    stream.close()
+
+    json_model = model.JsonModel()
+    json_loader = json_model.load(path, chunk_size=7, batch_time=0)
+    assert json_model.rowCount() == 0
+    while json_loader.is_loading():
+        app.processEvents()
+    assert json_model.rowCount() == len(DICT_DATA)
+    assert json_model.serialize() == DICT_DATA
+    assert json_model.data_object == DICT_DATA
+
+    json_loader = json_model.load(
+        six.StringIO(json.dumps(list(range(10)))), bucket_size=4)
+    while json_loader.is_loading():
+        app.processEvents()
+    assert json_model.bucket_size == 4
+    assert json_model.rowCount() == 3
+    assert json_model.serialize() == list(range(10))
+
+    failures = []
+    json_loader = json_model.load(six.StringIO('[1, 2 3]'))
+    json_loader.failed.connect(failures.append)
+    while json_loader.is_loading():
+        app.processEvents()
+    assert len(failures) == 1
+    assert json_model.serialize() == [1, 2]
+
+
+def test_map_model():
+    path = os.path.join(tempfile.mkdtemp(), 'data.json')
+    with open(path, 'w') as json_file:
+        json.dump(DICT_DATA, json_file, indent=2)
+    map_model = mapmodel.JsonMapModel(path=path, batch_size=2)
+    assert map_model.serialize() == DICT_DATA
+    while map_model.canFetchMore(QtCore.QModelIndex()):
+        map_model.fetchMore(QtCore.QModelIndex())
+    keys = [map_model.index(row, 0).data() for row in range(map_model.rowCount())]
+    assert keys == list(DICT_DATA)
+
+    row = keys.index('range')
+    assert isinstance(map_model.index(row, 0).data(datatypes.TypeRole), datatypes.RangeType)
+    assert map_model.index(row, 1).data(QtCore.Qt.UserRole) == DICT_DATA['range']
+    assert not map_model.hasChildren(map_model.index(row, 0))
+
+    list_index = map_model.index(keys.index('list1'), 0)
+    assert map_model.hasChildren(list_index)
+    assert map_model.rowCount(list_index) == 0
+    map_model.fetchMore(list_index)
+    assert map_model.rowCount(list_index) == 2
+    assert map_model.key_path(map_model.index(1, 0, list_index)) == ('list1', 1)
+
+    # A failed open keeps the previous document
+    broken = os.path.join(os.path.dirname(path), 'broken.json')
+    with open(broken, 'w') as json_file:
+        json_file.write('{"a": 1 "b": 2}')
+    for bad_path in (broken, path + '.missing'):
+        try:
+            map_model.open(bad_path)
+        except (IOError, OSError, ValueError):
+            pass
+        else:
+            assert False
+        assert map_model.serialize() == DICT_DATA
+    map_model.close()
+
+    class BigListType(datatypes.ListType):
+        pass
+
+    with open(path, 'w') as json_file:
+        json.dump({'big': list(range(mapmodel.SMALL_CONTAINER))}, json_file)
+    map_model = mapmodel.JsonMapModel(path=path, schema={'big': {'type': BigListType}})
+    assert isinstance(map_model.index(0, 0).data(datatypes.TypeRole), BigListType)
+    map_model.close()
+
+
+def test_modified():
+    schema = {'a': {'default': 1}, 'b': {'properties': {'c': {'default': 'x'}}}}
+    json_model = model.JsonModel(
+        data={'a': 1, 'b': {'c': 'y', 'd': 2}}, schema=schema, editable_values=True)
+    assert json_model.modified_paths() == [('b', 'c')]
+    counts = []
+    json_model.modified_changed.connect(counts.append)
+
+    proxy = model.JsonSortFilterProxyModel()
+    proxy.setSourceModel(json_model)
+    proxy.modified_only = True
+    proxy.invalidateFilter()
+    assert proxy.rowCount() == 1
+    assert proxy.rowCount(proxy.index(0, 0)) == 1
+
+    a_index = json_model.index(0, 1)
+    json_model.setData(a_index, 2)
+    assert json_model.is_modified(a_index)
+    assert a_index.data(QtCore.Qt.ForegroundRole).color() == QtGui.QColor(
+        json_model.NON_DEFAULT_COLOR)
+    assert counts == [2]
+    assert proxy.rowCount() == 2
+
+    c_index = json_model.index(0, 1, json_model.index(1, 0))
+    json_model.setData(c_index, 'x')
+    assert json_model.modified_paths() == [('a', )]
+    assert proxy.rowCount() == 1
+
+    json_model.removeRow(0)
+    assert json_model.modified_count() == 0
+    assert counts == [2, 1, 0]
+
+
+def test_update_data():
+    data = {'a': 1, 'b': {'c': [1, 2], 'd': 'x'}, 'e': None}
+    json_model = model.JsonModel(data=data, schema={'a': {'default': 1}})
+    tree_view = view.JsonView()
+    tree_view.setModel(json_model)
+    tree_view.expandAll()
+    signals = []
+    for name in ('rowsInserted', 'rowsRemoved', 'dataChanged', 'modelReset'):
+        getattr(json_model, name).connect(lambda *args, name=name: signals.append(name))
+
+    json_model.update_data({'a': 1, 'b': {'c': [1, 2], 'd': 'x'}, 'e': None})
+    assert signals == []
+
+    new_data = {'a': 2, 'b': {'c': [1, 2, 3], 'd': 5}, 'f': True}
+    json_model.update_data(new_data)
+    assert json_model.serialize() == new_data
+    assert json_model.data_object is new_data
+    assert json_model.modified_paths() == [('a', )]
+    assert 'modelReset' not in signals
+    assert tree_view.isExpanded(json_model.index(1, 0))
+
+    json_model.update_data([1])
+    assert json_model.serialize() == [1]
+    assert 'modelReset' in signals
+
+
+def test_watch():
+    path = os.path.join(tempfile.mkdtemp(), 'data.json')
+    with open(path, 'w') as json_file:
+        json.dump({'a': 1, 'b': [1, 2]}, json_file)
+    tree_view = view.JsonView()
+    file_watcher = tree_view.watch(path, interval=0)
+    json_model = tree_view.model()
+
+    def wait():
+        timer = QtCore.QElapsedTimer()
+        timer.start()
+        while file_watcher.is_reloading() and timer.elapsed() < 5000:
+            file_watcher.pool.waitForDone()
+            app.processEvents()
+
+    wait()
+    assert json_model.serialize() == {'a': 1, 'b': [1, 2]}
+    tree_view.expandAll()
+
+    reloads = []
+    file_watcher.reloaded.connect(lambda: reloads.append(True))
+    with open(path, 'w') as json_file:
+        json.dump({'a': 2, 'b': [1, 2]}, json_file)
+    file_watcher.reload()
+    file_watcher.reload()
+    wait()
+    assert json_model.serialize() == {'a': 2, 'b': [1, 2]}
+    assert tree_view.isExpanded(json_model.index(1, 0))
+    assert len(reloads) == 2
+    file_watcher.stop()
+
+
+def test_benchmark():
+    results = benchmark.run_benchmarks(sizes=[40], repeat=1)
+    assert len(results) == len(benchmark.DOCUMENTS) * len(benchmark.OPERATIONS)
+    assert all(result['time'] > 0 for result in results.values())
+
+    baseline = {'build/wide/40': {'time': 0.0001, 'memory': 10}}
+    assert benchmark.compare({'build/wide/40': {'time': 0.1, 'memory': 10}}, baseline)
+    assert not benchmark.compare({'build/wide/40': {'time': 0.001, 'memory': 10}}, baseline)
+    assert not benchmark.compare({'paint/wide/40': {'time': 1.0, 'memory': 10}}, baseline)
+
+
+def test_profiling():
+    from qt_json_view import profiling
+    data = {'a': 1, 'b': [True, 'text'], 'c': {'start': 0, 'end': 1, 'step': 1}}
+    json_model = model.JsonModel()
+    json_model.init(data)
+    assert not profiling.stats()
+
+    measured = []
+
+    def on_measured(operation, name, elapsed):
+        measured.append((operation, name))
+
+    profiling.notifier().measured.connect(on_measured)
+    profiling.enable()
+    try:
+        json_model.init(data)
+        json_model.serialize()
+        proxy = model.JsonSortFilterProxyModel()
+        proxy.setSourceModel(json_model)
+        proxy.setFilterFixedString('text')
+        proxy.rowCount()
+        image = QtGui.QImage(200, 20, QtGui.QImage.Format_ARGB32)
+        painter = QtGui.QPainter(image)
+        option = QtWidgets.QStyleOptionViewItem()
+        option.rect = QtCore.QRect(0, 0, 200, 20)
+        delegate.JsonDelegate().paint(painter, option, json_model.index(0, 1))
+        painter.end()
+    finally:
+        profiling.disable()
+        profiling.notifier().measured.disconnect(on_measured)
+
+    stats = profiling.stats()
+    assert stats[('match_type', 'IntType')].count == 1
+    assert stats[('match_type', 'RangeType')].count == 1
+    assert stats[('create_item', 'ListType')].count == 1
+    assert stats[('serialize', 'BoolType')].count == 1
+    assert ('serialize', 'ListType') not in stats
+    assert stats[('filter', '')].count == 1
+    assert stats[('paint', 'IntType')].count == 1
+    assert set(profiling.stats('paint')) == set([('paint', 'IntType')])
+    assert 'match_type' in profiling.summary()
+    assert ('paint', 'IntType') in measured
+
+    json_model.init(data)
+    assert profiling.stats() == stats
+    profiling.reset()
+    assert not profiling.stats()
+
+    node_model = nodemodel.JsonNodeModel(data=data, editable_values=True)
+    profiling.enable()
+    try:
+        assert node_model.serialize() == data
+        list_index = node_model.index(1, 0)
+        node_model.setData(node_model.index(0, 1, list_index), False)
+        node_model.write_back(list_index)
+    finally:
+        profiling.disable()
+        profiling.reset()
+    assert node_model.data_object['b'] == [False, 'text']
+
+
+def test_paint_cache():
+    json_model = model.JsonModel()
+    json_model.init([{'start': 0, 'end': 10, 'step': 1}, True, 'text'], editable_values=True)
+    json_delegate = delegate.JsonDelegate()
+
+    def paint(index, cache=True):
+        image = QtGui.QImage(300, 20, QtGui.QImage.Format_ARGB32_Premultiplied)
+        image.fill(QtCore.Qt.white)
+        painter = QtGui.QPainter(image)
+        option = QtWidgets.QStyleOptionViewItem()
+        option.rect = QtCore.QRect(0, 0, 300, 20)
+        option.state = QtWidgets.QStyle.State_Enabled
+        if cache:
+            json_delegate.paint(painter, option, index)
+        else:
+            index.data(datatypes.TypeRole).paint(json_delegate, painter, option, index)
+        painter.end()
+        return image
+
+    for row in range(2):
+        index = json_model.index(row, 1)
+        assert paint(index) == paint(index, cache=False)
+        paint(index)
+    paint(json_model.index(2, 1))
+    assert len(json_delegate._pixmaps) == 2
+
+    json_model.setData(json_model.index(1, 1), False, QtCore.Qt.DisplayRole)
+    assert paint(json_model.index(1, 1)) == paint(json_model.index(1, 1), cache=False)
+    assert len(json_delegate._pixmaps) == 3
+
+    json_delegate.cache_limit = 1
+    paint(json_model.index(0, 1))
+    assert len(json_delegate._pixmaps) == 1
+    json_delegate.clear_cache()
+    assert not json_delegate._pixmaps
+
+
+def test_expand():
+    data = {'a': [{'b': [1, 2]}, {'c': {'d': 1}}], 'e': {'f': [3]}}
+    json_model = model.JsonModel()
+    json_model.init(data)
+    tree_view = view.JsonView(large_document=True)
+    tree_view.setModel(json_model)
+    assert tree_view.uniformRowHeights()
+
+    def wait():
+        timer = QtCore.QElapsedTimer()
+        timer.start()
+        while tree_view.is_expanding() and timer.elapsed() < 5000:
+            app.processEvents()
+
+    def expanded(parent=QtCore.QModelIndex()):
+        rows = []
+        for row in range(json_model.rowCount(parent)):
+            index = json_model.index(row, 0, parent)
+            if tree_view.isExpanded(index):
+                rows.append(json_model.key_path(index))
+            rows.extend(expanded(index))
+        return rows
+
+    tree_view.expand_to_depth(1)
+    wait()
+    assert sorted(expanded()) == [('a', ), ('a', 0), ('a', 1), ('e', ), ('e', 'f')]
+
+    tree_view.collapseAll()
+    expander = tree_view.expand_all(batch_time=0)
+    finished = []
+    expander.finished.connect(lambda: finished.append(True))
+    wait()
+    assert finished and expander.expanded == 7
+    assert len(expanded()) == 7
+
+    tree_view.collapseAll()
+    tree_view.expand_all(limit=2)
+    wait()
+    assert expanded() == [('a', ), ('e', )]
+
+    tree_view.collapseAll()
+    tree_view.expand_all()
+    json_model.init({'x': {'y': 1}})
+    assert not tree_view.is_expanding()
+
+
+def test_buckets():
+    data = {'list': list(range(250)), 'dict': dict(('k%04d' % i, i) for i in range(150))}
+    schema = {'list': {'items': {'default': 0}}}
+    json_model = model.JsonModel()
+    json_model.init(data, editable_values=True, schema=schema, bucket_size=10)
+    assert json_model.serialize() == data
+
+    list_index = json_model.index(0, 0)
+    if json_model.key_path(list_index) != ('list', ):
+        list_index = json_model.index(1, 0)
+    json_model.fetchMore(list_index)
+    assert json_model.rowCount(list_index) == 3
+    assert json_model.index(2, 0, list_index).data() == u'[200 \u2026 249]'
+    bucket = json_model.index(1, 0, list_index)
+    assert bucket.data() == u'[100 \u2026 199]'
+    json_model.fetchMore(bucket)
+    assert json_model.rowCount(bucket) == 10
+    bucket = json_model.index(3, 0, bucket)
+    assert bucket.data() == u'[130 \u2026 139]'
+    json_model.fetchMore(bucket)
+    key = json_model.index(5, 0, bucket)
+    assert key.data() == '135'
+    assert json_model.key_path(key) == ('list', 135)
+    assert json_model.key_path(bucket) == ('list', )
+    value = json_model.index(5, 1, bucket)
+    assert value.data(datatypes.SchemaRole) == {'default': 0}
+    json_model.setData(value, 0, QtCore.Qt.DisplayRole)
+    json_model.write_back(value)
+    assert data['list'][135] == 0
+    assert sorted(json_model.modified_paths()) == [
+        ('list', i) for i in range(130, 140) if i != 135]
+    assert json_model.serialize() == data
+
+    dict_index = json_model.index(1 - list_index.row(), 0)
+    json_model.fetchMore(dict_index)
+    assert json_model.index(1, 0, dict_index).data() == u'[k0100 \u2026 k0149]'
+    bucket = json_model.index(0, 0, dict_index)
+    json_model.fetchMore(bucket)
+    bucket = json_model.index(1, 0, bucket)
+    assert bucket.data() == u'[k0010 \u2026 k0019]'
+    json_model.fetchMore(bucket)
+    assert json_model.key_path(json_model.index(2, 0, bucket)) == ('dict', 'k0012')
+
+    new_data = {'list': list(range(50)), 'dict': data['dict']}
+    json_model.update_data(new_data)
+    assert json_model.rowCount(list_index) == 5
+    assert json_model.serialize() == new_data
+
+
+def test_buffers():
+    import array
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    values = array.array('d', [float(i) for i in range(2500)])
+    data = {'array': values, 'bytes': b'\x01\x02\x03', 'text': 'a'}
+    if numpy is not None:
+        data['matrix'] = numpy.arange(6, dtype='int32').reshape(2, 3)
+    json_model = model.JsonModel()
+    json_model.init(data, editable_values=True)
+    rows = dict(
+        (json_model.index(row, 0).data(), row) for row in range(json_model.rowCount()))
+
+    value = json_model.index(rows['array'], 1)
+    assert value.data() == 'array(d) (2500) min 0 max 2499 mean 1249.5'
+    assert json_model.index(rows['bytes'], 1).data() == 'bytes (3) min 1 max 3 mean 2'
+    serialized = json_model.serialize()
+    assert serialized['array'] is values
+    assert json_model.serialize(buffers_as_lists=True)['bytes'] == [1, 2, 3]
+
+    key = json_model.index(rows['array'], 0)
+    assert json_model.rowCount(key) == 0 and json_model.canFetchMore(key)
+    json_model.fetchMore(key)
+    assert json_model.rowCount(key) == 3
+    bucket = json_model.index(1, 0, key)
+    json_model.fetchMore(bucket)
+    element = json_model.index(7, 1, bucket)
+    assert element.data() == 1007.0
+    assert json_model.key_path(element) == ('array', 1007)
+    json_model.setData(element, 5.5, QtCore.Qt.DisplayRole)
+    json_model.write_back(element)
+    assert values[1007] == 5.5
+
+    key = json_model.index(rows['bytes'], 0)
+    json_model.fetchMore(key)
+    assert not json_model.index(0, 1, key).flags() & QtCore.Qt.ItemIsEditable
+
+    if numpy is not None:
+        assert json_model.index(rows['matrix'], 1).data() == (
+            'int32 (2, 3) min 0 max 5 mean 2.5')
+        key = json_model.index(rows['matrix'], 0)
+        json_model.fetchMore(key)
+        row = json_model.index(1, 0, key)
+        json_model.fetchMore(row)
+        assert json_model.index(2, 1, row).data() == 5
+        assert json_model.serialize(buffers_as_lists=True)['matrix'] == [[0, 1, 2], [3, 4, 5]]
+
+        # 0-d buffers have no elements, rows of 2-d memoryviews are read-only
+        view_data = {'scalar': memoryview(numpy.array(5.0)),
+                     'grid': memoryview(numpy.arange(4.0).reshape(2, 2))}
+        view_model = model.JsonModel()
+        view_model.init(view_data, editable_values=True)
+        rows = dict((view_model.index(row, 0).data(), row) for row in range(2))
+        assert not view_model.hasChildren(view_model.index(rows['scalar'], 0))
+        key = view_model.index(rows['grid'], 0)
+        view_model.fetchMore(key)
+        row = view_model.index(1, 0, key)
+        view_model.fetchMore(row)
+        assert view_model.index(1, 1, row).data() == 3.0
+        assert not view_model.index(1, 1, row).flags() & QtCore.Qt.ItemIsEditable
+
+    json_model.update_data(dict(data, array=array.array('i', [1])))
+    assert json_model.serialize()['array'] == array.array('i', [1])
+
+
+def test_records():
+    records = [
+        {'name': 'job %d' % i, 'priority': i % 3, 'load': i * 0.5, 'done': i % 2 == 0}
+        for i in range(10)]
+    assert table.record_keys(records) == ['name', 'priority', 'load', 'done']
+    assert table.record_keys([{'a': 1}, {'b': 1}]) is None
+    assert table.record_keys([{'a': [1]}, {'a': [2]}]) is None
+
+    table_model = table.RecordTableModel(records, editable=True)
+    assert table_model.columns[1].typecode == 'q'
+    assert table_model.columns[2].typecode == 'd'
+    assert table_model.rowCount() == 10 and table_model.columnCount() == 4
+    table_model.sort(1, QtCore.Qt.DescendingOrder)
+    assert [table_model.record(row) for row in range(3)] == [2, 5, 8]
+    table_model.set_filter('job 1')
+    assert table_model.rowCount() == 1 and table_model.record(0) == 1
+    table_model.set_filter('')
+    table_model.sort(-1)
+    index = table_model.index(3, 1)
+    assert table_model.setData(index, 'high')
+    assert records[3]['priority'] == 'high'
+    assert table_model.index(3, 1).data() == 'high'
+
+    datatypes.DATA_TYPES.insert(0, datatypes.RecordListType())
+    try:
+        json_model = model.JsonModel(data={'jobs': records, 'other': [1, 2]})
+        jobs = json_model.index(0, 0)
+        assert isinstance(jobs.data(datatypes.TypeRole), datatypes.RecordListType)
+        assert not json_model.hasChildren(jobs)
+        assert json_model.index(0, 1).data() == '10 records: name, priority, load, done'
+        assert json_model.serialize()['jobs'] == records
+        widget = jobs.data(datatypes.TypeRole).show_table(jobs)
+        widget.model.setData(widget.model.index(0, 0), 'renamed')
+        assert json_model.serialize()['jobs'][0]['name'] == 'renamed'
+        widget.close()
+    finally:
+        datatypes.DATA_TYPES.pop(0)
+
+
+def test_dump():
+    import io
+    data = collections.OrderedDict([
+        ('none', None), ('text', u'line\n"quoted" \xe9'), ('int', 1), ('float', 2.5),
+        ('bool', True), ('range', {'start': 0, 'end': 3, 'step': 1}),
+        ('choice', {'value': 'A', 'choices': ['A', 'B']}),
+        ('empty', []), ('nested', [{'a': [1, {'b': None}]}, [[]], {}]),
+        ('long', list(range(25))),
+    ])
+    for options in ({}, {'lazy': True}, {'bucket_size': 10}):
+        json_model = model.JsonModel()
+        json_model.init(data, editable_values=True, **options)
+        key = json_model.index(json_model.rowCount() - 1, 0)
+        json_model.fetchMore(key)
+        json_model.fetchMore(json_model.index(1, 0, key))
+        for indent, sort_keys in ((None, False), (2, True)):
+            expected = json.dumps(
+                json_model.serialize(), indent=indent, sort_keys=sort_keys)
+            text = io.StringIO()
+            json_model.dump(text, indent=indent, sort_keys=sort_keys)
+            assert text.getvalue() == expected
+            binary = io.BytesIO()
+            dumper = json_model.dump(
+                binary, indent=indent, sort_keys=sort_keys, threaded=True)
+            dumper.wait()
+            assert binary.getvalue().decode('utf-8') == expected
+            assert dumper.snapshot['range'] is not data['range']
+            assert dumper.snapshot['nested'][0] is not data['nested'][0]
+
+
+def test_undo():
+    data = collections.OrderedDict([
+        ('a', 1), ('b', True), ('range', {'start': 0, 'end': 3, 'step': 1}),
+        ('long', list(range(25)))])
+    json_model = model.JsonModel(undo_limit=3)
+    json_model.init(data, editable_keys=True, editable_values=True, bucket_size=10)
+    stack = json_model.undo_stack
+    index = json_model.index(0, 1)
+    json_model.setData(index, 2, QtCore.Qt.DisplayRole)
+    json_model.write_back(index)
+    json_model.setData(index, 3, QtCore.Qt.DisplayRole)
+    json_model.write_back(index)
+    assert stack.count() == 1
+    stack.undo()
+    assert data['a'] == 1
+    assert index.data() == 1
+    stack.redo()
+    assert data['a'] == 3
+    assert json_model.serialize() == data
+
+    range_index = json_model.index(2, 1)
+    datatypes.RangeType().reset(range_index)
+    assert data['range'] == {'start': 0, 'end': 1, 'step': 1}
+    stack.undo()
+    assert data['range'] == {'start': 0, 'end': 3, 'step': 1}
+    assert range_index.data(QtCore.Qt.UserRole) == data['range']
+
+    long_index = json_model.index(3, 0)
+    json_model.fetchMore(long_index)
+    bucket = json_model.index(1, 0, long_index)
+    json_model.fetchMore(bucket)
+    value = json_model.index(4, 1, bucket)
+    json_model.setData(value, 0, QtCore.Qt.DisplayRole)
+    json_model.write_back(value)
+    stack.undo()
+    assert data['long'][14] == 14
+    assert value.data() == 14
+
+    json_delegate = delegate.JsonDelegate()
+    editor = QtWidgets.QLineEdit()
+    editor.setText('x')
+    json_delegate.setModelData(editor, json_model, json_model.index(0, 0))
+    assert list(data) == ['x', 'b', 'range', 'long']
+    stack.undo()
+    assert list(data) == ['a', 'b', 'range', 'long']
+    assert json_model.index(0, 0).data() == 'a'
+    stack.redo()
+    assert json_model.index(0, 0).data() == 'x'
+
+    json_model.setData(json_model.index(1, 1), False, QtCore.Qt.DisplayRole)
+    json_model.write_back(json_model.index(1, 1))
+    assert stack.count() == 3
+    json_model.setData(value, 0, QtCore.Qt.DisplayRole)
+    json_model.write_back(value)
+    assert stack.count() == 3
+    for _ in range(3):
+        stack.undo()
+    assert data['b'] is True
+    assert list(data) == ['a', 'b', 'range', 'long']
+    assert not stack.canUndo()
+    assert data['a'] == 3
+
+
+def test_path_index():
+    data = collections.OrderedDict([
+        ('a', {'b': [0, 1, 2, {'c': 'x'}]}), ('d/e', 1), ('long', list(range(25)))])
+    json_model = model.JsonModel()
+    json_model.init(data, editable_keys=True, editable_values=True, bucket_size=10)
+    index = json_model.index_for_path('/a/b/3/c')
+    assert index.data() == 'c'
+    assert json_model.index_for_path(('a', 'b', 3, 'c'), 1).data() == 'x'
+    assert json_model.index_for_path('a/b/3/c') == index
+    assert json_model.path_of(index) == '/a/b/3/c'
+    assert json_model.path_of(json_model.index_for_path('/d~1e')) == '/d~1e'
+    assert json_model.value_at('/a/b/3') == {'c': 'x'}
+    assert not json_model.index_for_path('/a/b/4').isValid()
+    assert not json_model.index_for_path('/missing').isValid()
+    assert not json_model.index_for_path('/d~1e/0').isValid()
+    assert not json_model.index_for_path('/a/b/x').isValid()
+    assert not json_model.index_for_path(('a', 'b', 4)).isValid()
+    try:
+        json_model.value_at('/a/b/4')
+    except KeyError:
+        pass
+    else:
+        assert False
+
+    json_model.set_value_at('/a/b/3/c', 'y')
+    assert data['a']['b'][3]['c'] == 'y'
+    assert index.sibling(index.row(), 1).data() == 'y'
+    assert not json_model.undo_stack.count()
+
+    assert not json_model.index_for_path('/long/14').isValid()
+    long_index = json_model.index_for_path('/long')
+    json_model.fetchMore(long_index)
+    json_model.fetchMore(json_model.index(1, 0, long_index))
+    json_model.set_value_at(('long', 14), -1)
+    assert json_model.index_for_path(('long', 14), 1).data() == -1
+    assert json_model.key_path(json_model.index_for_path(('long', 14))) == ('long', 14)
+
+    json_delegate = delegate.JsonDelegate()
+    editor = QtWidgets.QLineEdit()
+    editor.setText('z')
+    json_delegate.setModelData(editor, json_model, json_model.index_for_path('/a'))
+    assert not json_model.index_for_path('/a/b/3/c').isValid()
+    assert json_model.index_for_path('/z/b/3/c', 1).data() == 'y'
+
+    new_data = collections.OrderedDict([
+        ('z', {'b': [-1, 0, 1, 2, {'c': 'w'}]}), ('long', [])])
+    json_model.update_data(new_data)
+    assert json_model.index_for_path('/z/b/4/c', 1).data() == 'w'
+    assert json_model.value_at('/z/b/0') == -1
+    assert not json_model.index_for_path('/d~1e').isValid()
+
+    # The index follows shifted list rows and new dict rows
+    c_item = json_model.itemFromIndex(json_model.index_for_path('/z/b/4/c'))
+    b_item = json_model.itemFromIndex(json_model.index_for_path('/z/b'))
+    b_item.removeRow(0)
+    assert json_model._path_items[('z', 'b', 3, 'c')] is c_item
+    datatypes.ListType().insert_child(json_model, 0, 0, -2, b_item)
+    datatypes.ListType().insert_child(json_model, 0, 0, -3, b_item)
+    assert json_model._path_items[('z', 'b', 5, 'c')] is c_item
+    assert ('z', 'b', 3, 'c') not in json_model._path_items
+    z_item = json_model.itemFromIndex(json_model.index_for_path('/z'))
+    datatypes.DictType().insert_child(json_model, 1, 'n', 1, z_item)
+    assert json_model._path_items[('z', 'n')] is z_item.child(1, 0)
+
+
+def test_batch_update():
+    import threading
+    data = {'values': list(range(10)), 'other': {'a': 1, 'b': [1]}}
+    json_model = model.JsonModel(data=data, editable_values=True)
+    signals = []
+    json_model.dataChanged.connect(
+        lambda top_left, bottom_right, roles=(): signals.append(
+            (json_model.key_path(top_left), json_model.key_path(bottom_right))))
+    json_model.set_values([
+        (('values', 1), -1), (('values', 2), -2), ('/values/3', -3),
+        ('/values/7', -7), ('/other/a', 2), ('/other/b', [1, 2])])
+    assert data == {'values': [0, -1, -2, -3, 4, 5, 6, -7, 8, 9],
+                    'other': {'a': 2, 'b': [1, 2]}}
+    assert json_model.serialize() == data
+    assert sorted(signals[:3]) == [
+        (('other', 'a'), ('other', 'a')), (('values', 1), ('values', 3)),
+        (('values', 7), ('values', 7))]
+    assert json_model.index_for_path('/other/b/1', 1).data() == 2
+
+    # Nothing is changed if a path does not exist
+    try:
+        json_model.set_values([('/values/0', 10), ('/missing/0', 1)])
+    except KeyError:
+        pass
+    else:
+        assert False
+    assert data['values'][0] == 0
+
+    # Values that change their DataType replace their rows
+    json_model.set_values([
+        ('/other/b', 'text'), ('/other/a', {'c': [3]}), ('/values', {'x': 1})])
+    assert data['other'] == {'a': {'c': [3]}, 'b': 'text'}
+    assert data['values'] == {'x': 1}
+    assert json_model.serialize() == json_model.data_object
+    assert json_model.index_for_path('/other/a/c/0', 1).data() == 3
+    json_model.set_values([('/values', list(range(10)))])
+
+    updater = json_model.batch_updater(interval=10)
+    applied = []
+    updater.applied.connect(applied.append)
+
+    def feed():
+        for i in range(100):
+            updater.put(('values', i % 10), i)
+
+    thread = threading.Thread(target=feed)
+    thread.start()
+    thread.join()
+    assert updater.is_pending()
+    timer = QtCore.QElapsedTimer()
+    timer.start()
+    while updater.is_pending() and timer.elapsed() < 5000:
+        app.processEvents()
+    assert applied == [10]
+    assert data['values'] == list(range(90, 100))
+    assert json_model.index_for_path('/values/9', 1).data() == 99